@@ -13,6 +13,24 @@ bl_info = {
 
 if 'bpy' in locals():
     import importlib
+    if 'glr_format' in locals():
+        importlib.reload(glr_format)
+    if 'scan_glr' in locals():
+        importlib.reload(scan_glr)
+    if 'texture_atlas' in locals():
+        importlib.reload(texture_atlas)
+    if 'texture_cache' in locals():
+        importlib.reload(texture_cache)
+    if 'texture_proxy' in locals():
+        importlib.reload(texture_proxy)
+    if 'memory_budget' in locals():
+        importlib.reload(memory_budget)
+    if 'spatial_index' in locals():
+        importlib.reload(spatial_index)
+    if 'material_library' in locals():
+        importlib.reload(material_library)
+    if 'mesh_lod' in locals():
+        importlib.reload(mesh_lod)
     if 'import_glr' in locals():
         importlib.reload(import_glr)
 
@@ -21,8 +39,8 @@ from math import radians
 import bpy
 import bmesh
 from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty, FloatProperty, BoolVectorProperty, FloatVectorProperty, CollectionProperty
-from bpy.types import Panel, Operator, OperatorFileListElement
+from bpy.props import StringProperty, BoolProperty, EnumProperty, FloatProperty, IntProperty, BoolVectorProperty, FloatVectorProperty, CollectionProperty
+from bpy.types import Panel, Operator, OperatorFileListElement, PropertyGroup, UIList
 
 class GLR_OT_FilterHelper_TextureList(Operator):
     '''Generates a list of selected materials in edit mode'''
@@ -30,6 +48,7 @@ class GLR_OT_FilterHelper_TextureList(Operator):
     bl_label = 'Generate Texture Filter List'
 
     def search_polygons_for_textures(self, context):
+        from .texture_atlas import ATLAS_TEXTURES_PROP
         obj = context.active_object
         obj_mesh = obj.data
         cached_mats = ''
@@ -41,14 +60,18 @@ class GLR_OT_FilterHelper_TextureList(Operator):
                 mat = obj.material_slots[obj_mat_idx].material
                 mat_ntn = mat.node_tree.nodes
                 mat_txt_img_node_idx = mat_ntn.find('Texture 0')
-                mat_txt_img_name = 'NO_TEXTURE'
-                if mat_txt_img_node_idx != -1:
-                    mat_txt_img_name = mat_ntn[mat_txt_img_node_idx].image.name[:-4]
-                if mat_txt_img_name not in cached_mats:
-                    if len(cached_mats) == 0:
-                        cached_mats += mat_txt_img_name
-                    else:
-                        cached_mats += (',' + mat_txt_img_name)
+                mat_txt_img_names = ['NO_TEXTURE']
+                if ATLAS_TEXTURES_PROP in mat:
+                    # Atlases list the textures packed on them
+                    mat_txt_img_names = list(mat[ATLAS_TEXTURES_PROP])
+                elif mat_txt_img_node_idx != -1:
+                    mat_txt_img_names = [mat_ntn[mat_txt_img_node_idx].image.name[:-4]]
+                for mat_txt_img_name in mat_txt_img_names:
+                    if mat_txt_img_name not in cached_mats:
+                        if len(cached_mats) == 0:
+                            cached_mats += mat_txt_img_name
+                        else:
+                            cached_mats += (',' + mat_txt_img_name)
         if cached_mats == '':
             self.report({'ERROR'}, 'No faces selected')
             return
@@ -70,6 +93,203 @@ class GLR_OT_FilterHelper_TextureList(Operator):
         self.search_polygons_for_textures(context)
         return {'FINISHED'}
 
+def update_filter_list_from_usage(self, context):
+    # Rewrites the filter list from the checked texture usage entries,
+    # keeping any typed-in textures that aren't part of the scan
+    operator = context.space_data.active_operator
+    scanned = {item.crc for item in operator.texture_usage}
+    names = [name for name in operator.filter_list.split(',') if name and name not in scanned]
+    names += [item.crc for item in operator.texture_usage if item.checked]
+    operator.filter_list = ','.join(names)
+
+class GLR_TextureUsageItem(PropertyGroup):
+    crc: StringProperty()
+    tex0_tris: IntProperty()
+    tex1_tris: IntProperty()
+    has_bbox: BoolProperty()
+    bbox_size: FloatVectorProperty(subtype='XYZ')
+    checked: BoolProperty(
+        description='Add this texture to the filter list',
+        update=update_filter_list_from_usage
+    )
+
+class GLR_UL_texture_usage(UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        row = layout.row(align=True)
+        row.prop(item, 'checked', text=item.crc)
+        row.label(text=f'{item.tex0_tris:,} tris')
+        if item.has_bbox:
+            size = item.bbox_size
+            row.label(text=f'{size[0]:.0f} x {size[1]:.0f} x {size[2]:.0f}')
+
+class GLR_OT_ScanTextures(Operator):
+    '''Counts the triangles using each texture in the selected capture, without importing it'''
+    bl_idname = 'import_glr.scan_textures'
+    bl_label = 'Scan Textures'
+    bl_options = {'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        return (
+            sfile is not None and sfile.type == 'FILE_BROWSER' and
+            sfile.active_operator is not None and
+            sfile.active_operator.bl_idname == 'IMPORT_SCENE_OT_glr'
+        )
+
+    def execute(self, context):
+        from . import scan_glr
+        from .glr_format import is_glr_filename
+        sfile = context.space_data
+        operator = sfile.active_operator
+        filename = sfile.params.filename
+        if not is_glr_filename(filename):
+            self.report({'ERROR'}, 'Select a .glr capture to scan')
+            return {'CANCELLED'}
+        filepath = os.path.join(os.fsdecode(sfile.params.directory), filename)
+        try:
+            usage = scan_glr.scan_textures(filepath, bboxes=operator.texture_scan_bboxes)
+        except (OSError, RuntimeError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        filtered = set(operator.filter_list.split(','))
+        operator.texture_usage.clear()
+        for tex in usage:
+            if tex['tex0_tris'] == 0:
+                continue  # only used as texture 1, which isn't filtered
+            item = operator.texture_usage.add()
+            item.crc = scan_glr.get_filter_name(tex['crc'])
+            item.tex0_tris = tex['tex0_tris']
+            item.tex1_tris = tex['tex1_tris']
+            if tex['bbox_min'] is not None:
+                item.has_bbox = True
+                item.bbox_size = [hi - lo for lo, hi in zip(tex['bbox_min'], tex['bbox_max'])]
+            # Set directly, we don't want the update callback per item
+            item['checked'] = item.crc in filtered
+        self.report({'INFO'}, f'{len(operator.texture_usage)} textures in {filename}')
+        return {'FINISHED'}
+
+class GLR_OT_CatalogueSelect(Operator):
+    '''Selects this capture in the file browser'''
+    bl_idname = 'import_glr.catalogue_select'
+    bl_label = 'Select Capture'
+    bl_options = {'INTERNAL'}
+
+    filename: StringProperty()
+
+    @classmethod
+    def poll(cls, context):
+        return context.space_data is not None and context.space_data.type == 'FILE_BROWSER'
+
+    def execute(self, context):
+        context.space_data.params.filename = self.filename
+        return {'FINISHED'}
+
+class GLR_OT_CatalogueRefresh(Operator):
+    '''Scans the captures in the current folder again'''
+    bl_idname = 'import_glr.catalogue_refresh'
+    bl_label = 'Refresh Captures'
+    bl_options = {'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.space_data is not None and context.space_data.type == 'FILE_BROWSER'
+
+    def execute(self, context):
+        from . import scan_glr
+        scan_glr.get_directory_catalogue(os.fsdecode(context.space_data.params.directory), refresh=True)
+        return {'FINISHED'}
+
+class GLR_OT_ToggleTextureProxies(Operator):
+    '''Switches imported textures between their downscaled proxies and the full resolution images'''
+    bl_idname = 'import_glr.toggle_texture_proxies'
+    bl_label = 'Toggle Texture Proxies'
+    bl_options = {'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        from . import texture_proxy
+        return len(texture_proxy.get_proxied_images()) != 0
+
+    def execute(self, context):
+        from . import texture_proxy
+        images = texture_proxy.get_proxied_images()
+        # Go to full resolution if any image is on its proxy
+        enable = not any(image.filepath == image[texture_proxy.PROXY_PROP] for image in images)
+        texture_proxy.use_proxies(images, enable)
+        self.report({'INFO'}, f'{len(images)} textures switched to {"proxies" if enable else "full resolution"}')
+        return {'FINISHED'}
+
+class GLR_OT_SetLOD(Operator):
+    '''Shows a level of detail made at import on the selected objects'''
+    bl_idname = 'import_glr.set_lod'
+    bl_label = 'Set Level of Detail'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    level: IntProperty(
+        name='Level',
+        description='0 is full detail',
+        min=0,
+        max=4,
+        default=0
+    )
+
+    @classmethod
+    def poll(cls, context):
+        from .mesh_lod import LOD_MESHES_PROP
+        return any(LOD_MESHES_PROP in ob for ob in context.selected_objects)
+
+    def execute(self, context):
+        from .mesh_lod import LOD_LEVEL_PROP, LOD_MESHES_PROP
+        for ob in context.selected_objects:
+            names = ob.get(LOD_MESHES_PROP)
+            if not names:
+                continue
+            level = min(self.level, len(names) - 1)
+            mesh = bpy.data.meshes.get(names[level])
+            if mesh is None:
+                self.report({'WARNING'}, f'{ob.name}: mesh {names[level]} is missing')
+                continue
+            ob.data = mesh
+            ob[LOD_LEVEL_PROP] = level
+        return {'FINISHED'}
+
+class GLR_OT_RealizeMaterials(Operator):
+    '''Builds the full node setup of placeholder materials from a deferred import'''
+    bl_idname = 'import_glr.realize_materials'
+    bl_label = 'Build Deferred Materials'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    scope: EnumProperty(
+        name='Materials',
+        items=(
+            ('SELECTED', 'Selected Objects', 'The materials of the selected objects'),
+            ('ACTIVE', 'Active Material', 'The active material of the active object'),
+            ('ALL', 'All', 'Every placeholder material'),
+        ),
+        default='SELECTED'
+    )
+
+    def execute(self, context):
+        from . import import_glr
+        if self.scope == 'ALL':
+            materials = import_glr.get_placeholder_materials()
+        elif self.scope == 'ACTIVE':
+            ob = context.active_object
+            materials = [ob.active_material] if ob is not None and ob.active_material else []
+        else:
+            materials = {
+                slot.material
+                for ob in context.selected_objects
+                for slot in ob.material_slots
+                if slot.material is not None
+            }
+        count = sum(import_glr.realize_material(mat) for mat in materials)
+        import_glr.get_material_registry().save_library()
+        self.report({'INFO'}, f'Built {count} materials')
+        return {'FINISHED'}
+
 class GLR_OT_ImportGLR(Operator, ImportHelper):
     '''Import a GLR file'''
     bl_idname = 'import_scene.glr'
@@ -79,7 +299,7 @@ class GLR_OT_ImportGLR(Operator, ImportHelper):
     filename_ext = '.glr'
 
     filter_glob: StringProperty(
-        default='*.glr',
+        default='*.glr;*.glr.gz;*.glr.xz;*.glr.bz2',
         options={'HIDDEN'},
         maxlen=255
     )
@@ -107,12 +327,98 @@ class GLR_OT_ImportGLR(Operator, ImportHelper):
         default=(1.0, 1.0, 1.0)
     )
 
+    preview: BoolProperty(
+        name='Preview',
+        description='Quickly import only a sample of the triangles, without merging doubles and with flat viewport colors instead of full materials. A later full import of the capture replaces the preview',
+        default=False
+    )
+
+    preview_tris: IntProperty(
+        name='Triangles',
+        description='Maximum number of triangles to import in preview mode',
+        min=1,
+        default=50000
+    )
+
+    preview_sampling: EnumProperty(
+        name='Sampling',
+        items=(
+            ('STRIDE', 'Strided', 'Evenly spaced triangles from the whole capture'),
+            ('RANDOM', 'Random', 'Randomly picked triangles'),
+            ('LARGEST', 'Largest', 'The triangles with the largest area'),
+        ),
+        default='STRIDE'
+    )
+
+    lod_levels: IntProperty(
+        name='LOD Levels',
+        description='Also make this many reduced levels of detail of every object, by vertex clustering per material. Switch between them with Set Level of Detail',
+        min=0,
+        max=4,
+        default=0
+    )
+
+    lod_resolution: IntProperty(
+        name='LOD Resolution',
+        description='Grid cells along the longest side of an object for the first level of detail, halved for each further level',
+        min=4,
+        soft_max=4096,
+        default=256
+    )
+
+    region_mode: EnumProperty(
+        name='Region',
+        description='Only import the triangles overlapping a region, using a spatial index cached next to the capture',
+        items=(
+            ('NONE', 'Everything', 'Import the whole capture'),
+            ('BOX', 'Box', 'Import the triangles overlapping a box (in capture coordinates)'),
+            ('CURSOR', '3D Cursor', 'Import the triangles within a radius of the 3D cursor'),
+        ),
+        default='NONE'
+    )
+
+    region_min: FloatVectorProperty(
+        name='Region Min',
+        subtype='XYZ',
+        default=(-1000.0, -1000.0, -1000.0)
+    )
+
+    region_max: FloatVectorProperty(
+        name='Region Max',
+        subtype='XYZ',
+        default=(1000.0, 1000.0, 1000.0)
+    )
+
+    region_radius: FloatProperty(
+        name='Radius',
+        min=0.0,
+        default=1000.0
+    )
+
     merge_doubles: BoolProperty(
         name='Merge Triangles',
         description='Remove vertice doubles after import',
         default=True
     )
 
+    merge_captures: BoolProperty(
+        name='Merge Captures',
+        description='Import all selected captures into a single object, keeping triangles repeated across captures only once',
+        default=False
+    )
+
+    sort_triangles: BoolProperty(
+        name='Sort Triangles',
+        description='Order the faces by material, then by position along a space-filling curve, for faster drawing, editing and merging. The original order is kept in the Capture Order face attribute',
+        default=False
+    )
+
+    replace_existing: BoolProperty(
+        name='Replace Existing',
+        description='Overwrite the mesh of an earlier import of the capture (or of the same ROM) in place, keeping its transform, parent and modifiers and reusing its materials and images',
+        default=False
+    )
+
     merge_distance: FloatProperty(
         name='dist',
         description='Distance to merge doubles by',
@@ -123,6 +429,15 @@ class GLR_OT_ImportGLR(Operator, ImportHelper):
         default=0.001
     )
 
+    memory_budget: IntProperty(
+        name='Memory Budget (MB)',
+        description='Split large imports into several objects to keep the estimated peak memory under this budget, and report the measured peak afterwards. 0 disables the budget',
+        min=0,
+        soft_max=65536,
+        step=256,
+        default=0
+    )
+
     enable_srgb: BoolProperty(
         name='Modify Color Management',
         description='Modifies scene color management options to use sRGB',
@@ -141,6 +456,87 @@ class GLR_OT_ImportGLR(Operator, ImportHelper):
         default=False
     )
 
+    cull_degenerate: BoolProperty(
+        name='Cull Degenerate Triangles',
+        description='Remove zero-area and non-finite triangles before the mesh is built, making a full mesh validation unnecessary',
+        default=True
+    )
+
+    cull_bbox: BoolProperty(
+        name='Cull Outside Bounds',
+        description='Remove triangles lying entirely outside of a bounding box (in imported mesh coordinates)',
+        default=False
+    )
+
+    cull_bbox_min: FloatVectorProperty(
+        name='Bounds Min',
+        subtype='XYZ',
+        default=(-10000.0, -10000.0, -10000.0)
+    )
+
+    cull_bbox_max: FloatVectorProperty(
+        name='Bounds Max',
+        subtype='XYZ',
+        default=(10000.0, 10000.0, 10000.0)
+    )
+
+    material_setup: EnumProperty(
+        name='Materials',
+        description='When to build the full RDP combiner/blender node setup of the materials',
+        items=(
+            ('FULL', 'Full', 'Build every material during the import'),
+            ('DEFERRED', 'Deferred', 'Import with placeholder materials showing only texture 0, build the full materials with Build Deferred Materials'),
+            ('BACKGROUND', 'Background', 'Import with placeholder materials, and build the full materials a few at a time after the import'),
+        ),
+        default='FULL'
+    )
+
+    material_library: StringProperty(
+        name='Material Library',
+        description='A .blend file of prebuilt materials. Materials found in it are appended instead of built, and new ones are added to it after the import',
+        subtype='FILE_PATH',
+        default=''
+    )
+
+    dedup_textures: BoolProperty(
+        name='Merge Identical Textures',
+        description='Textures with different CRCs but identical pixels share one image (and material). Pixel hashes are cached next to the textures',
+        default=False
+    )
+
+    texture_max_size: IntProperty(
+        name='Max Texture Size',
+        description='Load textures larger than this (in pixels) as downscaled proxies, saved in a \'proxy\' folder next to the textures. 0 disables the limit',
+        min=0,
+        soft_max=4096,
+        default=0
+    )
+
+    texture_memory_budget: IntProperty(
+        name='Texture Budget (MB)',
+        description='Downscale the largest textures to proxies until all textures of the import fit in this much memory. 0 disables the budget',
+        min=0,
+        soft_max=8192,
+        step=64,
+        default=0
+    )
+
+    use_texture_atlas: BoolProperty(
+        name='Texture Atlases',
+        description='Pack the textures of clamped, single texture materials into atlases, merging their materials. Atlases are saved in an \'atlas\' folder next to the textures',
+        default=False
+    )
+
+    atlas_size: EnumProperty(
+        name='Atlas Size',
+        items=(
+            ('1024', '1024', ''),
+            ('2048', '2048', ''),
+            ('4096', '4096', ''),
+        ),
+        default='2048'
+    )
+
     gen_light_color_attribute: BoolProperty(
         name='Generate \'Lighting\' Color Attribute',
         description='Generate a color attribute which contains all combined lighting colors influencing triangles',
@@ -153,6 +549,12 @@ class GLR_OT_ImportGLR(Operator, ImportHelper):
         default=False
     )
 
+    byte_colors: BoolProperty(
+        name='Byte Colors',
+        description='Store the color layers as 8-bit per channel (BYTE_COLOR) corner attributes, converting the colors while decoding. Blender 3.4+ makes them color attributes, older versions vertex color layers',
+        default=False
+    )
+
     filter_mode: BoolProperty(
         name='Blacklist',
         description='Blacklist or whitelist mode for chosen filtered textures',
@@ -164,10 +566,51 @@ class GLR_OT_ImportGLR(Operator, ImportHelper):
         description='Textures to filter'
     )
 
+    texture_usage: CollectionProperty(
+        type=GLR_TextureUsageItem,
+        options={'SKIP_SAVE'}
+    )
+
+    texture_usage_index: IntProperty(
+        options={'HIDDEN', 'SKIP_SAVE'}
+    )
+
+    texture_scan_bboxes: BoolProperty(
+        name='Bounding Boxes',
+        description='Also compute the size of the area covered by each texture (reads vertex positions, slower)',
+        default=False
+    )
+
+    catalogue_sort: EnumProperty(
+        name='Sort By',
+        items=(
+            ('NAME', 'Name', 'Sort captures by file name'),
+            ('GAME', 'Game', 'Sort captures by ROM name'),
+            ('TRIS', 'Triangles', 'Sort captures by triangle count, largest first'),
+        ),
+        default='NAME'
+    )
+
+    catalogue_game: StringProperty(
+        name='Game',
+        description='Only list captures whose ROM name contains this text'
+    )
+
+    catalogue_min_tris: IntProperty(
+        name='Min Triangles',
+        description='Only list captures with at least this many triangles',
+        min=0,
+        default=0
+    )
+
     def execute(self, context):
         from . import import_glr
-        keywords = self.as_keywords(ignore=('filter_glob',))
-        return import_glr.load(context, **keywords)
+        keywords = self.as_keywords(ignore=(
+            'filter_glob',
+            'texture_usage', 'texture_usage_index', 'texture_scan_bboxes',
+            'catalogue_sort', 'catalogue_game', 'catalogue_min_tris',
+        ))
+        return import_glr.load(self, context, **keywords)
 
     def draw(self, context):
         pass
@@ -214,12 +657,44 @@ class GLR_PT_scene(Panel):
         layout = self.layout
         sfile = context.space_data
         operator = sfile.active_operator
+        layout.prop(operator, 'preview')
+        if operator.preview:
+            row = layout.row()
+            row.prop(operator, 'preview_tris')
+            row.prop(operator, 'preview_sampling', text='')
+        row = layout.row()
+        row.prop(operator, 'lod_levels')
+        row.prop(operator, 'lod_resolution')
+        layout.prop(operator, 'region_mode')
+        if operator.region_mode == 'BOX':
+            layout.prop(operator, 'region_min')
+            layout.prop(operator, 'region_max')
+        elif operator.region_mode == 'CURSOR':
+            layout.prop(operator, 'region_radius')
         row = layout.row()
         row.prop(operator, 'merge_doubles')
         row.prop(operator, 'merge_distance')
+        layout.prop(operator, 'merge_captures')
+        layout.prop(operator, 'sort_triangles')
+        layout.prop(operator, 'replace_existing')
+        layout.prop(operator, 'memory_budget')
         layout.prop(operator, 'enable_srgb')
         layout.prop(operator, 'enable_mat_transparency')
         layout.prop(operator, 'enable_bf_culling')
+        layout.prop(operator, 'dedup_textures')
+        row = layout.row()
+        row.prop(operator, 'texture_max_size')
+        row.prop(operator, 'texture_memory_budget')
+        layout.prop(operator, 'material_setup')
+        layout.prop(operator, 'material_library')
+        row = layout.row()
+        row.prop(operator, 'use_texture_atlas')
+        row.prop(operator, 'atlas_size', text='')
+        layout.prop(operator, 'cull_degenerate')
+        layout.prop(operator, 'cull_bbox')
+        if operator.cull_bbox:
+            layout.prop(operator, 'cull_bbox_min')
+            layout.prop(operator, 'cull_bbox_max')
 
 class GLR_PT_colors(Panel):
     bl_space_type = 'FILE_BROWSER'
@@ -239,6 +714,61 @@ class GLR_PT_colors(Panel):
         operator = sfile.active_operator
         layout.prop(operator, 'gen_light_color_attribute')
         layout.prop(operator, 'gen_overlay_color_attribute')
+        layout.prop(operator, 'byte_colors')
+
+class GLR_PT_catalogue(Panel):
+    bl_space_type = 'FILE_BROWSER'
+    bl_region_type = 'TOOL_PROPS'
+    bl_label = 'Captures'
+    bl_parent_id = 'FILE_PT_operator'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+        return operator.bl_idname == 'IMPORT_SCENE_OT_glr'
+
+    def draw(self, context):
+        from . import scan_glr
+        layout = self.layout
+        sfile = context.space_data
+        operator = sfile.active_operator
+        layout.prop(operator, 'catalogue_game', icon='VIEWZOOM')
+        row = layout.row()
+        row.prop(operator, 'catalogue_sort', text='')
+        row.prop(operator, 'catalogue_min_tris', text='Min')
+        row.operator(GLR_OT_CatalogueRefresh.bl_idname, text='', icon='FILE_REFRESH')
+
+        entries = scan_glr.get_directory_catalogue(os.fsdecode(sfile.params.directory))
+        entries = scan_glr.sort_catalogue(
+            entries,
+            sort_by=operator.catalogue_sort,
+            game=operator.catalogue_game,
+            min_tris=operator.catalogue_min_tris,
+        )
+        if not entries:
+            layout.label(text='No captures found')
+            return
+
+        col = layout.column(align=True)
+        for entry in entries:
+            row = col.row(align=True)
+            broken = entry['truncated'] or entry['error']
+            op = row.operator(
+                GLR_OT_CatalogueSelect.bl_idname,
+                text=entry['name'],
+                icon='ERROR' if broken else 'FILE_3D',
+                emboss=False,
+            )
+            op.filename = entry['name']
+            if entry['error']:
+                row.label(text=entry['error'])
+            elif entry['truncated']:
+                row.label(text='Truncated')
+            else:
+                row.label(text=entry['romname'])
+                row.label(text=f'{entry["num_tris"]:,} tris')
 
 class GLR_PT_filter(Panel):
     bl_space_type = 'FILE_BROWSER'
@@ -259,17 +789,36 @@ class GLR_PT_filter(Panel):
         row = layout.row()
         row.prop(operator, 'filter_mode')
         layout.prop(operator, 'filter_list', icon='TEXTURE')
+        row = layout.row()
+        row.operator(GLR_OT_ScanTextures.bl_idname, icon='VIEWZOOM')
+        row.prop(operator, 'texture_scan_bboxes')
+        if len(operator.texture_usage) != 0:
+            layout.template_list(
+                'GLR_UL_texture_usage', '',
+                operator, 'texture_usage',
+                operator, 'texture_usage_index',
+                rows=8,
+            )
 
 def menu_func_import(self, context):
     self.layout.operator(GLR_OT_ImportGLR.bl_idname, text='GLideN64 Rip (.glr)')
 
 CLASSES = (
     GLR_OT_FilterHelper_TextureList,
+    GLR_TextureUsageItem,
+    GLR_UL_texture_usage,
+    GLR_OT_ScanTextures,
+    GLR_OT_CatalogueSelect,
+    GLR_OT_CatalogueRefresh,
+    GLR_OT_ToggleTextureProxies,
+    GLR_OT_SetLOD,
+    GLR_OT_RealizeMaterials,
     GLR_OT_ImportGLR,
     GLR_PT_transform,
     GLR_PT_scene,
-   #GLR_PT_colors, #TODO: Implement correctly
-    GLR_PT_filter
+    GLR_PT_colors,
+    GLR_PT_filter,
+    GLR_PT_catalogue,
 )
 
 def register():
@@ -0,0 +1,223 @@
+import os
+import struct
+import gzip
+import lzma
+import bz2
+import queue
+import threading
+import numpy as np
+
+# Layout of the records in a version 2 glr file. The header is 36 bytes
+# and is followed by num_tris fixed size triangle records.
+GLR_HEADER_SIZE = 36
+
+GLR_VERTEX_DTYPE = np.dtype([
+    ('position', '<f4', 3),
+    ('color', '<f4', 4),
+    ('uv0', '<f4', 2),
+    ('uv1', '<f4', 2),
+])
+
+GLR_TRIANGLE_DTYPE = np.dtype([
+    ('verts', GLR_VERTEX_DTYPE, 3),
+    ('fog_color', '<f4', 4),
+    ('blend_color', '<f4', 4),
+    ('env_color', '<f4', 4),
+    ('prim_color', '<f4', 4),
+    ('prim_l', '<f4'),
+    ('prim_m', '<f4'),
+    ('fog_multiplier', '<f4'),
+    ('fog_offset', '<f4'),
+    ('k4', '<i4'),
+    ('k5', '<i4'),
+    ('combiner_mux', '<u8'),
+    ('other_mode', '<u8'),
+    ('geometry_mode', '<u4'),
+    ('tex0_crc', '<u8'),
+    ('tex0_maskS', 'u1'),
+    ('tex0_maskT', 'u1'),
+    ('tex0_wrapS', 'u1'),
+    ('tex0_wrapT', 'u1'),
+    ('tex1_crc', '<u8'),
+    ('tex1_maskS', 'u1'),
+    ('tex1_maskT', 'u1'),
+    ('tex1_wrapS', 'u1'),
+    ('tex1_wrapT', 'u1'),
+])
+
+GLR_TRIANGLE_SIZE = GLR_TRIANGLE_DTYPE.itemsize  # 264
+
+# Captures can be stored compressed, these are opened transparently
+COMPRESSED_EXTENSIONS = {
+    '.gz': gzip,
+    '.xz': lzma,
+    '.bz2': bz2,
+}
+
+GLR_EXTENSIONS = ('.glr', '.glr.gz', '.glr.xz', '.glr.bz2')
+
+# Size of the blocks the background thread decompresses at a time, and
+# how many of them it may get ahead of the decoder
+READ_BLOCK_SIZE = 1 << 20
+READ_AHEAD_BLOCKS = 8
+
+
+def read_header(fb):
+    # Reads the 36 byte glr header. Only the magic is checked, it's up
+    # to the caller to decide which versions it can handle.
+    data = fb.read(GLR_HEADER_SIZE)
+    if len(data) != GLR_HEADER_SIZE or data[:6] != b'GL64R\0':
+        raise RuntimeError('Not a valid glr file')
+
+    version, romname, num_tris, microcode = struct.unpack('<H20sII', data[6:])
+
+    romname = romname.decode(errors='replace')
+    romname = romname.replace('\0', '').strip()
+    romname = romname or 'Unknown N64 Game'
+
+    return {
+        'version': version,
+        'romname': romname,
+        'num_tris': num_tris,
+        'microcode': microcode,
+    }
+
+
+def get_expected_file_size(num_tris):
+    return GLR_HEADER_SIZE + GLR_TRIANGLE_SIZE * num_tris
+
+
+def map_triangles(filepath, num_tris):
+    # Memory maps the triangle records of a glr file without reading
+    # them. Fields are read lazily (and only the pages touched) when a
+    # column of the returned array is used.
+    if num_tris == 0:
+        return np.empty(0, dtype=GLR_TRIANGLE_DTYPE)
+    return np.memmap(
+        filepath,
+        dtype=GLR_TRIANGLE_DTYPE,
+        mode='r',
+        offset=GLR_HEADER_SIZE,
+        shape=(num_tris,),
+    )
+
+
+def get_positions(tris):
+    # Returns the (num_tris, 3, 3) vertex positions of the triangles,
+    # converted from the N64's Y-up to Blender's Z-up.
+    positions = tris['verts']['position'][:, :, [0, 2, 1]]
+    positions[:, :, 1] *= -1
+    return positions
+
+
+def is_glr_filename(name):
+    return name.lower().endswith(GLR_EXTENSIONS)
+
+
+def is_compressed(filepath):
+    return os.path.splitext(filepath)[1].lower() in COMPRESSED_EXTENSIONS
+
+
+def get_capture_name(filepath):
+    # File name of a capture without the .glr (and compression) extension
+    name = os.path.basename(filepath)
+    if is_compressed(name):
+        name = os.path.splitext(name)[0]
+    return name[:-4] if name.lower().endswith('.glr') else name
+
+
+def open_glr(filepath, background=True):
+    # Opens a capture for reading. Compressed captures are decompressed
+    # as a stream, on a background thread unless background is False, so
+    # reading, decompressing and decoding overlap and no temporary file
+    # is needed.
+    module = COMPRESSED_EXTENSIONS.get(os.path.splitext(filepath)[1].lower())
+    if module is None:
+        return open(filepath, 'rb')
+    f = module.open(filepath, 'rb')
+    if not background:
+        # lzma and bz2 streams don't keep the name like files do
+        f.name = filepath
+        return f
+    return BackgroundReader(f, filepath)
+
+
+class BackgroundReader:
+    # File-like wrapper that reads a stream ahead on a background thread.
+    # zlib, lzma and bz2 release the GIL while decompressing, so this
+    # runs in parallel with decoding on the main thread.
+
+    def __init__(self, f, name):
+        self.f = f
+        self.name = name
+        self.blocks = queue.Queue(maxsize=READ_AHEAD_BLOCKS)
+        self.buffer = bytearray()
+        self.eof = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read_blocks, daemon=True)
+        self.thread.start()
+
+    def read_blocks(self):
+        try:
+            while not self.stopped.is_set():
+                block = self.f.read(READ_BLOCK_SIZE)
+                self.put_block(block)
+                if not block:
+                    return
+        except Exception as e:
+            self.error = e
+            self.put_block(b'')
+
+    def put_block(self, block):
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read(self, size):
+        while len(self.buffer) < size and not self.eof:
+            block = self.blocks.get()
+            if not block:
+                self.eof = True
+                if self.error is not None:
+                    raise RuntimeError(f'Could not decompress {os.path.basename(self.name)}: {self.error}')
+            self.buffer += block
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_triangle_chunks(filepath, num_tris, chunk_size):
+    # Yields the triangle records of a capture in chunks of up to
+    # chunk_size records. Uncompressed captures are memory mapped,
+    # compressed ones streamed.
+    if not is_compressed(filepath):
+        tris = map_triangles(filepath, num_tris)
+        for start in range(0, num_tris, chunk_size):
+            yield tris[start:start + chunk_size]
+        return
+
+    with open_glr(filepath) as fb:
+        fb.read(GLR_HEADER_SIZE)
+        remaining = num_tris
+        while remaining > 0:
+            count = min(remaining, chunk_size)
+            data = fb.read(count * GLR_TRIANGLE_SIZE)
+            if len(data) != count * GLR_TRIANGLE_SIZE:
+                raise RuntimeError('Unexpected end of glr file')
+            yield np.frombuffer(data, dtype=GLR_TRIANGLE_DTYPE)
+            remaining -= count
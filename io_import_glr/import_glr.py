@@ -1,57 +1,198 @@
 import os
-import struct
 import bpy
 import bmesh
 import re
+import json
+import colorsys
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .glr_format import (
+    GLR_TRIANGLE_DTYPE,
+    GLR_TRIANGLE_SIZE,
+    get_capture_name,
+    get_positions,
+    is_compressed,
+    map_triangles,
+    open_glr,
+    read_header,
+)
+from . import scan_glr
+from .texture_atlas import ATLAS_TEXTURES_PROP, build_atlas_image, get_atlas_name, pack_rects
+from .texture_cache import get_image_index
+from . import texture_proxy
+from . import memory_budget
+from .material_library import MATERIAL_KEY_PROP, MaterialLibrary
+from .spatial_index import get_spatial_index, query_spatial_index
+from .mesh_lod import LOD_LEVEL_PROP, LOD_MESHES_PROP, cluster_vertices, get_cell_size
+
+# Triangle fields that make up the material key of a triangle
+MATINFO_FIELDS = (
+    'combiner_mux',
+    'other_mode',
+    'geometry_mode',
+    'tex0_crc',
+    'tex0_wrapS', 'tex0_wrapT',
+    'tex1_crc',
+    'tex1_wrapS', 'tex1_wrapT',
+)
+
+# Number of triangle records decoded at once
+TRI_CHUNK_SIZE = 65536
+
+# Number of threads decoding chunks of triangle records
+DECODE_THREADS = os.cpu_count() or 1
+
+# Most chunks read ahead of the oldest one still being decoded
+DECODE_WINDOW = DECODE_THREADS * 2
+
+# How far UVs may stray outside of 0-1 for a triangle to still be moved
+# onto a texture atlas
+ATLAS_UV_TOLERANCE = 1e-4
+
+# Triangles whose corner angle has a sine below this are considered
+# collinear (zero area)
+DEGENERATE_TOLERANCE = 1e-6
+
+# Integer face attribute holding the index of every face among the
+# imported triangles in capture order, when they're sorted
+CAPTURE_ORDER_ATTRIBUTE = 'Capture Order'
+
+# Bits per axis of the Morton codes triangles are sorted by
+MORTON_BITS = 10
 
 ### Import Plugin Entry Point
-def load(context, **keywords):
+def load(operator, context, **keywords):
     if keywords['files'][0].name == '':
         raise RuntimeError('No .glr files have been selected for import!')
 
-    filter_list = []
-
-    if len(keywords['filter_list']) != 0:
-        raw_filter_list_str = keywords['filter_list'] + ','
-        if not re.search('^([A0-F9]{16},|NO_TEXTURE,)+$', raw_filter_list_str):
-            raise RuntimeError('Invalid filter textures list provided')
-        dup_filter_list = raw_filter_list_str[:-1].split(',')
-        filter_list = [*set(dup_filter_list)] # remove duplicates
+    get_material_registry(rebuild=True, library_path=keywords['material_library'])
 
     dir_name = os.path.dirname(keywords['filepath'])
     obs = []
 
+    # Check every capture up front so a truncated file doesn't abort an
+    # import that's already halfway done
+    total_tris = 0
     for glr_file in keywords['files']:
-        filepath = os.path.join(dir_name, glr_file.name)
-        triangle_options = (
-            keywords['enable_mat_transparency'],
-            keywords['enable_bf_culling'],
-            keywords['filter_mode'],
-            filter_list,
-            keywords['gen_light_color_attribute'],
-            keywords['gen_overlay_color_attribute']
-        )
-        ob = load_glr(filepath, triangle_options)
-        obs.append(ob)
+        entry = scan_glr.scan_glr(os.path.join(dir_name, glr_file.name))
+        total_tris += entry['num_tris']
+        if entry['error']:
+            raise RuntimeError(f'{glr_file.name}: {entry["error"]}')
+        if entry['truncated']:
+            raise RuntimeError(
+                f'{glr_file.name} is truncated ({entry["size"]} of {entry["expected_size"]} bytes), '
+                'the capture was probably interrupted')
+
+    # Split the import into parts small enough to stay under the memory
+    # budget. Every part becomes its own object.
+    budget = keywords['memory_budget'] * memory_budget.MB
+    num_color_layers = int(keywords['gen_light_color_attribute']) + int(keywords['gen_overlay_color_attribute'])
+    merge_captures = keywords['merge_captures'] and len(keywords['files']) > 1
+    part_tris = memory_budget.get_part_size(
+        total_tris, budget, num_color_layers, keywords['merge_doubles'], merge_captures)
+    if budget:
+        estimate = memory_budget.estimate_peak_memory(
+            total_tris, part_tris, num_color_layers, keywords['merge_doubles'], merge_captures)
+        peak_rss_before = memory_budget.get_peak_rss()
+
+    triangle_options = get_triangle_options(keywords, part_tris)
+
+    filepaths = [os.path.join(dir_name, glr_file.name) for glr_file in keywords['files']]
+
+    # Textures over the size or memory limits are loaded as downscaled
+    # proxies, made as the objects are built (see add_textures)
+    texture_proxy.start_proxies(keywords['texture_max_size'], keywords['texture_memory_budget'] * memory_budget.MB)
+
+    # Regions line up with whatever was imported of the capture before
+    placed = {}
+    kept = []
+    stale = []
+    if keywords['region_mode'] != 'NONE':
+        placed = find_capture_objects(filepaths)
+        for filepath in filepaths:
+            region = get_import_region(keywords, placed.get(filepath))
+            obs += load_region_glr(filepath, triangle_options, region)
+    elif keywords['preview']:
+        for filepath in filepaths:
+            obs += load_preview_glr(filepath, triangle_options, keywords['preview_tris'], keywords['preview_sampling'])
+    elif merge_captures:
+        obs = load_merged_glr(filepaths, triangle_options)
+    elif keywords['replace_existing']:
+        # Overwrite earlier imports of the captures in place
+        replaced = find_replaced_objects(filepaths)
+        for filepath in filepaths:
+            replace_obs = replaced.get(filepath, [])
+            file_obs = load_glr(filepath, triangle_options, replace_obs)
+            obs += file_obs
+            # Parts left over when the capture now has fewer of them
+            stale += replace_obs[len(file_obs):]
+            kept += [ob.name for ob in replace_obs[:len(file_obs)]]
+    else:
+        for filepath in filepaths:
+            obs += load_glr(filepath, triangle_options)
+
+    # Full imports replace earlier previews of the same capture
+    previews = {}
+    if not keywords['preview'] and keywords['region_mode'] == 'NONE':
+        previews = find_previews(filepaths)
+
+    # Report triangles removed by the pre-validation pass
+    culled = {}
+    for ob in obs:
+        for category, count in ob.get('glr:Culled Triangles', {}).items():
+            culled[category] = culled.get(category, 0) + count
+    if any(culled.values()):
+        culled_str = ', '.join(f'{count} {category}' for category, count in culled.items() if count)
+        operator.report({'INFO'}, f'Culled triangles: {culled_str}')
 
     # Objects created by op are selected, active, placed at cursor, and transformed
     if bpy.ops.object.select_all.poll():
         bpy.ops.object.select_all(action='DESELECT')
     for ob in obs:
         ob.select_set(True)
-        ob.location = bpy.context.scene.cursor.location
-        ob.location = ob.location + keywords['move']
-        ob.rotation_euler = keywords['rotation']
-        ob.scale = keywords['scale']
-        if keywords['merge_doubles']:
+        placed_ob = previews.get(ob.get('glr:Source')) or placed.get(ob.get('glr:Source'))
+        if ob.name in kept:
+            pass  # Replaced in place, keeps its transform
+        elif placed_ob is not None:
+            # Take over the placement of the preview or earlier import
+            ob.matrix_world = placed_ob.matrix_world
+        else:
+            ob.location = bpy.context.scene.cursor.location
+            ob.location = ob.location + keywords['move']
+            ob.rotation_euler = keywords['rotation']
+            ob.scale = keywords['scale']
+        if keywords['merge_doubles'] and not keywords['preview']:
             ob_mesh = ob.data
             bm = bmesh.new()
             bm.from_mesh(ob_mesh)
             merge_distance = round(keywords['merge_distance'], 6) # chopping off extra precision
             bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=merge_distance)
             bm.to_mesh(ob_mesh)
+            bm.free()
     bpy.context.view_layer.objects.active = obs[0]
 
+    for old_ob in [*previews.values(), *stale]:
+        remove_lod_meshes(old_ob)
+        mesh = old_ob.data
+        bpy.data.objects.remove(old_ob)
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+    if budget:
+        report_memory_usage(operator, budget, estimate, peak_rss_before, len(obs))
+
+    num_proxies, texture_memory, full_texture_memory = texture_proxy.get_proxy_stats()
+    if num_proxies:
+        operator.report({'INFO'}, (
+            f'Using {num_proxies} downscaled texture proxies, {texture_memory // memory_budget.MB} MB '
+            f'of textures instead of {full_texture_memory // memory_budget.MB} MB'))
+
+    get_material_registry().save_library()
+
+    if keywords['material_setup'] == 'BACKGROUND' and not keywords['preview']:
+        start_realizing_materials()
+
     # Checking and enabling Color Management options
     if keywords['enable_srgb']:
         bpy.context.scene.display_settings.display_device = 'sRGB'
@@ -61,10 +202,246 @@ def load(context, **keywords):
     return {'FINISHED'}
 
 
-def load_glr(filepath, triangle_options):
+def get_triangle_options(keywords, part_tris):
+    # Turns the import options into the options tuple of GlrImporter
+    filter_list = []
+
+    if len(keywords['filter_list']) != 0:
+        raw_filter_list_str = keywords['filter_list'] + ','
+        if not re.search('^([0-9A-F]{16},|NO_TEXTURE,)+$', raw_filter_list_str):
+            raise RuntimeError('Invalid filter textures list provided')
+        dup_filter_list = raw_filter_list_str[:-1].split(',')
+        filter_list = [*set(dup_filter_list)] # remove duplicates
+
+    cull_bbox = None
+    if keywords['cull_bbox']:
+        cull_bbox = (tuple(keywords['cull_bbox_min']), tuple(keywords['cull_bbox_max']))
+
+    return (
+        keywords['enable_mat_transparency'],
+        keywords['enable_bf_culling'],
+        keywords['filter_mode'],
+        filter_list,
+        keywords['gen_light_color_attribute'],
+        keywords['gen_overlay_color_attribute'],
+        keywords['cull_degenerate'],
+        cull_bbox,
+        keywords['use_texture_atlas'],
+        int(keywords['atlas_size']),
+        keywords['dedup_textures'],
+        part_tris,
+        keywords['preview'],
+        keywords['lod_levels'],
+        keywords['lod_resolution'],
+        keywords['byte_colors'],
+        keywords['material_setup'],
+        keywords['sort_triangles'],
+    )
+
+
+def get_import_region(keywords, placed_ob=None):
+    # Returns the (min, max) box to import from a capture, in capture
+    # (mesh) coordinates
+    if keywords['region_mode'] == 'BOX':
+        return tuple(keywords['region_min']), tuple(keywords['region_max'])
+
+    # Around the 3D cursor. If the capture was imported before (eg. as a
+    # preview) the cursor is taken relative to that object, otherwise the
+    # capture is assumed to sit untransformed at the origin.
+    center = bpy.context.scene.cursor.location
+    radius = keywords['region_radius']
+    if placed_ob is not None:
+        center = placed_ob.matrix_world.inverted() @ center
+        radius /= max(min(abs(s) for s in placed_ob.matrix_world.to_scale()), 1e-6)
+    return (
+        tuple(c - radius for c in center),
+        tuple(c + radius for c in center),
+    )
+
+
+def find_capture_objects(filepaths):
+    # Returns an object imported from each of the captures, if any, keyed
+    # by capture path
+    capture_obs = {}
+    for ob in bpy.data.objects:
+        if ob.get('glr:Source') in filepaths:
+            capture_obs.setdefault(ob['glr:Source'], ob)
+    return capture_obs
+
+
+def find_replaced_objects(filepaths):
+    # Returns the objects of an earlier full import of each capture, in
+    # part order, keyed by capture path. A capture that was never
+    # imported replaces the import of an earlier capture of the same ROM,
+    # as long as there's only one such capture.
+    imported = {}
+    for ob in bpy.data.objects:
+        if 'glr:Source' in ob and not ob.get('glr:Preview') and 'glr:ROM Name' in ob:
+            imported.setdefault(ob['glr:Source'], []).append(ob)
+
+    replaced = {}
+    for filepath in filepaths:
+        obs = imported.get(filepath)
+        if obs is None:
+            romname = scan_glr.scan_glr(filepath)['romname']
+            sources = [
+                source for source, source_obs in imported.items()
+                if source not in filepaths and source_obs[0]['glr:ROM Name'] == romname
+            ]
+            if len(sources) != 1:
+                continue
+            obs = imported.pop(sources[0])
+        replaced[filepath] = sorted(obs, key=lambda ob: ob.get('glr:Part', 0))
+    return replaced
+
+
+def find_previews(filepaths):
+    # Returns the preview objects imported from any of the captures,
+    # keyed by capture path
+    previews = {}
+    for ob in bpy.data.objects:
+        if ob.get('glr:Preview') and ob.get('glr:Source') in filepaths:
+            previews[ob['glr:Source']] = ob
+    return previews
+
+
+def report_memory_usage(operator, budget, estimate, peak_rss_before, num_obs):
+    MB = memory_budget.MB
+    msg = f'Memory: estimated peak {estimate // MB} MB, budget {budget // MB} MB'
+    if num_obs > 1:
+        msg += f', split into {num_obs} objects'
+    peak_rss = memory_budget.get_peak_rss()
+    if peak_rss is not None:
+        if peak_rss > peak_rss_before:
+            msg += f', measured peak {peak_rss // MB} MB'
+        else:
+            # The process peak was set before this import started
+            msg += f', measured peak below {peak_rss // MB} MB'
+    over_budget = peak_rss is not None and peak_rss > max(peak_rss_before, budget)
+    operator.report({'WARNING'} if over_budget or estimate > budget else {'INFO'}, msg)
+
+
+def load_glr(filepath, triangle_options, replace_obs=()):
+    # Returns the list of objects created for the capture, which is
+    # split into several when importing under a memory budget. The
+    # meshes of replace_obs (an earlier import, in part order) are
+    # overwritten instead of making new objects.
     texture_dir = os.path.abspath(os.path.dirname(filepath))
-    with open(filepath, 'rb') as fb:
-        return GlrImporter(fb, texture_dir, triangle_options).load()
+    with open_glr(filepath) as fb:
+        importer = GlrImporter(fb, texture_dir, triangle_options)
+        importer.replace_obs = list(replace_obs)
+        obs = importer.load()
+    if importer.image_index is not None:
+        importer.image_index.save()
+    for ob in obs:
+        ob['glr:Source'] = filepath
+        ob['glr:ROM Name'] = importer.romname
+    return obs
+
+
+def load_preview_glr(filepath, triangle_options, count, sampling):
+    # Quickly imports a sample of at most count triangles, with flat
+    # viewport-only materials. A later full import of the same capture
+    # replaces the preview.
+    tris = scan_glr.sample_triangles(filepath, count, sampling)
+    ob = load_glr_records(filepath, triangle_options, tris, 'Preview')
+    ob['glr:Preview'] = True
+    return [ob]
+
+
+def load_region_glr(filepath, triangle_options, region):
+    # Imports only the triangles overlapping the region (a (min, max)
+    # box). The capture's spatial index tells which records to read, so
+    # the cost depends on the size of the region, not of the capture.
+    index = get_spatial_index(filepath)
+    tris = scan_glr.read_triangles(filepath, query_spatial_index(index, *region))
+    return [load_glr_records(filepath, triangle_options, tris, 'Region', region)]
+
+
+def load_glr_records(filepath, triangle_options, tris, suffix, bbox=None):
+    # Builds an object from already read triangle records of a capture
+    texture_dir = os.path.abspath(os.path.dirname(filepath))
+    with open_glr(filepath, background=False) as fb:
+        importer = GlrImporter(fb, texture_dir, triangle_options)
+        importer.load_header()
+    tris = tris[importer.filter_tris(tris)]
+
+    # A triangle has to overlap both the region (bbox) and the culling
+    # box to be kept. The ones outside the region are counted apart from
+    # those the culling options removed.
+    culled = {}
+    if bbox is not None:
+        keep, region_culled = cull_triangles(get_positions(tris), False, bbox)
+        tris = tris[keep]
+        culled['outside region'] = region_culled['outside bounds']
+    if importer.cull_degenerate or importer.cull_bbox is not None:
+        keep, options_culled = cull_triangles(get_positions(tris), importer.cull_degenerate, importer.cull_bbox)
+        tris = tris[keep]
+        culled.update(options_culled)
+    ob = importer.build_object(tris, f'{importer.obj_name} {suffix}', culled)
+    if importer.image_index is not None:
+        importer.image_index.save()
+    ob['glr:Source'] = filepath
+    return ob
+
+
+def load_merged_glr(filepaths, triangle_options):
+    # Imports several captures into one scene. Triangles repeated across
+    # the captures (same positions, UVs and material key) are only kept
+    # once, and everything shares one material table.
+    #
+    # The captures are decoded part_tris triangles at a time and a part
+    # is built as soon as enough new triangles have been collected, so
+    # only the keys of the triangles kept so far (see get_triangle_keys)
+    # are held for the whole import.
+    culled = {}
+    duplicates = 0
+    seen = []
+    pending = []
+    obs = []
+    importer = None
+    for filepath in filepaths:
+        texture_dir = os.path.abspath(os.path.dirname(filepath))
+        with open_glr(filepath) as fb:
+            file_importer = GlrImporter(fb, texture_dir, triangle_options)
+            file_importer.load_header()
+            if importer is not None and file_importer.microcode != importer.microcode:
+                raise RuntimeError('Captures using different microcodes can\'t be merged')
+            importer = importer or file_importer
+            name = f'{importer.romname} (Merged {len(filepaths)} captures)'
+            part_tris = importer.part_tris
+
+            remaining = file_importer.num_tris
+            while remaining > 0:
+                count = min(remaining, part_tris)
+                remaining -= count
+                tris, part_culled, _ = file_importer.decode_tris(count)
+                for category, num_culled in part_culled.items():
+                    culled[category] = culled.get(category, 0) + num_culled
+
+                keys = get_triangle_keys(tris)
+                unique = get_unique_triangles(keys, seen)
+                duplicates += len(tris) - len(unique)
+                seen.append(np.sort(keys[unique]))
+                pending.append(tris[unique])
+                del tris, keys
+
+                # Only build a part once it's sure not to be the last
+                if sum(len(tris) for tris in pending) > part_tris:
+                    tris = np.concatenate(pending)
+                    obs.append(importer.build_object(tris[:part_tris], f'{name} Part {len(obs)}', {}))
+                    pending = [tris[part_tris:]]
+                    del tris
+
+    tris = np.concatenate(pending) if pending else np.empty(0, dtype=GLR_TRIANGLE_DTYPE)
+    obs.append(importer.build_object(tris, f'{name} Part {len(obs)}' if obs else name, {}))
+
+    # The counts are for the whole import, only the first part has them
+    culled['duplicate'] = duplicates
+    obs[0]['glr:Culled Triangles'] = culled
+    if importer.image_index is not None:
+        importer.image_index.save()
+    return obs
 
 
 class GlrImporter:
@@ -77,176 +454,290 @@ class GlrImporter:
         self.filter_list = triangle_options[3]
         self.gen_light_color_attribute = triangle_options[4]
         self.gen_overlay_color_attribute = triangle_options[5]
+        self.cull_degenerate = triangle_options[6]
+        self.cull_bbox = triangle_options[7]
+        self.use_texture_atlas = triangle_options[8]
+        self.atlas_size = triangle_options[9]
+        self.image_index = get_image_index(texture_dir) if triangle_options[10] else None
+        self.part_tris = triangle_options[11]
+        self.preview = triangle_options[12]
+        self.lod_levels = triangle_options[13]
+        self.lod_resolution = triangle_options[14]
+        self.byte_colors = triangle_options[15]
+        self.material_setup = triangle_options[16]
+        self.sort_triangles = triangle_options[17]
+        if self.preview:
+            # Previews don't load any textures
+            self.use_texture_atlas = False
+            self.image_index = None
+        self.replace_obs = []
+        self.num_faces = 0  # faces built so far, for the capture order
+        self.filter_crcs = np.array(
+            [0 if name == 'NO_TEXTURE' else int(name, 16) for name in self.filter_list],
+            dtype=np.uint64)
+        self.romname = None
         self.obj_name = None
         self.num_tris = None
         self.microcode = None
+        self.triangles = None  # memory map of the records, if uncompressed
+        self.next_tri = 0
 
     def load(self):
         self.load_header()
-        return self.do_tris()
+
+        if self.num_tris <= self.part_tris:
+            return [self.do_tris(self.num_tris, self.obj_name)]
+
+        obs = []
+        remaining = self.num_tris
+        while remaining > 0:
+            count = min(remaining, self.part_tris)
+            ob = self.do_tris(count, f'{self.obj_name} Part {len(obs)}')
+            ob['glr:Part'] = len(obs)
+            obs.append(ob)
+            remaining -= count
+        return obs
 
     def load_header(self):
         fb = self.fb
 
-        # Check magic
-        if fb.read(6) != b'GL64R\0':
-            raise RuntimeError('Not a valid glr file')
+        header = read_header(fb)
 
         # Check version
-        version = struct.unpack('<H', fb.read(2))[0]
+        version = header['version']
         if version > 0 and version < 2:
             raise RuntimeError(f'Outdated glr file format detected ({version}), please update the glr import addon')
         elif version != 2:
             raise RuntimeError(f'Unknown N64 Ripper version ({version}) encountered')
 
-        romname = fb.read(20)
-        romname = romname.decode(errors='replace')
-        romname = romname.replace('\0', '').strip()
-        romname = romname or 'Unknown N64 Game'
-        self.obj_name = romname + ' (' + os.path.basename(fb.name)[:-4] + ')'
-
-        self.num_tris = struct.unpack('<I', fb.read(4))[0]
-        self.microcode = struct.unpack('<I', fb.read(4))[0]
-
-    def do_tris(self):
-        fb = self.fb
-
-        verts = []
-        faces = []
-        shade_colors = []
-        prim_colors = []
-        env_colors = []
-        blend_colors = []
-        fog_colors = []
-        uvs0 = []
-        uvs1 = []
-
-        matinfo_cache = {}
-        face_materials = []
-
-        for i in range(self.num_tris):
-            tmp_shade_cols = []
-            tmp_uvs0 = []
-            tmp_uvs1 = []
-            tmp_verts = []
-            tmp_face = []
-
-            # Read vertices
-            for j in range(3):
-                (
-                    x, y, z, r, g, b, a, s0, t0, s1, t1,
-                ) = struct.unpack('<11f', fb.read(44))
-                
-                # delay writing lists for filter check
-                tmp_shade_cols += [r, g, b, a]
-                tmp_uvs0 += [s0, t0]
-                tmp_uvs1 += [s1, t1]
-                tmp_verts.append((x, -z, y))  # Yup2Zup
-                tmp_face.append((len(verts)) + j)
-
-            # Read triangle data
-            (
-                fog_r, fog_g, fog_b, fog_a,
-                blend_r, blend_g, blend_b, blend_a,
-                env_r, env_g, env_b, env_a,
-                prim_r, prim_g, prim_b, prim_a,
-                prim_l, prim_m,
-                fog_multiplier, fog_offset,
-                k4, k5,
-                combiner_mux,
-                other_mode,
-                geometry_mode,
-                tex0_crc,
-                tex0_maskS, tex0_maskT,
-                tex0_wrapS, tex0_wrapT,
-                tex1_crc,
-                tex1_maskS, tex1_maskT,
-                tex1_wrapS, tex1_wrapT,
-            ) = struct.unpack('<4f4f4f4f2f2f2iQQIQ4BQ4B', fb.read(132))
-
-            tex0_crc_hex = f'{tex0_crc:016X}'
-
-            if self.filter_mode: # Blacklist mode
-                if tex0_crc_hex in self.filter_list or \
-                    (tex0_crc == 0 and 'NO_TEXTURE' in self.filter_list):
-                        continue # skip tri, go to the next one
-            else: # Whitelist mode, opposite of blacklist
-                if tex0_crc_hex not in self.filter_list or \
-                    (tex0_crc == 0 and 'NO_TEXTURE' not in self.filter_list):
-                        continue
-
-            # write delayed info
-            shade_colors.extend(tmp_shade_cols)
-            uvs0.extend(tmp_uvs0)
-            uvs1.extend(tmp_uvs1)
-            verts.extend(tmp_verts)
-            faces.append(tmp_face)
-
-            # Store per-tri colors as vertex colors (once per corner)
-            prim_colors += [prim_r, prim_g, prim_b, prim_a] * 3
-            env_colors += [env_r, env_g, env_b, env_a] * 3
-            blend_colors += [blend_r, blend_g, blend_b, blend_a] * 3
-            fog_colors += [fog_r, fog_g, fog_b, fog_a] * 3
-            
-            # Create combination light/overlay color attributes
-            # TODO: Implement correctly based on color attributes actively used by each seperate material
-            '''
-            for _ in range(3):
-                merged_r = shade_colors[curr_vert] * prim_colors[curr_vert] * env_colors[curr_vert]
-                curr_vert += 1
-                merged_g = shade_colors[curr_vert] * prim_colors[curr_vert] * env_colors[curr_vert]
-                curr_vert += 1
-                merged_b = shade_colors[curr_vert] * prim_colors[curr_vert] * env_colors[curr_vert]
-                curr_vert += 1
-                merged_a = shade_colors[curr_vert] * prim_colors[curr_vert] * env_colors[curr_vert]
-                curr_vert += 1
-                merged_colors += [merged_r, merged_g, merged_b, merged_a]
-            '''
-
-            # Gather all the info we need to make the material for this tri
-            matinfo = (
-                combiner_mux,
-                other_mode,
-                geometry_mode,
-                tex0_crc,
-                tex0_wrapS, tex0_wrapT,
-                tex1_crc,
-                tex1_wrapS, tex1_wrapT,
-            )
-            material_index = matinfo_cache.setdefault(matinfo, len(matinfo_cache))
-            face_materials.append(material_index)
-
-        # Create mesh
-        mesh = bpy.data.meshes.new(self.obj_name)
-        mesh.from_pydata(verts, [], faces)
+        romname = header['romname']
+        self.romname = romname
+        self.obj_name = romname + ' (' + get_capture_name(fb.name) + ')'
+
+        self.num_tris = header['num_tris']
+        self.microcode = header['microcode']
+
+        # Uncompressed records are at fixed offsets, so they're read
+        # through a memory map, which can be split into ranges
+        if not is_compressed(fb.name):
+            self.triangles = map_triangles(fb.name, self.num_tris)
+
+    def do_tris(self, count, name):
+        tris, culled, matkeys = self.decode_tris(count)
+        return self.build_object(tris, name, culled, matkeys)
+
+    def decode_tris(self, count):
+        # Reads, filters and culls the next count triangles. Returns the
+        # remaining triangle records, the number culled per reason and
+        # their material keys (as returned by get_material_keys).
+        #
+        # The records are decoded in chunks on a thread pool, NumPy
+        # releases the GIL for most of the work. The results are merged
+        # back in file order.
+        if self.triangles is not None:
+            records = self.triangles[self.next_tri:self.next_tri + count]
+            self.next_tri += count
+            chunks = (records[i:i + TRI_CHUNK_SIZE] for i in range(0, count, TRI_CHUNK_SIZE))
+        else:
+            chunks = self.read_tris(count)
 
-        # Create & assign materials
-        for matinfo in matinfo_cache:
-            mesh.materials.append(self.create_material(matinfo))
+        if count <= TRI_CHUNK_SIZE or DECODE_THREADS == 1:
+            results = [self.decode_chunk(chunk) for chunk in chunks]
+        else:
+            # Chunks are submitted as earlier ones finish, so a compressed
+            # stream isn't read whole before any of it is filtered
+            results = []
+            pending = deque()
+            with ThreadPoolExecutor(DECODE_THREADS) as pool:
+                for chunk in chunks:
+                    if len(pending) >= DECODE_WINDOW:
+                        results.append(pending.popleft().result())
+                    pending.append(pool.submit(self.decode_chunk, chunk))
+                results.extend(future.result() for future in pending)
+
+        return merge_decoded_chunks(results)
+
+    def decode_chunk(self, records):
+        # Filters, culls and keys one chunk of triangle records
+        tris = np.asarray(records[self.filter_tris(records)])
+
+        # Drop triangles that would make the mesh invalid so we don't
+        # need to run mesh.validate() afterwards, and those outside the
+        # culling box
+        if self.cull_degenerate or self.cull_bbox is not None:
+            keep, culled = cull_triangles(get_positions(tris), self.cull_degenerate, self.cull_bbox)
+            if not keep.all():
+                tris = tris[keep]
+        else:
+            culled = {}
+
+        return tris, culled, get_material_keys(tris)
+
+    def build_object(self, tris, name, culled, matkeys=None):
+        positions = get_positions(tris)  # Yup2Zup
+
+        num_tris = len(tris)
+
+        # Store per-tri colors as vertex colors (once per corner). Byte
+        # colors are quantized before repeating, so the per-corner arrays
+        # are a quarter of the size.
+        get_colors = quantize_colors if self.byte_colors else (lambda colors: colors)
+        shade_colors = get_colors(tris['verts']['color'])
+        prim_colors = np.repeat(get_colors(tris['prim_color']), 3, axis=0)
+        env_colors = np.repeat(get_colors(tris['env_color']), 3, axis=0)
+        blend_colors = np.repeat(get_colors(tris['blend_color']), 3, axis=0)
+        fog_colors = np.repeat(get_colors(tris['fog_color']), 3, axis=0)
+        uvs0 = tris['verts']['uv0']
+        uvs1 = tris['verts']['uv1']
+        num_atlases = 0
+
+        # Gather all the info we need to make the material for each tri
+        matinfos, face_materials = matkeys if matkeys is not None else get_material_keys(tris)
+
+        # Create mesh, or empty out the mesh of the object being replaced
+        ob = self.replace_obs.pop(0) if self.replace_obs else None
+        if ob is not None:
+            remove_lod_meshes(ob)
+        if ob is not None and hasattr(ob.data, 'clear_geometry'):
+            mesh = ob.data
+            mesh.clear_geometry()
+            mesh.materials.clear()
+        else:
+            mesh = bpy.data.meshes.new(name)
+
+        descs = [self.decode_material(matinfo) for matinfo in matinfos]
+
+        # Proxies for the textures the materials are about to load, only
+        # those of the triangles that passed the filters. Previews don't
+        # load textures.
+        if not self.preview:
+            texture_proxy.add_textures(self.get_loaded_textures(descs))
+
+        # Create combination light/overlay colors, from the colors each
+        # material's combiner actually uses
+        if self.gen_light_color_attribute or self.gen_overlay_color_attribute:
+            light_colors, overlay_colors = get_merged_colors(tris, descs, face_materials)
+
+        if self.use_texture_atlas:
+            descs, face_materials, uvs0, num_atlases = self.atlas_textures(descs, face_materials, uvs0)
+
+        # Create & assign materials, one per canonical RDP setup (or per
+        # texture for previews, see get_preview_material)
+        used = np.bincount(face_materials, minlength=len(descs)) != 0
+        if not self.preview:
+            get_material_registry().prefetch(
+                (self.get_material_key(desc), desc['name'])
+                for desc, is_used in zip(descs, used) if is_used)
+        slots = {}
+        slot_remap = []
+        for desc, is_used in zip(descs, used):
+            if not is_used:
+                slot_remap.append(0)
+                continue
+            slot_key = desc['tex0']['crc'] if self.preview else desc['signature']
+            if slot_key not in slots:
+                slots[slot_key] = len(slots)
+                mesh.materials.append(self.create_material(desc))
+            slot_remap.append(slots[slot_key])
+        face_materials = np.array(slot_remap, dtype=np.int32)[face_materials]
+
+        # Sort the faces by material, then along a Morton curve, so every
+        # material is one contiguous range of faces close to each other
+        order = None
+        if self.sort_triangles:
+            order = get_locality_order(positions, face_materials)
+            positions = positions[order]
+            face_materials = face_materials[order]
+
+        add_triangles(mesh, positions.reshape(-1, 3), np.arange(num_tris * 3, dtype=np.int32))
         mesh.polygons.foreach_set('material_index', face_materials)
+        if order is not None:
+            mesh.attributes.new(CAPTURE_ORDER_ATTRIBUTE, 'INT', 'FACE').data.foreach_set(
+                'value', order + self.num_faces)
+        self.num_faces += num_tris
 
         # Create attributes
-        mesh.vertex_colors.new(name='Shading').data.foreach_set('color', shade_colors)
-        mesh.vertex_colors.new(name='Primitive').data.foreach_set('color', prim_colors)
-        mesh.vertex_colors.new(name='Environment').data.foreach_set('color', env_colors)
-        mesh.vertex_colors.new(name='Blend').data.foreach_set('color', blend_colors)
-        mesh.vertex_colors.new(name='Fog').data.foreach_set('color', fog_colors)
+        color_layers = {
+            'Shading': shade_colors,
+            'Primitive': prim_colors,
+            'Environment': env_colors,
+            'Blend': blend_colors,
+            'Fog': fog_colors,
+        }
         if self.gen_light_color_attribute:
-            mesh.vertex_colors.new(name='Light').data.foreach_set('color', light_colors)
+            color_layers['Light'] = get_colors(light_colors)
         if self.gen_overlay_color_attribute:
-            mesh.vertex_colors.new(name='Light').data.foreach_set('color', light_colors)
-        mesh.uv_layers.new(name='UV0').data.foreach_set('uv', uvs0)
-        mesh.uv_layers.new(name='UV1').data.foreach_set('uv', uvs1)
-
-        mesh.validate()
-
-        # Create object
-        ob = bpy.data.objects.new(mesh.name, mesh)
-        bpy.context.scene.collection.objects.link(ob)
+            color_layers['Overlay'] = get_colors(overlay_colors)
+        uv_layers = {'UV0': uvs0, 'UV1': uvs1}
+        if order is not None:
+            color_layers = {name: reorder_corners(colors, order) for name, colors in color_layers.items()}
+            uv_layers = {name: reorder_corners(uvs, order) for name, uvs in uv_layers.items()}
+        add_corner_layers(mesh, color_layers, uv_layers)
+
+        # The culling pass guarantees a valid mesh by construction
+        if not self.cull_degenerate:
+            mesh.validate()
+
+        # Create object. A replaced object keeps its transform, parent and
+        # modifiers, only its mesh changes.
+        if ob is None:
+            ob = bpy.data.objects.new(mesh.name, mesh)
+            bpy.context.scene.collection.objects.link(ob)
+        else:
+            if ob.data != mesh:
+                old_mesh = ob.data
+                ob.data = mesh
+                if old_mesh.users == 0:
+                    bpy.data.meshes.remove(old_mesh)
+            # Named as a new object would be, the capture may have been
+            # split into a different number of parts last time. load sets
+            # the part number again if it still is split.
+            ob.name = mesh.name = name
+            if 'glr:Part' in ob:
+                del ob['glr:Part']
+
+        ob['glr:Culled Triangles'] = culled
+        if self.use_texture_atlas:
+            ob['glr:Texture Atlases'] = num_atlases
+
+        if self.lod_levels and not self.preview:
+            lod_meshes = [
+                make_lod_mesh(mesh, positions, face_materials, color_layers, uv_layers, level, self.lod_resolution)
+                for level in range(1, self.lod_levels + 1)
+            ]
+            # Meshes not shown by the object would otherwise be lost on save
+            for lod_mesh in [mesh, *lod_meshes]:
+                lod_mesh.use_fake_user = True
+            ob[LOD_MESHES_PROP] = [lod_mesh.name for lod_mesh in [mesh, *lod_meshes]]
+            ob[LOD_LEVEL_PROP] = 0
 
         return ob
 
-    def create_material(self, matinfo):
+    def read_tris(self, count):
+        # Reads the next count triangle records from the stream, yielding
+        # them in chunks
+        fb = self.fb
+        remaining = count
+        while remaining > 0:
+            count = min(remaining, TRI_CHUNK_SIZE)
+            data = fb.read(count * GLR_TRIANGLE_SIZE)
+            if len(data) != count * GLR_TRIANGLE_SIZE:
+                raise RuntimeError('Unexpected end of glr file')
+            yield np.frombuffer(data, dtype=GLR_TRIANGLE_DTYPE)
+            remaining -= count
+
+    def filter_tris(self, tris):
+        # Returns a mask of the triangles that pass the texture filter
+        listed = np.isin(tris['tex0_crc'], self.filter_crcs)
+        if self.filter_mode: # Blacklist mode
+            return ~listed
+        else: # Whitelist mode, opposite of blacklist
+            return listed
+
+    def decode_material(self, matinfo):
+        # Decodes a material key into everything needed to build the
+        # material. The RDP setup is canonicalized so functionally
+        # identical keys get the same 'signature'.
         (
             combiner_mux,
             other_mode,
@@ -266,9 +757,16 @@ class GlrImporter:
         if not two_cycle_mode:
             combiner2 = blender2 = None
 
+        combiner1, combiner2, alpha_blend = canonicalize_rdp_setup(
+            combiner1, combiner2,
+            blender1, blender2)
+
         def make_tex_dict(crc, wrapS, wrapT):
             tex = {}
             tex['filepath'] = self.get_texture_path_for_crc(crc)
+            if self.image_index is not None and tex['filepath']:
+                # Textures with identical pixels share one image
+                tex['filepath'] = self.image_index.get_canonical_path(tex['filepath'])
             tex['filter'] = get_texture_filter(other_mode)
             tex['wrapS'] = get_texture_wrap_mode(wrapS)
             tex['wrapT'] = get_texture_wrap_mode(wrapT)
@@ -297,28 +795,179 @@ class GlrImporter:
 
         cull_backface = bool(geometry_mode & bfc_mask)
 
-        mat_name = self.get_material_name_for_crcs_and_wrapmodes(
-            [tex0_crc, tex1_crc],
-            [tex0['wrapST'], tex1['wrapST']],
-            cull_backface)
-
-        found_mat_index = bpy.data.materials.find(mat_name)
-
-        if found_mat_index != -1:
-            mat = bpy.data.materials[found_mat_index]
-        else:
-            mat = bpy.data.materials.new(mat_name)
-
-            setup_n64_material(
-                mat,
+        # Only textures the combiner actually samples affect the material
+        sources = set(combiner1) | set(combiner2 or [])
+        tex_signatures = []
+        for i, tex in enumerate((tex0, tex1)):
+            if f'Texel {i} Color' in sources or f'Texel {i} Alpha' in sources:
+                tex_signatures.append((tex['filepath'], tex['wrapS'], tex['wrapT'], tex['filter']))
+            else:
+                tex_signatures.append(None)
+
+        return {
+            'name': self.get_material_name_for_crcs_and_wrapmodes(
+                [tex0_crc, tex1_crc],
+                [tex0['wrapST'], tex1['wrapST']],
+                cull_backface),
+            'signature': (
                 combiner1, combiner2,
-                blender1, blender2,
-                tex0, tex1,
-                cull_backfacing=cull_backface & self.display_culling,
-                show_alpha=self.show_alpha,
-            )
+                alpha_blend,
+                *tex_signatures,
+                cull_backface,
+            ),
+            'combiner1': combiner1,
+            'combiner2': combiner2,
+            'blender1': blender1,
+            'blender2': blender2,
+            'tex0': tex0,
+            'tex1': tex1,
+            'cull_backface': cull_backface,
+        }
+
+    def atlas_textures(self, descs, face_materials, uvs0):
+        # Packs the textures of single texture, clamp-only materials with
+        # otherwise identical setups into atlases, moving their triangles
+        # onto one material per atlas page. Triangles with UVs outside
+        # 0-1 would need per-pixel clamping and keep their material.
+        #
+        # Returns the extended material list, the new face materials and
+        # UVs, and the number of atlases made.
+
+        groups = {}
+        for i, desc in enumerate(descs):
+            combiner1, combiner2, alpha_blend, tex0_sig, tex1_sig, cull_backface = desc['signature']
+            if tex0_sig is None or tex1_sig is not None:
+                continue
+            filepath, wrapS, wrapT, filter = tex0_sig
+            if not filepath or wrapS != 'Clamp' or wrapT != 'Clamp':
+                continue
+            if not os.path.isfile(filepath):
+                continue
+            key = (combiner1, combiner2, alpha_blend, filter, cull_backface)
+            groups.setdefault(key, []).append(i)
+
+        in_range = (
+            (uvs0 >= -ATLAS_UV_TOLERANCE) &
+            (uvs0 <= 1.0 + ATLAS_UV_TOLERANCE)
+        ).all(axis=(1, 2))
+        movable = np.bincount(face_materials[in_range], minlength=len(descs))
+
+        descs = list(descs)
+        remap = np.arange(len(descs), dtype=np.int32)
+        offsets = np.zeros((len(descs), 2), dtype=np.float32)
+        scales = np.ones((len(descs), 2), dtype=np.float32)
+        atlas_dir = os.path.join(self.texture_dir, 'atlas')
+        num_atlases = 0
+
+        for setup, members in groups.items():
+            members = [i for i in members if movable[i]]
+            if len(members) < 2:
+                continue
+
+            images = [load_image(descs[i]['tex0']['filepath']) for i in members]
+            placements = pack_rects([tuple(image.size) for image in images], self.atlas_size)
+
+            pages = {}
+            for i, image, placement in zip(members, images, placements):
+                if placement is not None and image.size[0] != 0:
+                    page, x, y = placement
+                    pages.setdefault(page, []).append((i, image, x, y))
+
+            for page in pages.values():
+                if len(page) < 2:
+                    continue
+
+                # Named after its contents, an atlas saved by an earlier
+                # import (or part) with the same contents is reused
+                name = get_atlas_name(setup, self.atlas_size, [
+                    (os.path.basename(descs[i]['tex0']['filepath']), x, y)
+                    for i, _, x, y in page
+                ])
+                num_atlases += 1
+                atlas_path = os.path.join(atlas_dir, f'{name}.png')
+                if not os.path.isfile(atlas_path):
+                    atlas = build_atlas_image(
+                        name,
+                        [image for _, image, _, _ in page],
+                        [(x, y) for _, _, x, y in page],
+                        self.atlas_size,
+                        atlas_dir)
+                    bpy.data.images.remove(atlas)
+
+                desc = dict(descs[page[0][0]])
+                desc['name'] = name
+                desc['signature'] = ('ATLAS', name)
+                desc['tex0'] = dict(desc['tex0'], filepath=atlas_path, crc=None)
+                desc['atlas_crcs'] = sorted({descs[i]['tex0']['crc'] for i, _, _, _ in page})
+                descs.append(desc)
+
+                for i, image, x, y in page:
+                    width, height = image.size
+                    remap[i] = len(descs) - 1
+                    offsets[i] = x / self.atlas_size, y / self.atlas_size
+                    scales[i] = width / self.atlas_size, height / self.atlas_size
+
+        # Move the triangles into atlas space
+        move = in_range & (remap[face_materials] != face_materials)
+        moved_materials = face_materials[move]
+        uvs0 = np.array(uvs0)
+        uvs0[move] = uvs0[move] * scales[moved_materials, None] + offsets[moved_materials, None]
+        face_materials = np.where(move, remap[face_materials], face_materials)
+
+        return descs, face_materials, uvs0, num_atlases
+
+    def get_loaded_textures(self, descs):
+        # Paths of the textures create_material loads for descs: the ones
+        # the combiner samples, and texture 0 of placeholders
+        filepaths = []
+        for desc in descs:
+            combiner1, combiner2, alpha_blend, tex0_sig, tex1_sig, cull_backface = desc['signature']
+            for tex, sig in ((desc['tex0'], tex0_sig), (desc['tex1'], tex1_sig)):
+                if sig is not None and tex['filepath']:
+                    filepaths.append(tex['filepath'])
+            if self.material_setup != 'FULL' and desc['tex0']['filepath']:
+                filepaths.append(desc['tex0']['filepath'])
+        return filepaths
+
+    def create_material(self, desc):
+        if self.preview:
+            return get_preview_material(desc['tex0']['crc'])
+
+        cull_backfacing = desc['cull_backface'] & self.display_culling
+        key = self.get_material_key(desc)
+
+        registry = get_material_registry()
+        mat = registry.get(key)
+        setup = (
+            desc['combiner1'], desc['combiner2'],
+            desc['blender1'], desc['blender2'],
+            desc['tex0'], desc['tex1'],
+            cull_backfacing,
+            self.show_alpha,
+        )
+        if mat is None and self.material_setup != 'FULL':
+            # Placeholder, the full setup is built later by
+            # realize_material, which adds it to the library.
+            mat = bpy.data.materials.new(desc['name'])
+            registry.add(key, mat)
+            setup_placeholder_material(mat, *setup)
+        elif mat is None:
+            mat = bpy.data.materials.new(desc['name'])
+            registry.add(key, mat, built=True)
+            setup_n64_material(mat, *setup)
+        elif self.material_setup == 'FULL' and DEFERRED_SETUP_PROP in mat:
+            # Left as a placeholder by an earlier import
+            realize_material(mat)
+        if 'atlas_crcs' in desc:
+            mat[ATLAS_TEXTURES_PROP] = [scan_glr.get_filter_name(crc) for crc in desc['atlas_crcs']]
         return mat
 
+    def get_material_key(self, desc):
+        # The setup options change the material too, so they're part of
+        # its key
+        cull_backfacing = desc['cull_backface'] & self.display_culling
+        return repr((*desc['signature'], cull_backfacing, self.show_alpha))
+
     def get_texture_path_for_crc(self, crc):
         if crc != 0:
             return os.path.join(self.texture_dir, f'{crc:016X}.png')
@@ -340,6 +989,419 @@ class GlrImporter:
             returning_str += ' | (N)'
         return returning_str
 
+def add_triangles(mesh, verts, loop_verts):
+    # Fills an empty mesh with triangles, from the vertex positions and
+    # the vertex index of every corner
+    num_tris = len(loop_verts) // 3
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set('co', verts.ravel())
+    mesh.loops.add(num_tris * 3)
+    mesh.loops.foreach_set('vertex_index', loop_verts)
+    mesh.polygons.add(num_tris)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, num_tris * 3, 3, dtype=np.int32))
+    if not bpy.types.MeshPolygon.bl_rna.properties['loop_total'].is_readonly:
+        mesh.polygons.foreach_set('loop_total', np.full(num_tris, 3, dtype=np.int32))
+    mesh.update(calc_edges=True)
+
+
+def add_corner_layers(mesh, color_layers, uv_layers):
+    # Adds the per-corner color and UV layers, given as {name: values}.
+    # uint8 colors (see quantize_colors) become BYTE_COLOR attributes.
+    for name, colors in color_layers.items():
+        if colors.dtype == np.uint8 and has_byte_color_attributes():
+            # color_srgb takes the stored values as they are, like the
+            # vertex color layers do
+            values = colors.ravel().astype(np.float32) / 255
+            mesh.color_attributes.new(name, 'BYTE_COLOR', 'CORNER').data.foreach_set('color_srgb', values)
+        elif colors.dtype == np.uint8:
+            mesh.vertex_colors.new(name=name).data.foreach_set('color', colors.ravel().astype(np.float32) / 255)
+        else:
+            mesh.vertex_colors.new(name=name).data.foreach_set('color', colors.ravel())
+    for name, uvs in uv_layers.items():
+        mesh.uv_layers.new(name=name).data.foreach_set('uv', uvs.ravel())
+
+
+def quantize_colors(colors):
+    # Converts float colors to 8 bits per channel, rounding to nearest
+    return np.rint(np.clip(np.nan_to_num(colors), 0, 1) * 255).astype(np.uint8)
+
+
+def has_byte_color_attributes():
+    # Color attributes are in Blender 3.2+, but writing the stored sRGB
+    # values of byte colors directly needs 3.4+
+    return (
+        hasattr(bpy.types, 'ByteColorAttributeValue') and
+        'color_srgb' in bpy.types.ByteColorAttributeValue.bl_rna.properties
+    )
+
+
+def make_lod_mesh(mesh, positions, face_materials, color_layers, uv_layers, level, resolution):
+    # Makes a reduced copy of a triangle mesh by vertex clustering (see
+    # cluster_vertices), on a grid of resolution cells along the longest
+    # side for level 1, halved for each further level. The clustered
+    # vertices are shared, so the copy comes out welded.
+    num_tris = len(positions)
+    cell_size = get_cell_size(positions, resolution) * 2**(level - 1)
+    verts, tri_verts, kept = cluster_vertices(positions, face_materials, cell_size)
+
+    lod_mesh = bpy.data.meshes.new(f'{mesh.name} LOD{level}')
+    add_triangles(lod_mesh, verts, tri_verts.ravel())
+    for mat in mesh.materials:
+        lod_mesh.materials.append(mat)
+    lod_mesh.polygons.foreach_set('material_index', face_materials[kept])
+
+    # Triangles that remain keep their own corner attributes. The width
+    # is explicit so meshes without triangles work too.
+    def get_corners(values):
+        return values.reshape(num_tris, 3, values.shape[-1])[kept]
+
+    add_corner_layers(
+        lod_mesh,
+        {name: get_corners(colors) for name, colors in color_layers.items()},
+        {name: get_corners(uvs) for name, uvs in uv_layers.items()},
+    )
+    return lod_mesh
+
+
+def remove_lod_meshes(ob):
+    # Puts the full mesh of an object with LODs back and removes the LOD
+    # meshes, before the object is reimported or deleted
+    names = ob.get(LOD_MESHES_PROP)
+    if not names:
+        return
+    meshes = [bpy.data.meshes.get(name) for name in names]
+    if meshes[0] is not None and ob.data != meshes[0]:
+        ob.data = meshes[0]
+    for mesh in meshes:
+        if mesh is not None:
+            mesh.use_fake_user = False
+    for mesh in meshes[1:]:
+        if mesh is not None and mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+    del ob[LOD_MESHES_PROP]
+    if LOD_LEVEL_PROP in ob:
+        del ob[LOD_LEVEL_PROP]
+
+
+def cull_triangles(positions, cull_degenerate=True, bbox=None):
+    # Pre-validation pass over the (num_tris, 3, 3) triangle positions.
+    # Removes non-finite and degenerate triangles if cull_degenerate is
+    # set, and the triangles entirely outside bbox if one is given.
+    # Returns a mask of the triangles to keep, plus the number of
+    # triangles removed for each reason. Every triangle is counted in
+    # the first category it falls into.
+
+    finite = np.ones(len(positions), dtype=bool)
+    degenerate = np.zeros(len(positions), dtype=bool)
+    if cull_degenerate:
+        finite = np.isfinite(positions).all(axis=(1, 2))
+
+        # Zero-area or collinear: |e1 x e2| = |e1| |e2| sin(angle)
+        p = positions.astype(np.float64)
+        e1 = p[:, 1] - p[:, 0]
+        e2 = p[:, 2] - p[:, 0]
+        with np.errstate(invalid='ignore', over='ignore'):
+            cross = np.cross(e1, e2)
+            area_sq = np.einsum('ij,ij->i', cross, cross)
+            scale_sq = np.einsum('ij,ij->i', e1, e1) * np.einsum('ij,ij->i', e2, e2)
+            degenerate = finite & ~(area_sq > scale_sq * DEGENERATE_TOLERANCE**2)
+
+    keep = finite & ~degenerate
+
+    outside = np.zeros(len(positions), dtype=bool)
+    if bbox is not None:
+        bbox_min, bbox_max = np.array(bbox, dtype=np.float32)
+        outside = (
+            (positions.max(axis=1) < bbox_min) |
+            (positions.min(axis=1) > bbox_max)
+        ).any(axis=1)
+        outside &= keep
+        keep &= ~outside
+
+    culled = {
+        'non-finite': int(len(positions) - np.count_nonzero(finite)),
+        'degenerate': int(np.count_nonzero(degenerate)),
+        'outside bounds': int(np.count_nonzero(outside)),
+    }
+    return keep, culled
+
+
+def get_morton_codes(points, bits=MORTON_BITS):
+    # Interleaves the bits of the points' cells on a grid of 2**bits
+    # cells per axis over their bounding box, so points close in space
+    # mostly get close codes
+    finite = np.isfinite(points).all(axis=1)
+    if not finite.any():
+        return np.zeros(len(points), dtype=np.uint32)
+    lo = points[finite].min(axis=0)
+    extent = np.maximum(points[finite].max(axis=0) - lo, 1e-6)
+    max_cell = (1 << bits) - 1
+    cells = np.nan_to_num((points - lo) / extent * max_cell)
+    cells = np.clip(cells, 0, max_cell).astype(np.uint32)
+
+    # Spread the bits of each axis out to every third bit
+    cells = (cells | (cells << 16)) & 0x030000FF
+    cells = (cells | (cells << 8)) & 0x0300F00F
+    cells = (cells | (cells << 4)) & 0x030C30C3
+    cells = (cells | (cells << 2)) & 0x09249249
+    return cells[:, 0] | (cells[:, 1] << 1) | (cells[:, 2] << 2)
+
+
+def get_locality_order(positions, face_materials):
+    # Returns the order that sorts triangles by material index, then by
+    # the Morton code of their centroid
+    with np.errstate(invalid='ignore'):
+        centroids = positions.mean(axis=1)
+    codes = get_morton_codes(centroids)
+    return np.lexsort((codes, face_materials)).astype(np.int32)
+
+
+def reorder_corners(values, order):
+    # Puts per-corner values, (num_tris, 3, width) or (num_tris * 3,
+    # width), in the face order. The width is explicit so meshes without
+    # triangles work too.
+    return values.reshape(len(order), 3, values.shape[-1])[order].reshape(values.shape)
+
+
+def get_triangle_keys(tris):
+    # Packs the exact bits of every triangle's positions, UVs and
+    # material key into one opaque value, to compare triangles by
+    key_dtype = np.dtype([
+        ('position', '<f4', (3, 3)),
+        ('uv0', '<f4', (3, 2)),
+        ('uv1', '<f4', (3, 2)),
+        *((name, tris.dtype[name]) for name in MATINFO_FIELDS),
+    ])
+    keys = np.empty(len(tris), dtype=key_dtype)
+    keys['position'] = tris['verts']['position']
+    keys['uv0'] = tris['verts']['uv0']
+    keys['uv1'] = tris['verts']['uv1']
+    for name in MATINFO_FIELDS:
+        keys[name] = tris[name]
+    return keys.view(np.dtype((np.void, key_dtype.itemsize)))
+
+
+def get_unique_triangles(keys, seen=()):
+    # Returns the indices of the first occurrence of every distinct
+    # triangle key (see get_triangle_keys), in order, leaving out the
+    # keys already in seen, a list of sorted key arrays
+    _, first_index = np.unique(keys, return_index=True)
+    first_index = np.sort(first_index)
+    for seen_keys in seen:
+        if len(first_index) == 0 or len(seen_keys) == 0:
+            continue
+        candidates = keys[first_index]
+        found = seen_keys[np.minimum(np.searchsorted(seen_keys, candidates), len(seen_keys) - 1)] == candidates
+        first_index = first_index[~found]
+    return first_index
+
+
+def merge_decoded_chunks(results):
+    # Merges the (tris, culled, material keys) of consecutive chunks.
+    # Material indices are remapped so the keys are in order of first
+    # appearance over all of the chunks, like get_material_keys would
+    # give for the whole.
+    matinfos = []
+    indices = {}
+    face_materials = []
+    culled = {}
+    for tris, chunk_culled, (chunk_matinfos, chunk_face_materials) in results:
+        remap = np.empty(len(chunk_matinfos), dtype=np.int32)
+        for i, matinfo in enumerate(chunk_matinfos):
+            if matinfo not in indices:
+                indices[matinfo] = len(matinfos)
+                matinfos.append(matinfo)
+            remap[i] = indices[matinfo]
+        face_materials.append(remap[chunk_face_materials])
+        for category, count in chunk_culled.items():
+            culled[category] = culled.get(category, 0) + count
+
+    if not results:
+        return np.empty(0, dtype=GLR_TRIANGLE_DTYPE), culled, ([], np.empty(0, dtype=np.int32))
+    tris = np.concatenate([tris for tris, _, _ in results])
+    return tris, culled, (matinfos, np.concatenate(face_materials))
+
+
+def get_material_keys(tris):
+    # Finds the unique material keys of the triangles. Returns the list
+    # of keys, in order of first appearance, and the index into that
+    # list for every triangle.
+    #
+    # The key fields are packed into five u64 columns and lexsorted,
+    # which is much faster than np.unique on a structured array and
+    # doesn't hold the GIL.
+    num_tris = len(tris)
+    if num_tris == 0:
+        return [], np.empty(0, dtype=np.int32)
+
+    small_fields = (
+        tris['geometry_mode'].astype(np.uint64) << np.uint64(32) |
+        tris['tex0_wrapS'].astype(np.uint64) << np.uint64(24) |
+        tris['tex0_wrapT'].astype(np.uint64) << np.uint64(16) |
+        tris['tex1_wrapS'].astype(np.uint64) << np.uint64(8) |
+        tris['tex1_wrapT'].astype(np.uint64)
+    )
+    columns = np.stack([
+        tris['combiner_mux'],
+        tris['other_mode'],
+        tris['tex0_crc'],
+        tris['tex1_crc'],
+        small_fields,
+    ])
+
+    # lexsort is stable, so the first triangle of every run of equal
+    # keys is where the key first appears
+    order = np.lexsort(columns)
+    sorted_columns = columns[:, order]
+    starts = np.ones(num_tris, dtype=bool)
+    starts[1:] = (sorted_columns[:, 1:] != sorted_columns[:, :-1]).any(axis=0)
+    first_index = order[starts]
+
+    # Number the keys by first appearance
+    rank = np.empty(len(first_index), dtype=np.int32)
+    rank[np.argsort(first_index)] = np.arange(len(first_index), dtype=np.int32)
+    face_materials = np.empty(num_tris, dtype=np.int32)
+    face_materials[order] = rank[np.cumsum(starts) - 1]
+
+    first_index = np.sort(first_index)
+    fields = [tris[name][first_index].tolist() for name in MATINFO_FIELDS]
+    matinfos = list(zip(*fields))
+    return matinfos, face_materials
+
+
+# Per-triangle colors that make up the merged Light/Overlay attributes
+MERGED_COLOR_SOURCES = ('Shading', 'Primitive', 'Environment')
+
+
+def get_merged_color_usage(combiner1, combiner2):
+    # Returns how a combiner uses each of MERGED_COLOR_SOURCES, as a
+    # (num sources, 5) bool array. The columns are whether the source's
+    #
+    #   0  color is an a/b/c input of an RGB formula
+    #   1  alpha is an a/b/c input of an RGB formula
+    #   2  alpha is an a/b/c input of an alpha formula
+    #   3  color is the d input of an RGB formula
+    #   4  alpha is the d input of an alpha formula
+    #
+    # a/b/c inputs modulate the texels and go into the Light color, the
+    # d input is added on top and goes into the Overlay color.
+    usage = np.zeros((len(MERGED_COLOR_SOURCES), 5), dtype=bool)
+    for combiner in (combiner1, combiner2):
+        if not combiner:
+            continue
+        rgb, alpha = combiner[:4], combiner[4:]
+        for i, source in enumerate(MERGED_COLOR_SOURCES):
+            usage[i] = usage[i] | (
+                f'{source} Color' in rgb[:3],
+                f'{source} Alpha' in rgb[:3],
+                f'{source} Alpha' in alpha[:3],
+                rgb[3] == f'{source} Color',
+                alpha[3] == f'{source} Alpha',
+            )
+    return usage
+
+
+def get_merged_colors(tris, descs, face_materials):
+    # Computes the Light and Overlay colors of every corner. Light is the
+    # product of the colors a triangle's combiner modulates by, Overlay
+    # the (clamped) sum of the colors it adds. The usage is looked up per
+    # material key, so all triangles sharing one are handled together.
+    num_tris = len(tris)
+    usage = np.array([
+        get_merged_color_usage(desc['combiner1'], desc['combiner2'])
+        for desc in descs
+    ]).reshape(len(descs), len(MERGED_COLOR_SOURCES), 5)
+    usage = usage[face_materials][:, :, None, :]  # per face, broadcast over corners
+
+    sources = (
+        tris['verts']['color'],
+        tris['prim_color'][:, None],
+        tris['env_color'][:, None],
+    )
+
+    light = np.ones((num_tris, 3, 4), dtype=np.float32)
+    overlay = np.zeros((num_tris, 3, 4), dtype=np.float32)
+    for i, colors in enumerate(sources):
+        rgb, alpha = colors[..., :3], colors[..., 3:]
+        used = usage[:, i]
+        light[..., :3] *= np.where(used[..., 0:1], rgb, 1)
+        light[..., :3] *= np.where(used[..., 1:2], alpha, 1)
+        light[..., 3:] *= np.where(used[..., 2:3], alpha, 1)
+        overlay[..., :3] += np.where(used[..., 3:4], rgb, 0)
+        overlay[..., 3:] += np.where(used[..., 4:5], alpha, 0)
+    np.clip(overlay, 0, 1, out=overlay)
+
+    return light, overlay
+
+
+# Registry of the current import, see get_material_registry
+_material_registry = None
+
+
+def get_material_registry(rebuild=False, library_path=''):
+    # Returns the registry of imported materials. It's rebuilt once at
+    # the start of every import (materials may have been deleted or
+    # another .blend loaded in the meantime) and then kept up to date.
+    global _material_registry
+    if rebuild or _material_registry is None:
+        _material_registry = MaterialRegistry(library_path)
+    return _material_registry
+
+
+class MaterialRegistry:
+    # Maps the structural key of every imported material (its canonical
+    # RDP setup and textures) to the material. Unlike the display name,
+    # the key tells apart materials that only differ in combiner or
+    # blender modes.
+
+    def __init__(self, library_path=''):
+        self.materials = {}
+        for mat in bpy.data.materials:
+            key = mat.get(MATERIAL_KEY_PROP)
+            if key is not None:
+                self.materials.setdefault(key, mat)
+        self.library = MaterialLibrary(bpy.path.abspath(library_path)) if library_path else None
+
+    def get(self, key):
+        return self.materials.get(key)
+
+    def add(self, key, mat, built=False):
+        mat[MATERIAL_KEY_PROP] = key
+        self.materials[key] = mat
+        if built and self.library is not None:
+            self.library.add(mat)
+
+    def prefetch(self, keys_and_names):
+        # Brings in the materials for the (key, display name) pairs that
+        # aren't here yet but are in the library
+        if self.library is None:
+            return
+        missing = [(key, name) for key, name in keys_and_names if key not in self.materials]
+        if missing:
+            self.materials.update(self.library.append(missing))
+
+    def save_library(self):
+        if self.library is not None:
+            self.library.save()
+
+
+def get_preview_material(crc):
+    # Flat, viewport-only material for previews. Each texture gets its
+    # own (stable) color so the layout of the scene can be made out.
+    name = f'PREVIEW {crc:016X}' if crc != 0 else 'PREVIEW NO_TEXTURE'
+    registry = get_material_registry()
+    mat = registry.get(repr(('PREVIEW', crc)))
+    if mat is None:
+        mat = bpy.data.materials.new(name)
+        registry.add(repr(('PREVIEW', crc)), mat)
+        if crc != 0:
+            hue = ((crc * 0x9E3779B97F4A7C15) >> 40 & 0xFFFF) / 0xFFFF
+            mat.diffuse_color = (*colorsys.hsv_to_rgb(hue, 0.5, 0.9), 1.0)
+        else:
+            mat.diffuse_color = (0.8, 0.8, 0.8, 1.0)
+    return mat
+
+
 # Imported materials are supposed to perform (highly simplified) high
 # level emulation of the N64's RDP pixel shader pipeline.
 #
@@ -406,12 +1468,11 @@ def setup_n64_material(
     links = mat.node_tree.links
     nodes.clear()
 
-    # Gather all input sources the RDP will need
+    # Gather all input sources the RDP will need. The blender inputs
+    # aren't wired to anything yet, so they don't need nodes.
     sources = set()
     sources.update(combiner1)
     sources.update(combiner2 or [])
-    sources.update(blender1)
-    sources.update(blender2 or [])
 
     # TODO: node positions needs a loooot of work
     x, y = 200, 100
@@ -440,7 +1501,7 @@ def setup_n64_material(
 
     # Skip the 2nd cycle if it does nothing; two-cycle mode is probably
     # only enabled for a blender effect.
-    if combiner2 == ('0', '0', '0', 'Combined Color', '0', '0', '0', 'Combined Alpha'):
+    if combiner2 == PASSTHROUGH_COMBINER:
         combiner2 = None
 
     if combiner2:
@@ -504,6 +1565,175 @@ def setup_n64_material(
     mat['n64:06 2nd Blender'] = show_blender_formula(*blender2) if blender2 else ''
 
 
+# Custom property of a placeholder material, holding the arguments of
+# setup_n64_material (as JSON) to build the full material from
+DEFERRED_SETUP_PROP = 'glr:Deferred Setup'
+
+# Number of placeholder materials realized per step of the background
+# timer, and the time between steps (in seconds)
+REALIZE_BATCH_SIZE = 16
+REALIZE_INTERVAL = 0.1
+
+
+def setup_placeholder_material(
+    mat,
+    combiner1, combiner2,
+    blender1, blender2,
+    tex0, tex1,
+    cull_backfacing,
+    show_alpha,
+):
+    # Cheap stand-in for setup_n64_material: just texture 0 (or the
+    # shading color if there's no texture) straight into the output.
+    # The arguments are kept on the material for realize_material.
+    mat.shadow_method = 'NONE'
+    mat.blend_method = 'OPAQUE'
+    mat.use_backface_culling = cull_backfacing
+
+    mat.use_nodes = True
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    nodes.clear()
+
+    if tex0['filepath']:
+        node = make_texture_node(mat, tex0, 0, location=(-200, 0))
+    else:
+        node = nodes.new('ShaderNodeVertexColor')
+        node.location = -200, 0
+        node.layer_name = 'Shading'
+        node.name = node.label = 'Shading'
+
+    node_out = nodes.new('ShaderNodeOutputMaterial')
+    node_out.location = 200, 0
+    links.new(node.outputs[0], node_out.inputs[0])
+
+    mat[DEFERRED_SETUP_PROP] = json.dumps([
+        combiner1, combiner2,
+        blender1, blender2,
+        tex0, tex1,
+        cull_backfacing,
+        show_alpha,
+    ])
+
+
+def realize_material(mat):
+    # Replaces a placeholder material's nodes with the full setup.
+    # Returns whether it was a placeholder.
+    setup = mat.get(DEFERRED_SETUP_PROP)
+    if setup is None:
+        return False
+    (
+        combiner1, combiner2,
+        blender1, blender2,
+        tex0, tex1,
+        cull_backfacing,
+        show_alpha,
+    ) = json.loads(setup)
+
+    def to_tuple(value):
+        return tuple(value) if value is not None else None
+
+    setup_n64_material(
+        mat,
+        to_tuple(combiner1), to_tuple(combiner2),
+        to_tuple(blender1), to_tuple(blender2),
+        tex0, tex1,
+        cull_backfacing=cull_backfacing,
+        show_alpha=show_alpha,
+    )
+    del mat[DEFERRED_SETUP_PROP]
+
+    # Built now, so it can go in the material library (saved by whoever
+    # realized it, see save_library)
+    key = mat.get(MATERIAL_KEY_PROP)
+    if key is not None:
+        get_material_registry().add(key, mat, built=True)
+    return True
+
+
+def get_placeholder_materials():
+    return [mat for mat in bpy.data.materials if DEFERRED_SETUP_PROP in mat]
+
+
+# Names of the placeholder materials realize_materials_step has yet to
+# build. Names rather than materials, since a material may be deleted
+# before its turn comes.
+_placeholder_queue = deque()
+
+
+def realize_materials_step():
+    # bpy.app.timers callback realizing the queued placeholder materials
+    # a few at a time, so Blender stays responsive. Returns None to stop
+    # once the queue is empty, after adding the built materials to the
+    # material library.
+    for _ in range(min(REALIZE_BATCH_SIZE, len(_placeholder_queue))):
+        mat = bpy.data.materials.get(_placeholder_queue.popleft())
+        if mat is not None:
+            realize_material(mat)
+    if _placeholder_queue:
+        return REALIZE_INTERVAL
+    get_material_registry().save_library()
+    return None
+
+
+def start_realizing_materials():
+    # Queues every placeholder not queued yet, and starts the timer
+    queued = set(_placeholder_queue)
+    _placeholder_queue.extend(mat.name for mat in get_placeholder_materials() if mat.name not in queued)
+    if _placeholder_queue and not bpy.app.timers.is_registered(realize_materials_step):
+        bpy.app.timers.register(realize_materials_step, first_interval=REALIZE_INTERVAL)
+
+
+# A color combiner cycle that outputs its input unchanged
+PASSTHROUGH_COMBINER = ('0', '0', '0', 'Combined Color', '0', '0', '0', 'Combined Alpha')
+
+# A combiner formula whose output is a constant 0
+ZERO_FORMULA = ('0', '0', '0', '0')
+
+
+def canonicalize_rdp_setup(combiner1, combiner2, blender1, blender2):
+    # Reduces a decoded combiner/blender setup to the parts that affect
+    # the material setup_n64_material builds, so that setups which only
+    # differ in unused inputs compare equal. Returns the simplified
+    # (combiner1, combiner2, alpha_blend).
+    #
+    # Of the blender only whether the last cycle reads the framebuffer
+    # (ie. alpha blends) is currently used.
+
+    last_blender = blender2 or blender1
+    alpha_blend = 'Framebuffer Color' in last_blender
+
+    # The final color is always used, the final alpha only for blending
+    need_color, need_alpha = True, alpha_blend
+
+    if combiner2:
+        combiner2 = simplify_combiner_cycle(combiner2, need_color, need_alpha)
+        if combiner2[:4] == PASSTHROUGH_COMBINER[:4] and combiner2[4:] in (PASSTHROUGH_COMBINER[4:], ZERO_FORMULA):
+            combiner2 = None
+        else:
+            need_color = 'Combined Color' in combiner2
+            need_alpha = 'Combined Alpha' in combiner2
+
+    combiner1 = simplify_combiner_cycle(combiner1, need_color, need_alpha)
+
+    return combiner1, combiner2, alpha_blend
+
+
+def simplify_combiner_cycle(combiner, need_color, need_alpha):
+    # Simplifies one combiner cycle. Outputs that aren't needed are
+    # replaced with a constant 0.
+    color = simplify_combiner_formula(*combiner[:4]) if need_color else ZERO_FORMULA
+    alpha = simplify_combiner_formula(*combiner[4:]) if need_alpha else ZERO_FORMULA
+    return (*color, *alpha)
+
+
+def simplify_combiner_formula(a, b, c, d):
+    # (a - b) * c + d is just d if a and b cancel or c is 0
+    if a == b or c == '0':
+        a = b = c = '0'
+    return a, b, c, d
+
+
 def connect_input(mat, input, socket):
     # Connects input -> socket
     # Input can be either an output socket or a constant
@@ -534,11 +1764,15 @@ def make_rdp_input_nodes(mat, sources, tex0, tex1, location):
     for i in range(2):
         tex = tex0 if i == 0 else tex1
         if f'Texel {i} Color' in sources or f'Texel {i} Alpha' in sources:
-            if tex['crc'] != 0:
+            if tex['filepath']:
                 node = make_texture_node(mat, tex, i, location=(x, y))
                 y -= 300
-            input_map[f'Texel {i} Color'] = node.outputs['Color']
-            input_map[f'Texel {i} Alpha'] = node.outputs['Alpha']
+                input_map[f'Texel {i} Color'] = node.outputs['Color']
+                input_map[f'Texel {i} Alpha'] = node.outputs['Alpha']
+            else:
+                # No texture loaded, read it as white
+                input_map[f'Texel {i} Color'] = 1.0
+                input_map[f'Texel {i} Alpha'] = 1.0
 
     # Vertex Color inputs
     for vc in ['Shading', 'Primitive', 'Environment', 'Blend', 'Fog']:
@@ -575,6 +1809,9 @@ def make_rdp_input_nodes(mat, sources, tex0, tex1, location):
 
 
 def load_image(filepath):
+    image = texture_proxy.load_proxy_image(filepath)
+    if image is not None:
+        return image
     try:
         image = bpy.data.images.load(filepath, check_existing=True)
     except Exception:
@@ -610,69 +1847,20 @@ def make_texture_node(mat, tex, tex_num, location):
     elif wrapS == wrapT == 'Clamp':
         node_tex.extension = 'EXTEND'
     else:
-        # Use math nodes to emulate other wrap modes
+        # Use a node group to emulate other wrap modes. There's one
+        # group per wrap mode combination, shared by every material.
 
         node_tex.extension = 'EXTEND'
 
-        frame = nodes.new('NodeFrame')
-        frame.label = f'{wrapS} ({wrapS[0]}) x {wrapT} ({wrapT[0]})'
-
-        # Combine XYZ
-        node_com = nodes.new('ShaderNodeCombineXYZ')
-        node_com.parent = frame
-        node_com.location = x - 80, y - 110
-        links.new(uv_socket, node_com.outputs[0])
-        u_socket = node_com.inputs[0]
-        v_socket = node_com.inputs[1]
-
-        x -= 120
-
-        for i in [0, 1]:
-            wrap = wrapS if i == 0 else wrapT
-            socket = node_com.inputs[i]
-
-            if wrap == 'Repeat':
-                node_math = nodes.new('ShaderNodeMath')
-                node_math.parent = frame
-                node_math.location = x - 140, y + 30 - i*200
-                node_math.operation = 'WRAP'
-                node_math.inputs[1].default_value = 0
-                node_math.inputs[2].default_value = 1
-                links.new(socket, node_math.outputs[0])
-                socket = node_math.inputs[0]
-
-            elif wrap == 'Mirror':
-                node_math = nodes.new('ShaderNodeMath')
-                node_math.parent = frame
-                node_math.location = x - 140, y + 30 - i*200
-                node_math.operation = 'PINGPONG'
-                node_math.inputs[1].default_value = 1
-                links.new(socket, node_math.outputs[0])
-                socket = node_math.inputs[0]
+        node_wrap = nodes.new('ShaderNodeGroup')
+        node_wrap.node_tree = get_wrap_group(wrapS, wrapT)
+        node_wrap.label = f'{wrapS} ({wrapS[0]}) x {wrapT} ({wrapT[0]})'
+        node_wrap.width = 180
+        node_wrap.location = x - 120, y - 70
+        links.new(uv_socket, node_wrap.outputs[0])
+        uv_socket = node_wrap.inputs[0]
 
-            else:
-                # Clamp doesn't require a node since the default on the
-                # Texture node is EXTEND.
-                # Adjust node location for aesthetics though.
-                if i == 0:
-                    node_com.location[1] += 90
-
-            if i == 0:
-                u_socket = socket
-            else:
-                v_socket = socket
-
-        x -= 180
-
-        # Separate XYZ
-        node_sep = nodes.new('ShaderNodeSeparateXYZ')
-        node_sep.parent = frame
-        node_sep.location = x - 140, y - 100
-        links.new(u_socket, node_sep.outputs[0])
-        links.new(v_socket, node_sep.outputs[1])
-        uv_socket = node_sep.inputs[0]
-
-        x -= 180
+        x -= 240
 
     # UVMap node
     node_uv = nodes.new('ShaderNodeUVMap')
@@ -784,6 +1972,70 @@ def create_combiner_group():
     return group
 
 
+def get_wrap_group(wrapS, wrapT):
+    name = f'RDP Texture Wrap {wrapS} x {wrapT}'
+    if name not in bpy.data.node_groups:
+        create_wrap_group(name, wrapS, wrapT)
+    return bpy.data.node_groups[name]
+
+
+def create_wrap_group(name, wrapS, wrapT):
+    # Creates a node group that applies the wrap modes to a UV vector.
+    #
+    #   Repeat: U = wrap(U, 0, 1)
+    #   Mirror: U = pingpong(U, 1)
+    #   Clamp:  U is passed through, the Texture node uses EXTEND
+    #
+    # Used for any wrap mode combination that can't be done with the
+    # Texture node's extension setting alone.
+
+    group = bpy.data.node_groups.new(name, 'ShaderNodeTree')
+    nodes = group.nodes
+    links = group.links
+
+    group.inputs.new('NodeSocketVector', 'UV')
+    group.outputs.new('NodeSocketVector', 'UV')
+
+    node_input = nodes.new('NodeGroupInput')
+    node_sep = nodes.new('ShaderNodeSeparateXYZ')
+    node_com = nodes.new('ShaderNodeCombineXYZ')
+    node_output = nodes.new('NodeGroupOutput')
+
+    node_input.location = -500, 0
+    node_sep.location = -320, 0
+    node_com.location = 120, 0
+    node_output.location = 300, 0
+
+    links.new(node_input.outputs[0], node_sep.inputs[0])
+
+    for i in [0, 1]:
+        wrap = wrapS if i == 0 else wrapT
+        socket = node_sep.outputs[i]
+
+        if wrap == 'Repeat':
+            node_math = nodes.new('ShaderNodeMath')
+            node_math.location = -120, 100 - i*200
+            node_math.operation = 'WRAP'
+            node_math.inputs[1].default_value = 0
+            node_math.inputs[2].default_value = 1
+            links.new(socket, node_math.inputs[0])
+            socket = node_math.outputs[0]
+
+        elif wrap == 'Mirror':
+            node_math = nodes.new('ShaderNodeMath')
+            node_math.location = -120, 100 - i*200
+            node_math.operation = 'PINGPONG'
+            node_math.inputs[1].default_value = 1
+            links.new(socket, node_math.inputs[0])
+            socket = node_math.outputs[0]
+
+        links.new(socket, node_com.inputs[i])
+
+    links.new(node_com.outputs[0], node_output.inputs[0])
+
+    return group
+
+
 def show_combiner_formula(a, b, c, d):
     # Formats (a-b)*c+d as a human readable string
 
@@ -0,0 +1,138 @@
+import os
+import re
+import hashlib
+import bpy
+
+# Custom property holding the structural key of an imported material
+MATERIAL_KEY_PROP = 'glr:Material Key'
+
+# Materials in the library are named after a hash of their structural
+# key, since custom properties can't be read before appending
+LIBRARY_NAME_PREFIX = 'GLR '
+
+# Suffix Blender adds to a datablock whose name is taken
+DUPLICATE_SUFFIX = re.compile(r'\.\d{3}$')
+
+
+def get_library_name(key):
+    return LIBRARY_NAME_PREFIX + hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+class MaterialLibrary:
+    # A .blend file of prebuilt materials (with the combiner and wrap node
+    # groups they use), keyed by structural key. Materials are appended
+    # from it instead of being built, and the ones built during an import
+    # are added to it afterwards.
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.names = set()  # library names of the materials in the file
+        self.new_materials = []  # built during this import
+
+        if not os.path.isfile(filepath):
+            return
+        node_groups_before = set(bpy.data.node_groups)
+        with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
+            self.names = set(data_from.materials)
+            # The shared node groups are cheap, bring in any missing ones
+            data_to.node_groups = [name for name in data_from.node_groups if name not in bpy.data.node_groups]
+        merge_duplicates(node_groups_before)
+
+    def append(self, keys_and_names):
+        # Appends the materials for the (key, display name) pairs that are
+        # in the library, all in one go. Returns them keyed by key.
+        wanted = {get_library_name(key): (key, name) for key, name in keys_and_names}
+        wanted = {lib_name: wanted[lib_name] for lib_name in wanted if lib_name in self.names}
+        if not wanted:
+            return {}
+
+        node_groups_before = set(bpy.data.node_groups)
+        images_before = set(bpy.data.images)
+        with bpy.data.libraries.load(self.filepath, link=False) as (data_from, data_to):
+            data_to.materials = list(wanted)
+        merge_duplicates(node_groups_before, images_before)
+
+        materials = {}
+        for lib_name, mat in zip(wanted, data_to.materials):
+            if mat is not None:
+                key, mat.name = wanted[lib_name]
+                mat.use_fake_user = False
+                materials[key] = mat
+        return materials
+
+    def add(self, mat):
+        self.new_materials.append(mat)
+
+    def save(self):
+        # Writes the library again with the new materials added.
+        # libraries.write replaces the whole file, so materials already in
+        # it that weren't used by this import are appended to be written
+        # out again, then removed.
+        if not self.new_materials:
+            return
+
+        blocks = set(self.new_materials)
+        for mat in bpy.data.materials:
+            if MATERIAL_KEY_PROP in mat and get_library_name(mat[MATERIAL_KEY_PROP]) in self.names:
+                blocks.add(mat)
+        missing = self.names - {get_library_name(mat[MATERIAL_KEY_PROP]) for mat in blocks}
+
+        node_groups_before = set(bpy.data.node_groups)
+        images_before = set(bpy.data.images)
+        temp = []
+        if missing:
+            with bpy.data.libraries.load(self.filepath, link=False) as (data_from, data_to):
+                data_to.materials = list(missing)
+            temp = [mat for mat in data_to.materials if mat is not None]
+            merge_duplicates(node_groups_before, images_before)
+        blocks.update(temp)
+
+        # Written out under their library names
+        names = {mat: mat.name for mat in blocks}
+        for mat in blocks:
+            mat.name = get_library_name(mat[MATERIAL_KEY_PROP])
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+            bpy.data.libraries.write(self.filepath, blocks, fake_user=True, path_remap='ABSOLUTE')
+        except OSError as e:
+            print('Could not write material library:', e)
+        else:
+            self.names.update(mat.name for mat in blocks)
+            self.new_materials = []
+        finally:
+            for mat, name in names.items():
+                mat.name = name
+
+        for mat in temp:
+            bpy.data.materials.remove(mat)
+        remove_unused(bpy.data.node_groups, node_groups_before)
+        remove_unused(bpy.data.images, images_before)
+
+
+def merge_duplicates(node_groups_before, images_before=()):
+    # Appending brings in a second copy of node groups and images that
+    # already exist, remap their users to the existing ones
+    for group in list(bpy.data.node_groups):
+        if group in node_groups_before or not DUPLICATE_SUFFIX.search(group.name):
+            continue
+        existing = bpy.data.node_groups.get(group.name[:-4])
+        if existing is not None and existing in node_groups_before:
+            group.user_remap(existing)
+            bpy.data.node_groups.remove(group)
+
+    if not images_before:
+        return
+    by_path = {image.filepath: image for image in images_before if image.filepath}
+    for image in list(bpy.data.images):
+        if image in images_before:
+            continue
+        existing = by_path.get(image.filepath)
+        if existing is not None:
+            image.user_remap(existing)
+            bpy.data.images.remove(image)
+
+
+def remove_unused(collection, before):
+    for item in list(collection):
+        if item not in before and item.users == 0:
+            collection.remove(item)
@@ -0,0 +1,94 @@
+import sys
+
+# Rough number of bytes needed per imported triangle in each phase of an
+# import, estimated from the sizes of the arrays and of Blender's mesh
+# and bmesh structs. They're only meant to be good enough to pick a part
+# size.
+#
+# Decoding: the triangle record plus the position/color/UV arrays built
+# from it, including the temporaries of the culling pass.
+DECODE_BYTES_PER_TRI = 264 + 450
+# The finished mesh: vertices, edges, loops, faces and the attributes.
+MESH_BYTES_PER_TRI = 300
+# Each extra color attribute (Light/Overlay) on the finished mesh.
+COLOR_LAYER_BYTES_PER_TRI = 12
+# Merging doubles: the bmesh copy of the mesh.
+WELD_BYTES_PER_TRI = 800
+# Merging captures: the key of every triangle kept, to find the ones
+# repeated across captures (see get_triangle_keys).
+DEDUP_BYTES_PER_TRI = 124
+
+# Parts are never made smaller than this, even if the budget can't be met
+MIN_PART_TRIS = 65536
+
+MB = 1024 * 1024
+
+
+def estimate_peak_memory(num_tris, part_tris, num_color_layers, merge_doubles, merge_captures=False, undo=True):
+    # Estimates the peak memory (in bytes) of importing num_tris
+    # triangles, part_tris at a time. Finished meshes stay resident, while
+    # decoding and welding only need memory for the part in progress.
+    # Undo keeps another copy of the finished meshes. Merging captures
+    # keeps the key of every triangle until the end.
+    mesh_bytes = MESH_BYTES_PER_TRI + COLOR_LAYER_BYTES_PER_TRI * num_color_layers
+    part_bytes = DECODE_BYTES_PER_TRI
+    if merge_doubles:
+        part_bytes = max(part_bytes, WELD_BYTES_PER_TRI)
+    resident = num_tris * mesh_bytes * (2 if undo else 1)
+    if merge_captures:
+        resident += num_tris * DEDUP_BYTES_PER_TRI
+    return resident + min(part_tris, num_tris) * part_bytes
+
+
+def get_part_size(num_tris, budget, num_color_layers, merge_doubles, merge_captures=False):
+    # Returns how many triangles to import per object to stay under a
+    # memory budget (in bytes), or num_tris if no split is needed.
+    if budget <= 0 or estimate_peak_memory(num_tris, num_tris, num_color_layers, merge_doubles, merge_captures) <= budget:
+        return num_tris
+    resident = estimate_peak_memory(num_tris, 0, num_color_layers, merge_doubles, merge_captures)
+    part_bytes = max(DECODE_BYTES_PER_TRI, WELD_BYTES_PER_TRI if merge_doubles else 0)
+    part_tris = (budget - resident) // part_bytes
+    return min(num_tris, max(MIN_PART_TRIS, part_tris))
+
+
+def get_peak_rss():
+    # Returns the peak resident memory of the process in bytes, or None
+    # if it can't be measured on this platform
+    if sys.platform == 'win32':
+        return get_peak_rss_windows()
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_peak_rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+    except (AttributeError, OSError):
+        return None
+    return counters.PeakWorkingSetSize
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Custom property of an object listing the names of its meshes, full
+# detail first, then one per LOD level
+LOD_MESHES_PROP = 'glr:LOD Meshes'
+
+# Custom property of an object holding the LOD level it shows
+LOD_LEVEL_PROP = 'glr:LOD'
+
+
+def get_cell_size(positions, resolution):
+    # Size of the grid cells, so that there are resolution of them along
+    # the longest side of the triangles' bounding box
+    finite = positions[np.isfinite(positions).all(axis=(1, 2))]
+    if len(finite) == 0:
+        return 1.0
+    extent = finite.reshape(-1, 3).max(axis=0) - finite.reshape(-1, 3).min(axis=0)
+    return max(float(extent.max()) / resolution, 1e-6)
+
+
+def cluster_vertices(positions, face_materials, cell_size):
+    # Simplifies triangles by vertex clustering: the corners are snapped
+    # to a uniform grid, the corners in each cell become one vertex at
+    # their average position, and triangles that collapse (two corners in
+    # the same cell) or end up repeated are dropped. Cells are split by
+    # material so no vertex is shared between materials and every
+    # remaining triangle keeps its own material and corner attributes.
+    #
+    # Takes the (num_tris, 3, 3) positions and the material index of
+    # every triangle. Returns the (num_verts, 3) vertex positions, the
+    # (num_kept, 3) vertex indices of the remaining triangles, and their
+    # indices into the input.
+    finite = np.isfinite(positions).all(axis=(1, 2))
+    tri_indices = np.flatnonzero(finite)
+    corners = positions[tri_indices].reshape(-1, 3)
+    if len(corners) == 0:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int32), tri_indices
+
+    # One key per (cell, material)
+    cells = np.floor((corners - corners.min(axis=0)) / cell_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    materials = np.repeat(face_materials[tri_indices].astype(np.int64), 3)
+    keys = ((materials * dims[2] + cells[:, 2]) * dims[1] + cells[:, 1]) * dims[0] + cells[:, 0]
+    _, cluster, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    cluster = cluster.ravel()
+
+    verts = np.zeros((len(counts), 3), dtype=np.float64)
+    np.add.at(verts, cluster, corners)
+    verts /= counts[:, None]
+
+    # Drop collapsed triangles
+    tri_verts = cluster.reshape(-1, 3)
+    keep = (
+        (tri_verts[:, 0] != tri_verts[:, 1]) &
+        (tri_verts[:, 1] != tri_verts[:, 2]) &
+        (tri_verts[:, 2] != tri_verts[:, 0])
+    )
+    tri_verts = tri_verts[keep]
+    tri_indices = tri_indices[keep]
+
+    # Drop repeated triangles, comparing them rotated to start at their
+    # lowest vertex so the winding is kept
+    shift = np.argmin(tri_verts, axis=1)
+    rotated = tri_verts[np.arange(len(tri_verts))[:, None], (shift[:, None] + np.arange(3)) % 3]
+    _, first = np.unique(rotated, axis=0, return_index=True)
+    first = np.sort(first)
+
+    # Only keep the vertices still used, in order
+    tri_verts = tri_verts[first]
+    used, tri_verts = np.unique(tri_verts, return_inverse=True)
+    return (
+        verts[used].astype(np.float32),
+        tri_verts.reshape(-1, 3).astype(np.int32),
+        tri_indices[first],
+    )
@@ -0,0 +1,250 @@
+import os
+import numpy as np
+from .glr_format import (
+    GLR_TRIANGLE_DTYPE,
+    read_header,
+    get_expected_file_size,
+    get_positions,
+    is_compressed,
+    is_glr_filename,
+    iter_triangle_chunks,
+    open_glr,
+)
+
+# Number of triangle records looked at at once by the texture scan
+SCAN_CHUNK_SIZE = 1 << 20
+
+# Catalogue of scanned captures, keyed by file path. An entry is reused
+# for as long as the file's mtime and size stay the same, so redrawing
+# the capture list for a folder of hundreds of captures stays cheap.
+_catalogue = {}
+
+# Entries of the last directory listed by get_directory_catalogue, as
+# (directory, directory mtime, entries)
+_directory_catalogue = None
+
+
+def scan_glr(filepath):
+    # Returns the catalogue entry for a glr file, reading only its
+    # header if the file changed since it was last scanned.
+    st = os.stat(filepath)
+    cached = _catalogue.get(filepath)
+    if cached is not None and cached['mtime'] == st.st_mtime and cached['size'] == st.st_size:
+        return cached
+
+    entry = {
+        'filepath': filepath,
+        'name': os.path.basename(filepath),
+        'mtime': st.st_mtime,
+        'size': st.st_size,
+        'romname': '',
+        'version': 0,
+        'num_tris': 0,
+        'microcode': 0,
+        'expected_size': 0,
+        'compressed': is_compressed(filepath),
+        'truncated': False,
+        'error': '',
+    }
+
+    try:
+        with open_glr(filepath, background=False) as fb:
+            header = read_header(fb)
+    except (OSError, EOFError, RuntimeError) as e:
+        entry['error'] = str(e)
+    else:
+        entry.update(header)
+        # The size of a compressed capture can't be checked without
+        # decompressing all of it, it's caught while importing instead
+        if not entry['compressed']:
+            entry['expected_size'] = get_expected_file_size(header['num_tris'])
+            entry['truncated'] = st.st_size < entry['expected_size']
+        if header['version'] != 2:
+            entry['error'] = f'Unsupported glr version ({header["version"]})'
+
+    _catalogue[filepath] = entry
+    return entry
+
+
+def scan_directory(dir_name):
+    # Returns the catalogue entries for every capture in a directory
+    entries = []
+    try:
+        dir_entries = list(os.scandir(dir_name))
+    except OSError:
+        return entries
+    for dir_entry in dir_entries:
+        if is_glr_filename(dir_entry.name) and dir_entry.is_file():
+            try:
+                entries.append(scan_glr(dir_entry.path))
+            except OSError:
+                pass
+    return entries
+
+
+def get_directory_catalogue(dir_name, refresh=False):
+    # scan_directory for panels that redraw often. The listing is only
+    # redone when the directory's mtime changes (a capture was added,
+    # removed or renamed) or refresh is set, so a redraw costs one stat.
+    global _directory_catalogue
+    try:
+        mtime = os.stat(dir_name).st_mtime_ns
+    except OSError:
+        return []
+    cached = _directory_catalogue
+    if refresh or cached is None or cached[0] != dir_name or cached[1] != mtime:
+        cached = _directory_catalogue = (dir_name, mtime, scan_directory(dir_name))
+    return cached[2]
+
+
+def sort_catalogue(entries, sort_by='NAME', game='', min_tris=0):
+    # Filters catalogue entries by ROM name and triangle count, then
+    # sorts them by 'NAME', 'GAME' or 'TRIS' (largest first).
+    game = game.lower()
+    entries = [
+        entry for entry in entries
+        if game in entry['romname'].lower() and entry['num_tris'] >= min_tris
+    ]
+    if sort_by == 'GAME':
+        entries.sort(key=lambda entry: (entry['romname'].lower(), entry['name'].lower()))
+    elif sort_by == 'TRIS':
+        entries.sort(key=lambda entry: (-entry['num_tris'], entry['name'].lower()))
+    else:
+        entries.sort(key=lambda entry: entry['name'].lower())
+    return entries
+
+
+def scan_textures(filepath, bboxes=False):
+    # Builds a histogram of how many triangles use each texture CRC,
+    # striding over the tex0_crc/tex1_crc fields of a memory map of the
+    # triangle records (compressed captures are streamed through instead).
+    # Nothing else is decoded unless bboxes is set, in
+    # which case the positions are read too for a bounding box of the
+    # triangles using each CRC as texture 0.
+    #
+    # Returns a list of dicts sorted by texture 0 usage, largest first.
+    entry = scan_glr(filepath)
+    if entry['error'] or entry['truncated']:
+        raise RuntimeError(f'{entry["name"]}: {entry["error"] or "truncated capture"}')
+
+    cached = entry.get('textures')
+    if cached is not None and (cached['bboxes'] or not bboxes):
+        return cached['usage']
+
+    usage = {}
+
+    def get_usage(crc):
+        if crc not in usage:
+            usage[crc] = {
+                'crc': crc,
+                'tex0_tris': 0,
+                'tex1_tris': 0,
+                'bbox_min': None,
+                'bbox_max': None,
+            }
+        return usage[crc]
+
+    for chunk in iter_triangle_chunks(filepath, entry['num_tris'], SCAN_CHUNK_SIZE):
+        crcs, inverse, counts = np.unique(chunk['tex0_crc'], return_inverse=True, return_counts=True)
+        for crc, count in zip(crcs.tolist(), counts.tolist()):
+            get_usage(crc)['tex0_tris'] += count
+
+        if bboxes:
+            inverse = inverse.ravel()
+            positions = get_positions(chunk)
+            order = np.argsort(inverse, kind='stable')
+            starts = np.searchsorted(inverse[order], np.arange(len(crcs)))
+            # fmin/fmax so stray NaN vertices don't poison the boxes
+            chunk_min = np.fmin.reduceat(np.fmin.reduce(positions, axis=1)[order], starts, axis=0)
+            chunk_max = np.fmax.reduceat(np.fmax.reduce(positions, axis=1)[order], starts, axis=0)
+            for crc, bbox_min, bbox_max in zip(crcs.tolist(), chunk_min, chunk_max):
+                tex = usage[crc]
+                if tex['bbox_min'] is None:
+                    tex['bbox_min'], tex['bbox_max'] = bbox_min, bbox_max
+                else:
+                    tex['bbox_min'] = np.fmin(tex['bbox_min'], bbox_min)
+                    tex['bbox_max'] = np.fmax(tex['bbox_max'], bbox_max)
+
+        crcs, counts = np.unique(chunk['tex1_crc'], return_counts=True)
+        for crc, count in zip(crcs.tolist(), counts.tolist()):
+            if crc != 0:
+                get_usage(crc)['tex1_tris'] += count
+
+    usage = sorted(usage.values(), key=lambda tex: (-tex['tex0_tris'], -tex['tex1_tris'], tex['crc']))
+    for tex in usage:
+        if tex['bbox_min'] is not None:
+            tex['bbox_min'] = tuple(tex['bbox_min'].tolist())
+            tex['bbox_max'] = tuple(tex['bbox_max'].tolist())
+
+    entry['textures'] = {'bboxes': bboxes, 'usage': usage}
+    return usage
+
+
+def get_filter_name(crc):
+    # Name of a texture CRC as used in the texture filter list
+    return f'{crc:016X}' if crc != 0 else 'NO_TEXTURE'
+
+
+def sample_triangles(filepath, count, sampling='STRIDE'):
+    # Picks up to count triangle records out of a capture without
+    # decoding the others, for a quick preview import. Sampling is one of
+    #
+    #   'STRIDE'   evenly spaced through the file
+    #   'RANDOM'   uniformly at random (repeatable)
+    #   'LARGEST'  the triangles with the largest area
+    #
+    # Returns the sampled records in file order.
+    entry = scan_glr(filepath)
+    if entry['error'] or entry['truncated']:
+        raise RuntimeError(f'{entry["name"]}: {entry["error"] or "truncated capture"}')
+    num_tris = entry['num_tris']
+    count = min(count, num_tris)
+
+    if sampling == 'LARGEST':
+        indices = get_largest_triangles(filepath, num_tris, count)
+    elif sampling == 'RANDOM':
+        # Drawing with replacement avoids a permutation of the whole
+        # file, the few repeats are dropped
+        rng = np.random.RandomState(0)
+        indices = np.unique(rng.randint(0, num_tris, size=count)) if count else np.empty(0, dtype=np.int64)
+    else:
+        indices = np.unique(np.linspace(0, num_tris - 1, count).astype(np.int64))
+
+    return read_triangles(filepath, indices)
+
+
+def read_triangles(filepath, indices):
+    # Reads the triangle records at the given sorted indices. Through a
+    # memory map only the pages holding them are touched.
+    entry = scan_glr(filepath)
+    parts = []
+    start = 0
+    for chunk in iter_triangle_chunks(filepath, entry['num_tris'], SCAN_CHUNK_SIZE):
+        lo, hi = np.searchsorted(indices, [start, start + len(chunk)])
+        if hi > lo:
+            parts.append(np.array(chunk[indices[lo:hi] - start]))
+        start += len(chunk)
+    if not parts:
+        return np.empty(0, dtype=GLR_TRIANGLE_DTYPE)
+    return np.concatenate(parts)
+
+
+def get_largest_triangles(filepath, num_tris, count):
+    # Returns the sorted indices of the count largest triangles. Only
+    # the positions are read.
+    best_areas = np.empty(0, dtype=np.float32)
+    best_indices = np.empty(0, dtype=np.int64)
+    start = 0
+    for chunk in iter_triangle_chunks(filepath, num_tris, SCAN_CHUNK_SIZE):
+        p = chunk['verts']['position']
+        with np.errstate(invalid='ignore', over='ignore'):
+            areas = np.linalg.norm(np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]), axis=1)
+        areas = np.nan_to_num(areas)
+        areas = np.concatenate([best_areas, areas])
+        indices = np.concatenate([best_indices, np.arange(start, start + len(chunk), dtype=np.int64)])
+        if len(areas) > count:
+            keep = np.argpartition(-areas, count - 1)[:count] if count else []
+            areas, indices = areas[keep], indices[keep]
+        best_areas, best_indices = areas, indices
+        start += len(chunk)
+    return np.sort(best_indices)
@@ -0,0 +1,132 @@
+import numpy as np
+from .glr_format import get_positions, iter_triangle_chunks
+from . import scan_glr
+
+# Version of the index file layout, bumped whenever it changes
+INDEX_VERSION = 1
+
+# The index is stored next to the capture with this suffix
+INDEX_SUFFIX = '.grid.npz'
+
+# Number of triangles aimed for per grid cell, and the most cells along
+# any axis
+TRIS_PER_CELL = 64
+MAX_CELLS_PER_AXIS = 256
+
+# Number of triangle records looked at at once while building the index
+INDEX_CHUNK_SIZE = 1 << 20
+
+
+def get_spatial_index(filepath):
+    # Returns the spatial index of a capture, building it (and caching
+    # it next to the capture) if there's no up to date one yet.
+    #
+    # The index is a uniform grid over the triangle centroids. Each cell
+    # lists its triangles and the bounding box of all of them, so a query
+    # only has to look at the cells whose box overlaps the region.
+    # Positions are in Blender (Z-up) coordinates, like the imported mesh.
+    entry = scan_glr.scan_glr(filepath)
+    if entry['error'] or entry['truncated']:
+        raise RuntimeError(f'{entry["name"]}: {entry["error"] or "truncated capture"}')
+
+    index_path = filepath + INDEX_SUFFIX
+    index = load_spatial_index(index_path, entry)
+    if index is None:
+        index = build_spatial_index(filepath, entry['num_tris'])
+        index['version'] = np.array(INDEX_VERSION)
+        index['source_mtime'] = np.array(entry['mtime'])
+        index['source_size'] = np.array(entry['size'])
+        try:
+            with open(index_path, 'wb') as f:
+                np.savez(f, **index)
+        except OSError as e:
+            print('Could not write spatial index:', e)
+    return index
+
+
+def load_spatial_index(index_path, entry):
+    try:
+        with np.load(index_path) as data:
+            index = dict(data)
+    except (OSError, ValueError):
+        return None
+    if (
+        int(index.get('version', -1)) != INDEX_VERSION or
+        float(index['source_mtime']) != entry['mtime'] or
+        int(index['source_size']) != entry['size']
+    ):
+        return None
+    return index
+
+
+def build_spatial_index(filepath, num_tris):
+    # First pass: bounds of the centroids, to lay out the grid
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    for chunk in iter_triangle_chunks(filepath, num_tris, INDEX_CHUNK_SIZE):
+        centroids = get_positions(chunk).mean(axis=1)
+        lo = np.fmin(lo, np.fmin.reduce(centroids, axis=0))
+        hi = np.fmax(hi, np.fmax.reduce(centroids, axis=0))
+    if not np.isfinite(lo).all():
+        lo = hi = np.zeros(3)
+
+    extent = np.maximum(hi - lo, 1e-6)
+    num_cells = max(1, num_tris // TRIS_PER_CELL)
+    cell_size = (np.prod(extent) / num_cells) ** (1 / 3)
+    dims = np.clip(np.ceil(extent / max(cell_size, 1e-6)), 1, MAX_CELLS_PER_AXIS).astype(np.int64)
+    cell_size = extent / dims
+
+    # Second pass: the cell of every triangle, and the bounds of the
+    # triangles in every cell
+    cells = np.empty(num_tris, dtype=np.int32)
+    cell_min = np.full((np.prod(dims), 3), np.inf, dtype=np.float32)
+    cell_max = np.full((np.prod(dims), 3), -np.inf, dtype=np.float32)
+    start = 0
+    for chunk in iter_triangle_chunks(filepath, num_tris, INDEX_CHUNK_SIZE):
+        positions = get_positions(chunk)
+        chunk_cells = get_cells(np.nan_to_num(positions.mean(axis=1)), lo, cell_size, dims)
+        cells[start:start + len(chunk)] = chunk_cells
+
+        order = np.argsort(chunk_cells, kind='stable')
+        used, starts = np.unique(chunk_cells[order], return_index=True)
+        tri_min = np.fmin.reduceat(np.fmin.reduce(positions, axis=1)[order], starts, axis=0)
+        tri_max = np.fmax.reduceat(np.fmax.reduce(positions, axis=1)[order], starts, axis=0)
+        cell_min[used] = np.fmin(cell_min[used], tri_min)
+        cell_max[used] = np.fmax(cell_max[used], tri_max)
+        start += len(chunk)
+
+    # Triangles sorted by cell, with the offset of each cell's run
+    tri_indices = np.argsort(cells, kind='stable').astype(np.int64)
+    cell_start = np.searchsorted(cells[tri_indices], np.arange(len(cell_min) + 1))
+
+    return {
+        'grid_min': lo,
+        'cell_size': cell_size,
+        'dims': dims,
+        'cell_min': cell_min,
+        'cell_max': cell_max,
+        'cell_start': cell_start,
+        'tri_indices': tri_indices,
+    }
+
+
+def get_cells(points, grid_min, cell_size, dims):
+    ijk = np.floor((points - grid_min) / cell_size).astype(np.int64)
+    ijk = np.clip(ijk, 0, dims - 1)
+    return ((ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]).astype(np.int32)
+
+
+def query_spatial_index(index, box_min, box_max):
+    # Returns the sorted indices of the triangles in every cell whose
+    # bounds overlap the box. This is a superset of the triangles that
+    # overlap it, the exact test is done on the decoded positions.
+    box_min = np.asarray(box_min, dtype=np.float32)
+    box_max = np.asarray(box_max, dtype=np.float32)
+    hit = ~((index['cell_max'] < box_min) | (index['cell_min'] > box_max)).any(axis=1)
+    cells = np.flatnonzero(hit)
+    starts = index['cell_start'][cells]
+    ends = index['cell_start'][cells + 1]
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.int64)
+    indices = np.concatenate([index['tri_indices'][s:e] for s, e in zip(starts, ends)])
+    return np.sort(indices)
@@ -0,0 +1,159 @@
+import io
+import os
+import struct
+import numpy as np
+from .glr_format import (
+    GLR_HEADER_SIZE,
+    GLR_TRIANGLE_DTYPE,
+    get_expected_file_size,
+    get_positions,
+    is_compressed,
+    iter_triangle_chunks,
+    open_glr,
+    read_header,
+)
+
+# Offset of num_tris in the glr header (after the magic, version and
+# ROM name)
+NUM_TRIS_OFFSET = 28
+
+# Number of triangle records copied at once
+SPLIT_CHUNK_SIZE = 1 << 18
+
+
+class GlrWriter:
+    # Writes a version 2 glr file from raw triangle records, with the
+    # header of the capture they came from. num_tris is filled in when
+    # the file is closed.
+
+    def __init__(self, filepath, header):
+        if is_compressed(filepath):
+            raise RuntimeError(f'{os.path.basename(filepath)}: captures can only be written uncompressed')
+        self.filepath = filepath
+        self.num_tris = 0
+        self.f = open(filepath, 'wb')
+        self.f.write(header)
+
+    def write(self, records):
+        # records must be contiguous, slices of a memory map are written
+        # straight from the mapped pages
+        self.f.write(memoryview(records).cast('B'))
+        self.num_tris += len(records)
+
+    def close(self):
+        self.f.seek(NUM_TRIS_OFFSET)
+        self.f.write(struct.pack('<I', self.num_tris))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_capture_header(filepath, out_paths=()):
+    # Returns the raw header bytes and the decoded header of a capture,
+    # after checking it can be split into out_paths
+    name = os.path.basename(filepath)
+    for out_path in out_paths:
+        if os.path.realpath(out_path) == os.path.realpath(filepath):
+            raise RuntimeError(f'{name}: can\'t write a capture over itself')
+
+    with open_glr(filepath, background=False) as fb:
+        data = fb.read(GLR_HEADER_SIZE)
+    header = read_header(io.BytesIO(data))
+    if header['version'] != 2:
+        raise RuntimeError(f'{name}: only version 2 captures can be split')
+
+    # Compressed captures are checked as they're read instead
+    if not is_compressed(filepath):
+        size = os.path.getsize(filepath)
+        expected_size = get_expected_file_size(header['num_tris'])
+        if size < expected_size:
+            raise RuntimeError(
+                f'{name} is truncated ({size} of {expected_size} bytes), '
+                'the capture was probably interrupted')
+    return data, header
+
+
+def get_selection_mask(tris, crcs=None, fields=None, bbox=None):
+    # Returns a mask of the triangles that match all of the given
+    # criteria:
+    #
+    #   crcs         texture 0 CRCs, 0 for untextured triangles (the
+    #                same as the texture filter list)
+    #   fields       {field name: value} of triangle record fields, eg.
+    #                the combiner_mux and other_mode of a material
+    #   bbox         (min, max) box the triangles overlap, in imported
+    #                (Z-up) coordinates
+    mask = np.ones(len(tris), dtype=bool)
+    if crcs is not None:
+        mask &= np.isin(tris['tex0_crc'], np.array(list(crcs), dtype=np.uint64))
+    for name, value in (fields or {}).items():
+        mask &= tris[name] == value
+    if bbox is not None:
+        positions = get_positions(tris)
+        bbox_min, bbox_max = np.array(bbox, dtype=np.float32)
+        mask &= ~(
+            (positions.max(axis=1) < bbox_min) |
+            (positions.min(axis=1) > bbox_max)
+        ).any(axis=1)
+    return mask
+
+
+def write_subset(filepath, out_path, crcs=None, fields=None, bbox=None, index_range=None):
+    # Writes the triangles of a capture matching the criteria (see
+    # get_selection_mask), within the (start, stop) index_range if given,
+    # to a new capture. Records are copied as they are, only the fields
+    # the criteria need are read. Returns the number of triangles written.
+    data, header = read_capture_header(filepath, [out_path])
+    num_tris = header['num_tris']
+    for name in fields or {}:
+        if name not in GLR_TRIANGLE_DTYPE.names or GLR_TRIANGLE_DTYPE[name].shape:
+            raise RuntimeError(f'Unknown triangle field {name}')
+
+    start, stop = 0, num_tris
+    if index_range is not None:
+        start, stop = max(index_range[0], 0), min(index_range[1], num_tris)
+    only_range = crcs is None and not fields and bbox is None
+
+    with GlrWriter(out_path, data) as writer:
+        chunk_start = 0
+        for chunk in iter_triangle_chunks(filepath, num_tris, SPLIT_CHUNK_SIZE):
+            chunk_end = chunk_start + len(chunk)
+            if chunk_start >= stop:
+                break
+            if chunk_end > start:
+                chunk = chunk[max(start - chunk_start, 0):stop - chunk_start]
+                if only_range:
+                    writer.write(chunk)
+                else:
+                    mask = get_selection_mask(chunk, crcs, fields, bbox)
+                    writer.write(chunk[mask])
+            chunk_start = chunk_end
+        return writer.num_tris
+
+
+def split_parts(filepath, out_paths):
+    # Splits a capture into len(out_paths) captures of (nearly) equal
+    # triangle counts, in file order. Returns the triangle counts.
+    data, header = read_capture_header(filepath, out_paths)
+    num_tris = header['num_tris']
+    num_parts = len(out_paths)
+    bounds = [num_tris * i // num_parts for i in range(num_parts + 1)]
+
+    writers = [GlrWriter(path, data) for path in out_paths]
+    try:
+        chunk_start = 0
+        for chunk in iter_triangle_chunks(filepath, num_tris, SPLIT_CHUNK_SIZE):
+            chunk_end = chunk_start + len(chunk)
+            for writer, part_start, part_end in zip(writers, bounds, bounds[1:]):
+                lo, hi = max(part_start, chunk_start), min(part_end, chunk_end)
+                if hi > lo:
+                    writer.write(chunk[lo - chunk_start:hi - chunk_start])
+            chunk_start = chunk_end
+    finally:
+        for writer in writers:
+            writer.close()
+    return [writer.num_tris for writer in writers]
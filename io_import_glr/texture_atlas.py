@@ -0,0 +1,80 @@
+import os
+import hashlib
+import numpy as np
+import bpy
+
+# Pixels of padding around every texture in an atlas. The padding is
+# filled by extending the texture's edge pixels, so filtering near the
+# edge of a texture doesn't bleed in its neighbours.
+ATLAS_PADDING = 2
+
+# Custom property of an atlas material listing the filter list names of
+# the textures on the atlas
+ATLAS_TEXTURES_PROP = 'glr:Atlas Textures'
+
+
+def pack_rects(sizes, atlas_size, padding=ATLAS_PADDING):
+    # Shelf packs (width, height) rects into square pages of atlas_size.
+    # Returns a (page, x, y) placement for every rect, (x, y) being the
+    # lower left corner of the rect itself (inside the padding), or None
+    # for rects too big to go on a page at all.
+
+    placements = [None] * len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+
+    page = 0
+    shelf_x = shelf_y = shelf_height = 0
+    for i in order:
+        w, h = sizes[i]
+        w, h = w + 2 * padding, h + 2 * padding
+        if w > atlas_size or h > atlas_size:
+            continue
+        if shelf_x + w > atlas_size:
+            # Start a new shelf
+            shelf_x, shelf_y, shelf_height = 0, shelf_y + shelf_height, 0
+        if shelf_y + h > atlas_size:
+            # Start a new page
+            page += 1
+            shelf_x = shelf_y = shelf_height = 0
+        placements[i] = (page, shelf_x + padding, shelf_y + padding)
+        shelf_x += w
+        shelf_height = max(shelf_height, h)
+
+    return placements
+
+
+def get_atlas_name(setup, atlas_size, members):
+    # Name of an atlas, from a hash of the material setup it's for and
+    # of the (texture file name, x, y) of every texture on it. Atlases
+    # with the same name have the same contents, so one can be reused
+    # and two different ones never clash.
+    key = repr((setup, atlas_size, sorted(members)))
+    return f'Atlas {hashlib.sha1(key.encode()).hexdigest()[:16]}'
+
+
+def get_image_pixels(image):
+    # Returns the pixels of an image as a (height, width, 4) array, rows
+    # bottom to top like Blender stores them
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+
+def build_atlas_image(name, images, placements, atlas_size, directory, padding=ATLAS_PADDING):
+    # Copies images into a new atlas image at the given (x, y) positions
+    # and saves it as a PNG in directory.
+    atlas = np.zeros((atlas_size, atlas_size, 4), dtype=np.float32)
+    for image, (x, y) in zip(images, placements):
+        pixels = np.pad(get_image_pixels(image), ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+        height, width = pixels.shape[:2]
+        atlas[y - padding:y - padding + height, x - padding:x - padding + width] = pixels
+
+    image = bpy.data.images.new(name, atlas_size, atlas_size, alpha=True)
+    image.pixels.foreach_set(atlas.ravel())
+
+    os.makedirs(directory, exist_ok=True)
+    image.filepath_raw = os.path.join(directory, f'{name}.png')
+    image.file_format = 'PNG'
+    image.save()
+    return image
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import numpy as np
+import bpy
+
+# File next to the textures that caches the content hash of each of them
+HASH_CACHE_NAME = '.glr_texture_hashes.json'
+
+# One index per texture directory, kept for the whole session so the
+# same canonical image is picked by every import
+_indexes = {}
+
+
+def get_image_index(directory):
+    if directory not in _indexes:
+        _indexes[directory] = ImageIndex(directory)
+    return _indexes[directory]
+
+
+class ImageIndex:
+    # Maps texture files to a hash of their decoded pixels, so textures
+    # with different CRCs but identical pixels (common with texture pack
+    # dumps and palette variants) can share one image.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.cache_path = os.path.join(directory, HASH_CACHE_NAME)
+        self.hashes = {}  # filename -> [mtime, size, hash]
+        self.canonical = {}  # hash -> filepath
+        self.dirty = False
+        try:
+            with open(self.cache_path, 'r') as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get_hash(self, filepath):
+        # Returns the content hash of a texture, or None if the file
+        # can't be read
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+
+        filename = os.path.basename(filepath)
+        cached = self.hashes.get(filename)
+        if cached is not None and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+
+        content_hash = hash_image_file(filepath)
+        if content_hash is not None:
+            self.hashes[filename] = [st.st_mtime, st.st_size, content_hash]
+            self.dirty = True
+        return content_hash
+
+    def get_canonical_path(self, filepath):
+        # Returns the path of the first texture seen with the same pixels
+        content_hash = self.get_hash(filepath)
+        if content_hash is None:
+            return filepath
+        return self.canonical.setdefault(content_hash, filepath)
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.hashes, f)
+            self.dirty = False
+        except OSError as e:
+            print('Could not write texture hash cache:', e)
+
+
+def hash_image_file(filepath):
+    # check_existing may hand back an image that was already loaded, only
+    # one this function loaded itself is removed again
+    num_images = len(bpy.data.images)
+    try:
+        image = bpy.data.images.load(filepath, check_existing=True)
+    except Exception:
+        return None
+    loaded = len(bpy.data.images) != num_images
+
+    try:
+        width, height = image.size
+        if width == 0 or height == 0:
+            return None
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+
+        h = hashlib.sha1()
+        h.update(f'{width}x{height}'.encode())
+        h.update(pixels.tobytes())
+        return h.hexdigest()
+    finally:
+        # If it's the canonical one it'll be reloaded from the same path
+        if loaded:
+            bpy.data.images.remove(image)
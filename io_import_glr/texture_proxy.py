@@ -0,0 +1,224 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import bpy
+
+# Folder next to the textures that downscaled proxies are saved in
+PROXY_DIR_NAME = 'proxy'
+
+# Custom properties of a proxied image, holding the paths it can be
+# switched between
+FULL_RESOLUTION_PROP = 'glr:Full Resolution'
+PROXY_PROP = 'glr:Proxy'
+
+# Textures are never downscaled below this size to meet a memory budget
+MIN_PROXY_SIZE = 32
+
+# Number of threads generating proxies
+PROXY_THREADS = os.cpu_count() or 1
+
+# Bytes per pixel of a loaded 8-bit RGBA image
+BYTES_PER_PIXEL = 4
+
+# Proxies used by the current import, original path -> proxy path
+_proxies = {}
+
+# Settings of the current import, see start_proxies
+_max_size = 0
+_budget = 0
+
+# Textures the current import has loaded so far, path -> (width, height),
+# and the size limit they are proxied at
+_sizes = {}
+_limit = 0
+
+
+def get_png_size(filepath):
+    # Reads the (width, height) of a PNG from its header, or None if it
+    # isn't a readable PNG
+    try:
+        with open(filepath, 'rb') as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if len(header) != 24 or header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def get_size_limit(sizes, max_size, budget):
+    # Returns the largest dimension textures may have, so that none is
+    # over max_size and all of them together fit in budget bytes. The
+    # limit is halved from the largest texture until the budget is met,
+    # so the largest textures are downscaled first. 0 means no limit.
+    limit = max_size or max((max(size) for size in sizes), default=0)
+    if budget:
+        while limit > MIN_PROXY_SIZE and get_memory_usage(sizes, limit) > budget:
+            limit = max(limit // 2, MIN_PROXY_SIZE)
+    return limit
+
+
+def get_proxy_size(size, limit):
+    width, height = size
+    if not limit or max(width, height) <= limit:
+        return size
+    scale = limit / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_memory_usage(sizes, limit=0):
+    total = 0
+    for size in sizes:
+        width, height = get_proxy_size(size, limit)
+        total += width * height * BYTES_PER_PIXEL
+    return total
+
+
+def get_proxy_path(filepath, size):
+    directory, filename = os.path.split(filepath)
+    name, ext = os.path.splitext(filename)
+    return os.path.join(directory, PROXY_DIR_NAME, f'{name}_{size[0]}x{size[1]}{ext}')
+
+
+def start_proxies(max_size, budget):
+    # Sets the limits for the textures of a new import, see
+    # get_size_limit. 0 for both turns proxies off.
+    global _max_size, _budget, _limit
+    _proxies.clear()
+    _sizes.clear()
+    _max_size, _budget, _limit = max_size, budget, 0
+
+
+def add_textures(filepaths):
+    # Makes downscaled copies of the textures about to be loaded that
+    # are over the size limit. The limit is worked out again for all the
+    # textures of the import so far, and images already loaded are
+    # switched to their new proxy (or back to full resolution) if theirs
+    # changed. Proxies are cached on disk and only generated when missing
+    # or older than the texture, on a thread pool. The proxies are used
+    # by load_image for the rest of the import.
+    #
+    # imbuf is only in Blender 2.92+, older versions import with full
+    # resolution textures.
+    global _limit
+    if not (_max_size or _budget):
+        return
+    new = [filepath for filepath in dict.fromkeys(filepaths) if filepath not in _sizes]
+    if not new:
+        return
+    try:
+        import imbuf
+    except ImportError:
+        print('Texture proxies need Blender 2.92 or newer')
+        return
+
+    for filepath in new:
+        # Unreadable textures take no memory and are never proxied
+        _sizes[filepath] = get_png_size(filepath) or (0, 0)
+
+    _limit = get_size_limit(list(_sizes.values()), _max_size, _budget)
+    wanted = {}
+    for filepath, size in _sizes.items():
+        proxy_size = get_proxy_size(size, _limit)
+        proxy_path = get_proxy_path(filepath, proxy_size) if proxy_size != size else None
+        if filepath in new or _proxies.get(filepath) != proxy_path:
+            wanted[filepath] = (proxy_path, proxy_size)
+
+    def make_proxy(item):
+        filepath, (proxy_path, proxy_size) = item
+        if proxy_path is None or is_proxy_current(filepath, proxy_path):
+            return True
+        try:
+            image = imbuf.load(filepath)
+            image.resize(proxy_size, method='BILINEAR')
+            os.makedirs(os.path.dirname(proxy_path), exist_ok=True)
+            imbuf.write(image, filepath=proxy_path)
+        except (OSError, ValueError) as e:
+            print('Could not make texture proxy:', e)
+            return False
+        return True
+
+    with ThreadPoolExecutor(PROXY_THREADS) as pool:
+        made = list(pool.map(make_proxy, wanted.items()))
+
+    changed = {}
+    for (filepath, (proxy_path, _)), ok in zip(wanted.items(), made):
+        if not ok:
+            proxy_path = None
+        if _proxies.get(filepath) != proxy_path:
+            changed[filepath] = proxy_path
+        if proxy_path is None:
+            _proxies.pop(filepath, None)
+        else:
+            _proxies[filepath] = proxy_path
+
+    # Only textures added before this call can be loaded already
+    reloaded = {filepath: proxy_path for filepath, proxy_path in changed.items() if filepath not in new}
+    if reloaded:
+        for image in bpy.data.images:
+            filepath = image.get(FULL_RESOLUTION_PROP, image.filepath)
+            if filepath in reloaded:
+                set_image_proxy(image, filepath, reloaded[filepath])
+
+
+def get_proxy_stats():
+    # Returns (number of proxies, texture memory with proxies, texture
+    # memory without) of the current import
+    sizes = list(_sizes.values())
+    return len(_proxies), get_memory_usage(sizes, _limit), get_memory_usage(sizes)
+
+
+def set_image_proxy(image, filepath, proxy_path):
+    # Points a loaded texture at its proxy, or back at the full
+    # resolution file if proxy_path is None
+    if proxy_path is None:
+        for prop in (FULL_RESOLUTION_PROP, PROXY_PROP):
+            if prop in image:
+                del image[prop]
+        new_path = filepath
+    else:
+        image[FULL_RESOLUTION_PROP] = filepath
+        image[PROXY_PROP] = proxy_path
+        new_path = proxy_path
+    if image.filepath != new_path:
+        image.filepath = new_path
+        image.reload()
+
+
+def is_proxy_current(filepath, proxy_path):
+    try:
+        return os.path.getmtime(proxy_path) >= os.path.getmtime(filepath)
+    except OSError:
+        return False
+
+
+def load_proxy_image(filepath):
+    # Loads the proxy of a texture, if the current import made one.
+    # Returns None otherwise.
+    proxy_path = _proxies.get(filepath)
+    if proxy_path is None:
+        return None
+    try:
+        image = bpy.data.images.load(proxy_path, check_existing=True)
+    except Exception:
+        return None
+    # Named like the texture, the texture filter list reads CRCs from
+    # image names
+    image.name = os.path.basename(filepath)
+    image[FULL_RESOLUTION_PROP] = filepath
+    image[PROXY_PROP] = proxy_path
+    return image
+
+
+def get_proxied_images():
+    return [image for image in bpy.data.images if FULL_RESOLUTION_PROP in image and PROXY_PROP in image]
+
+
+def use_proxies(images, enable):
+    # Switches proxied images between their proxy and full resolution
+    # files
+    for image in images:
+        filepath = image[PROXY_PROP] if enable else image[FULL_RESOLUTION_PROP]
+        if image.filepath != filepath:
+            image.filepath = filepath
+            image.reload()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# Differential check of the importer: imports a capture against the mock
+# bpy (see mock_bpy.py) and compares the meshes it builds with a plain
+# per-triangle decode of the same file (see reference_import.py).
+#
+# Positions, the color and UV layers, which faces share a material and
+# the culling counts are compared. With byte_colors set, colors are
+# checked to be within 8-bit rounding of the float colors and the largest
+# error is reported. Mismatches are reported by the index of
+# the triangle in the capture and the exit status is 1, so it can run in
+# CI next to profile_import.py.
+#
+#   python tools/compare_import.py capture.glr
+#   python tools/compare_import.py capture.glr --set filter_mode=False \
+#       --set filter_list=NO_TEXTURE
+#   python tools/compare_import.py --synthetic 100000
+#
+# With sort_triangles set, faces are matched to the capture through their
+# Capture Order attribute.
+#
+# Welding needs a real bmesh, so merge_doubles is always off here. The
+# texture atlas and dedup options rewrite UVs and images, and are off too.
+
+import os
+import sys
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_bpy
+from profile_import import Operator, FileElement, get_default_keywords, parse_option
+from reference_import import decode_reference, get_effective_setup
+
+# Options the comparison can't cover, see above
+FIXED_OPTIONS = {
+    'merge_doubles': False,
+    'use_texture_atlas': False,
+    'dedup_textures': False,
+    'preview': False,
+    'merge_captures': False,
+    'replace_existing': False,
+    'region_mode': 'NONE',
+    'material_library': '',
+}
+
+COLOR_LAYERS = {
+    'Shading': 'shade',
+    'Primitive': 'prim',
+    'Environment': 'env',
+    'Blend': 'blend',
+    'Fog': 'fog',
+}
+
+UV_LAYERS = {
+    'UV0': 'uv0',
+    'UV1': 'uv1',
+}
+
+# Most mismatching triangles listed per check
+MAX_REPORTED = 10
+
+# (shift, values) of the combiner mux fields of the random setups in a
+# synthetic capture: a few color sources, and the constants 0 and 1
+SYNTHETIC_MUX_FIELDS = [
+    (52, [1, 2, 4, 6, 8]), (37, [0, 1, 4, 6, 8]),        # RGB a
+    (28, [1, 2, 4, 8]), (24, [0, 1, 4, 8]),              # RGB b
+    (47, [1, 4, 8, 31]), (32, [0, 1, 7, 31]),            # RGB c
+    (15, [1, 4, 7]), (6, [0, 1, 4, 7]),                  # RGB d
+    (44, [1, 4, 6, 7]), (21, [0, 1, 4, 7]),              # alpha a
+    (12, [1, 4, 7]), (3, [0, 1, 4, 7]),                  # alpha b
+    (41, [1, 4, 7]), (18, [1, 4, 7]),                    # alpha c
+    (9, [1, 4, 7]), (0, [0, 1, 4, 7]),                   # alpha d
+]
+
+
+def write_synthetic_capture(filepath, num_tris, seed=0):
+    # Writes a random capture exercising the decoder: a few textures and
+    # combiner setups, wrap modes, degenerate and non-finite triangles
+    from io_import_glr.glr_format import GLR_TRIANGLE_DTYPE
+
+    rng = np.random.default_rng(seed)
+    tris = np.zeros(num_tris, dtype=GLR_TRIANGLE_DTYPE)
+    verts = tris['verts']
+    verts['position'] = rng.uniform(-1000, 1000, (num_tris, 3, 3))
+    verts['color'] = rng.random((num_tris, 3, 4))
+    verts['uv0'] = rng.uniform(-2, 2, (num_tris, 3, 2))
+    verts['uv1'] = rng.uniform(-2, 2, (num_tris, 3, 2))
+    for name in ('fog_color', 'blend_color', 'env_color', 'prim_color'):
+        tris[name] = rng.random((num_tris, 4))
+
+    crcs = np.array([0, 0x1122334455667788, 0xAABBCCDDEEFF0011, 0x0123456789ABCDEF], dtype=np.uint64)
+    muxes = np.array([0xfc127e24fffff9fc, 0x00ffffff_fffe793c, 0xfc121824ff33ffff, 0x00fffe04ffffffff], dtype=np.uint64)
+    other_modes = np.array([0x0c192078, 0x00552078, 0x0c184240, 0x0c192d58], dtype=np.uint64)
+
+    # Plus combiner and blender setups made of a few inputs, so that many
+    # of them only differ in inputs that cancel out or aren't used
+    random_muxes = np.zeros(32, dtype=np.uint64)
+    for shift, values in SYNTHETIC_MUX_FIELDS:
+        random_muxes |= rng.choice(values, size=len(random_muxes)).astype(np.uint64) << np.uint64(shift)
+    random_other_modes = (
+        (rng.integers(2, size=16).astype(np.uint64) << np.uint64(52)) |  # 1 or 2 cycle
+        (rng.choice([0, 2], size=16).astype(np.uint64) << np.uint64(44)) |  # texture filter
+        (rng.integers(1 << 16, size=16).astype(np.uint64) << np.uint64(16))  # blender
+    )
+    muxes = np.concatenate([muxes, random_muxes])
+    other_modes = np.concatenate([other_modes, random_other_modes])
+
+    tris['combiner_mux'] = muxes[rng.integers(len(muxes), size=num_tris)]
+    tris['other_mode'] = other_modes[rng.integers(len(other_modes), size=num_tris)]
+    # The capture is F3DEX2, which culls on 0x400
+    tris['geometry_mode'] = rng.choice([0, 0x400, 0x2000, 0x2400], size=num_tris)
+    tris['tex0_crc'] = crcs[rng.integers(len(crcs), size=num_tris)]
+    tris['tex1_crc'] = np.where(rng.random(num_tris) < 0.2, crcs[1], 0)
+    for name in ('tex0_wrapS', 'tex0_wrapT', 'tex1_wrapS', 'tex1_wrapT'):
+        tris[name] = rng.integers(3, size=num_tris)
+
+    # Some triangles the culling pass should drop
+    bad = rng.permutation(num_tris)[:num_tris // 50]
+    half = len(bad) // 2
+    verts['position'][bad[:half], 1] = verts['position'][bad[:half], 0]
+    verts['position'][bad[half:], 0, 0] = np.nan
+
+    header = b'GL64R\0' + np.array([2], '<u2').tobytes() + b'SYNTHETIC'.ljust(20, b'\0')
+    header += np.array([num_tris, 2], '<u4').tobytes()
+    with open(filepath, 'wb') as fb:
+        fb.write(header)
+        fb.write(tris.tobytes())
+
+
+def get_color_usage(setup):
+    # How the combiner cycles of an effective setup (see
+    # get_effective_setup) use the shade, primitive and environment
+    # colors, with the same columns as import_glr.get_merged_color_usage
+    usage = []
+    for source in ('Shading', 'Primitive', 'Environment'):
+        used = [False] * 5
+        for color, alpha in setup[0]:
+            if isinstance(color, tuple):
+                used[0] |= f'{source} Color' in color[:3]
+                used[1] |= f'{source} Alpha' in color[:3]
+                color = color[3]
+            if isinstance(alpha, tuple):
+                used[2] |= f'{source} Alpha' in alpha[:3]
+                alpha = alpha[3]
+            used[3] |= color == f'{source} Color'
+            used[4] |= alpha == f'{source} Alpha'
+        usage.append(used)
+    return usage
+
+
+def get_reference_colors(ref, setups):
+    # Light and Overlay colors, worked out one triangle at a time
+    usages = {}
+    light = []
+    overlay = []
+    for i, setup in enumerate(setups):
+        if setup not in usages:
+            usages[setup] = get_color_usage(setup)
+        sources = (ref['shade'][i], ref['prim'][i], ref['env'][i])
+        for corner in range(3):
+            l = [1.0, 1.0, 1.0, 1.0]
+            o = [0.0, 0.0, 0.0, 0.0]
+            for used, colors in zip(usages[setup], sources):
+                r, g, b, a = (float(np.float32(v)) for v in colors[corner])
+                for k, v in enumerate((r, g, b)):
+                    if used[0]:
+                        l[k] *= v
+                    if used[1]:
+                        l[k] *= a
+                    if used[3]:
+                        o[k] += v
+                if used[2]:
+                    l[3] *= a
+                if used[4]:
+                    o[3] += a
+            light.append(l)
+            overlay.append([min(max(v, 0.0), 1.0) for v in o])
+    return light, overlay
+
+
+# Largest error of a color stored in 8 bits, rounded to nearest
+BYTE_COLOR_TOLERANCE = 0.5 / 255 + 1e-6
+
+
+def get_layer_data(layers, name):
+    layer = layers.get(name)
+    return layer.data if layer is not None else None
+
+
+class Comparison:
+    def __init__(self, indices, tolerance):
+        self.indices = indices
+        self.tolerance = tolerance
+        self.failures = []
+
+    def fail(self, message):
+        self.failures.append(message)
+        print('MISMATCH', message)
+
+    def check(self, name, actual, expected, tolerance=None):
+        # Compares two arrays of per-corner (or per-face) values. NaNs
+        # compare equal to NaNs. Returns the largest difference.
+        if tolerance is None:
+            tolerance = self.tolerance
+        if len(self.indices) == 0:
+            return 0.0
+        actual = np.asarray(actual, dtype=np.float64).reshape(len(self.indices), -1)
+        expected = np.asarray(expected, dtype=np.float64).reshape(len(self.indices), -1)
+        with np.errstate(invalid='ignore'):
+            close = np.isclose(actual, expected, rtol=0, atol=tolerance, equal_nan=True)
+            error = np.nanmax(np.abs(actual - expected), initial=0.0)
+        bad = np.flatnonzero(~close.all(axis=1))
+        if len(bad) == 0:
+            return error
+        self.fail(f'{name}: {len(bad)} of {len(self.indices)} triangles differ')
+        for face in bad[:MAX_REPORTED]:
+            print(f'    triangle {self.indices[face]}: {actual[face].tolist()} != {expected[face].tolist()}')
+        return error
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a glr import against a per-triangle reference decode')
+    parser.add_argument('capture', nargs='?', help='.glr file')
+    parser.add_argument('--synthetic', type=int, metavar='NUM_TRIS',
+                        help='compare on a random capture with this many triangles instead')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic capture')
+    parser.add_argument('--set', action='append', default=[], metavar='OPTION=VALUE',
+                        help='override an import option, eg. enable_bf_culling=False')
+    parser.add_argument('--tolerance', type=float, default=0.0,
+                        help='largest difference allowed in positions, colors and UVs')
+    args = parser.parse_args()
+    if (args.capture is None) == (args.synthetic is None):
+        parser.error('give either a capture or --synthetic')
+
+    bpy = mock_bpy.install()
+    import io_import_glr
+    from io_import_glr import import_glr
+    from io_import_glr.glr_format import open_glr
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.synthetic is not None:
+            filepath = os.path.join(temp_dir, 'synthetic.glr')
+            write_synthetic_capture(filepath, args.synthetic, args.seed)
+        else:
+            filepath = os.path.abspath(args.capture)
+
+        keywords = get_default_keywords(io_import_glr.GLR_OT_ImportGLR)
+        keywords.update(parse_option(text) for text in args.set)
+        for name, value in FIXED_OPTIONS.items():
+            if keywords[name] != value and any(text.startswith(f'{name}=') for text in args.set):
+                print(f'Ignoring {name}, it isn\'t covered by the comparison')
+        keywords.update(FIXED_OPTIONS)
+        keywords['filepath'] = filepath
+        keywords['files'] = [FileElement(os.path.basename(filepath))]
+
+        operator = Operator()
+        import_glr.load(operator, bpy.context, **keywords)
+        obs = sorted(
+            (ob for ob in bpy.data.objects if ob.get('glr:Source') == filepath),
+            key=lambda ob: ob.get('glr:Part', 0))
+
+        triangle_options = import_glr.get_triangle_options(keywords, 0)
+        with open_glr(filepath, background=False) as fb:
+            importer = import_glr.GlrImporter(fb, os.path.dirname(filepath), triangle_options)
+            ref = decode_reference(
+                fb, importer.filter_mode, importer.filter_list,
+                importer.cull_degenerate, importer.cull_bbox)
+
+    comparison = Comparison(ref['indices'], args.tolerance)
+    num_faces = sum(len(ob.data.polygons) for ob in obs)
+    print(f'{len(obs)} object(s), {num_faces} faces, reference {len(ref["indices"])} faces')
+    if num_faces != len(ref['indices']):
+        comparison.fail(f'face count {num_faces} != {len(ref["indices"])}')
+        return 1
+
+    culled = {}
+    for ob in obs:
+        for category, count in ob['glr:Culled Triangles'].items():
+            culled[category] = culled.get(category, 0) + count
+    for category, count in ref['culled'].items():
+        if culled.get(category, 0) != count:
+            comparison.fail(f'culled {category}: {culled.get(category, 0)} != {count}')
+
+    # Sorted faces are put back in capture order by their Capture Order
+    # attribute
+    unsort = None
+    if keywords['sort_triangles']:
+        orders = [get_layer_data(ob.data.attributes, import_glr.CAPTURE_ORDER_ATTRIBUTE) for ob in obs]
+        if any(order is None for order in orders):
+            comparison.fail(f'sorted faces have no {import_glr.CAPTURE_ORDER_ATTRIBUTE} attribute')
+            return 1
+        unsort = np.argsort(np.concatenate([np.asarray(order.values['value']) for order in orders]))
+
+    def in_capture_order(values):
+        values = np.asarray(values)
+        if unsort is None or num_faces == 0:
+            return values
+        return values.reshape(num_faces, -1)[unsort].reshape(values.shape)
+
+    def gather(get_layer, attr):
+        parts = []
+        for ob in obs:
+            layer = get_layer(ob.data)
+            if layer is None:
+                comparison.fail(f'{ob.name} has no {attr} layer')
+                return None
+            parts.append(np.asarray(layer.values[attr], dtype=np.float32).ravel())
+        return in_capture_order(np.concatenate(parts))
+
+    positions = gather(lambda mesh: mesh.vertices, 'co')
+    comparison.check('positions', positions, np.array(ref['positions'], dtype=np.float32))
+
+    def check_colors(layer_name, expected):
+        expected = np.array(expected, dtype=np.float32)
+        if not keywords['byte_colors']:
+            colors = gather(lambda mesh: get_layer_data(mesh.vertex_colors, layer_name), 'color')
+            if colors is not None:
+                comparison.check(layer_name, colors, expected)
+            return
+        # Byte colors can only be as close as 8 bits allow, report how
+        # far they are from the float colors
+        colors = gather(lambda mesh: get_layer_data(mesh.color_attributes, layer_name), 'color_srgb')
+        if colors is not None:
+            expected = np.clip(np.nan_to_num(expected), 0, 1)
+            error = comparison.check(layer_name, colors, expected, max(args.tolerance, BYTE_COLOR_TOLERANCE))
+            print(f'{layer_name}: largest byte color error {error:.6f} ({error * 255:.3f} / 255)')
+
+    for layer_name, ref_name in COLOR_LAYERS.items():
+        check_colors(layer_name, ref[ref_name])
+    for layer_name, ref_name in UV_LAYERS.items():
+        uvs = gather(lambda mesh: get_layer_data(mesh.uv_layers, layer_name), 'uv')
+        if uvs is not None:
+            comparison.check(layer_name, uvs, np.array(ref[ref_name], dtype=np.float32))
+
+    # Material of every face. Faces should share a material exactly when
+    # the reference works out the same effective setup for them. The
+    # material keys and the node trees built from them aren't compared.
+    materials = []
+    for ob in obs:
+        slots = [mat.name for mat in ob.data.materials]
+        materials.extend(slots[i] for i in np.asarray(ob.data.polygons.values['material_index']).tolist())
+    materials = in_capture_order(np.array(materials, dtype=object)).tolist()
+    setup_cache = {}
+    setups = []
+    for matinfo in ref['matinfos']:
+        if matinfo not in setup_cache:
+            setup_cache[matinfo] = get_effective_setup(matinfo, ref['microcode'])
+        setups.append(setup_cache[matinfo])
+    material_setups = {}
+    setup_materials = {}
+    bad = []
+    for face, (material, setup) in enumerate(zip(materials, setups)):
+        if material_setups.setdefault(material, setup) != setup or setup_materials.setdefault(setup, material) != material:
+            bad.append(face)
+    if bad:
+        comparison.fail(f'materials: {len(bad)} of {len(materials)} faces grouped differently')
+        for face in bad[:MAX_REPORTED]:
+            material, setup = materials[face], setups[face]
+            if setup_materials[setup] != material:
+                print(f'    triangle {ref["indices"][face]}: {material}, but its setup {setup} is {setup_materials[setup]}')
+            else:
+                print(f'    triangle {ref["indices"][face]}: {material} has setups {setup} and {material_setups[material]}')
+
+    if importer.gen_light_color_attribute or importer.gen_overlay_color_attribute:
+        light, overlay = get_reference_colors(ref, setups)
+        if importer.gen_light_color_attribute:
+            check_colors('Light', light)
+        if importer.gen_overlay_color_attribute:
+            check_colors('Overlay', overlay)
+
+    if comparison.failures:
+        print(f'{len(comparison.failures)} check(s) failed', file=sys.stderr)
+        return 1
+    print('Import matches the reference')
+    print('Not covered: welding (merge_doubles), texture atlases, texture deduplication, material node trees')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
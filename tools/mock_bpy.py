@@ -0,0 +1,752 @@
+# Lightweight stand-ins for the bpy, bmesh, imbuf, mathutils and
+# bpy_extras modules, so the importer can run (and be profiled) outside
+# Blender.
+#
+# Nothing is rendered or stored beyond what the importer reads back. What
+# the mock does do is count: every API call, every datablock, node and
+# link created, and the number of elements passed to foreach_get/set.
+# The counts are in the module level `stats`.
+#
+#   import mock_bpy
+#   mock_bpy.install()
+#   from io_import_glr import import_glr
+#   ...
+#   print(mock_bpy.stats.report())
+
+import os
+import sys
+import json
+import struct
+import types
+import zlib
+from collections import Counter
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()  # API name -> number of calls
+        self.datablocks = Counter()  # datablock type -> number created
+        self.nodes = Counter()  # node bl_idname -> number created
+        self.tree_nodes = Counter()  # node tree name -> nodes created in it
+        self.links = 0
+        self.foreach_elements = Counter()  # 'Type.attr' -> elements passed
+
+    def call(self, name):
+        self.calls[name] += 1
+
+    def report(self):
+        return {
+            'calls': dict(self.calls),
+            'datablocks': dict(self.datablocks),
+            'nodes': dict(self.nodes),
+            'tree_nodes': dict(self.tree_nodes),
+            'links': self.links,
+            'foreach_elements': dict(self.foreach_elements),
+        }
+
+
+stats = Stats()
+
+
+# mathutils
+
+
+class Vector(tuple):
+    def __new__(cls, values=(0.0, 0.0, 0.0)):
+        return super().__new__(cls, (float(v) for v in values))
+
+    def __add__(self, other):
+        return Vector(a + b for a, b in zip(self, other))
+
+    def __sub__(self, other):
+        return Vector(a - b for a, b in zip(self, other))
+
+
+class Matrix:
+    # Only the identity is ever needed, objects are never transformed
+    def inverted(self):
+        return self
+
+    def __matmul__(self, other):
+        return Vector(other)
+
+    def to_scale(self):
+        return Vector((1.0, 1.0, 1.0))
+
+
+# Generic building blocks
+
+
+class Namespace:
+    # Plain object that takes any attribute
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ID:
+    # A datablock: named, counted, and with custom properties
+    type_name = 'ID'
+
+    def __init__(self, name, embedded=False):
+        self.name = name
+        self.users = 0
+        self.use_fake_user = False
+        self._props = {}
+        # Embedded node trees (of materials) aren't datablocks of their own
+        if not embedded:
+            stats.datablocks[self.type_name] += 1
+
+    def __getitem__(self, key):
+        return self._props[key]
+
+    def __setitem__(self, key, value):
+        self._props[key] = value
+
+    def __delitem__(self, key):
+        del self._props[key]
+
+    def __contains__(self, key):
+        return key in self._props
+
+    def get(self, key, default=None):
+        return self._props.get(key, default)
+
+    def keys(self):
+        return self._props.keys()
+
+    def user_remap(self, new_id):
+        stats.call('id.user_remap')
+
+
+class IDCollection:
+    # bpy.data.<collection>
+    def __init__(self, api_name, factory):
+        self.api_name = api_name
+        self.factory = factory
+        self.items = []
+
+    def new(self, name, *args, **kwargs):
+        stats.call(f'data.{self.api_name}.new')
+        item = self.factory(self.unique_name(name), *args, **kwargs)
+        self.items.append(item)
+        return item
+
+    def unique_name(self, name):
+        names = {item.name for item in self.items}
+        if name not in names:
+            return name
+        i = 1
+        while f'{name}.{i:03}' in names:
+            i += 1
+        return f'{name}.{i:03}'
+
+    def remove(self, item):
+        stats.call(f'data.{self.api_name}.remove')
+        self.items.remove(item)
+        # A removed object no longer uses its data
+        if isinstance(item, Object):
+            item.data = None
+
+    def find(self, name):
+        stats.call(f'data.{self.api_name}.find')
+        for i, item in enumerate(self.items):
+            if item.name == name:
+                return i
+        return -1
+
+    def get(self, name, default=None):
+        stats.call(f'data.{self.api_name}.get')
+        for item in self.items:
+            if item.name == name:
+                return item
+        return default
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.items[key]
+        item = self.get(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def __contains__(self, name):
+        return any(item.name == name for item in self.items)
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+
+def count_foreach(kind, owner, attr, seq):
+    stats.call(kind)
+    try:
+        stats.foreach_elements[f'{owner}.{attr}'] += len(seq)
+    except TypeError:
+        stats.foreach_elements[f'{owner}.{attr}'] += 1
+
+
+class ElementCollection:
+    # Mesh vertices/loops/polygons, attribute data
+    def __init__(self, type_name, length=0):
+        self.type_name = type_name
+        self.length = length
+        self.values = {}  # attr -> the last sequence set, for inspection
+
+    def add(self, count):
+        stats.call(f'{self.type_name}.add')
+        self.length += count
+
+    def foreach_set(self, attr, seq):
+        count_foreach('foreach_set', self.type_name, attr, seq)
+        self.values[attr] = seq
+
+    def foreach_get(self, attr, seq):
+        count_foreach('foreach_get', self.type_name, attr, seq)
+
+    def __len__(self):
+        return self.length
+
+
+# Meshes and objects
+
+
+class Layer:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+
+class LayerCollection:
+    # mesh.vertex_colors, mesh.uv_layers, mesh.attributes
+    def __init__(self, mesh, api_name):
+        self.mesh = mesh
+        self.api_name = api_name
+        self.layers = []
+
+    def new(self, name='', type=None, domain=None):
+        stats.call(f'{self.api_name}.new')
+        elements = {'FACE': self.mesh.polygons, 'POINT': self.mesh.vertices}.get(domain, self.mesh.loops)
+        layer = Layer(name, ElementCollection(f'{self.api_name}[{name}]', len(elements)))
+        self.layers.append(layer)
+        return layer
+
+    def get(self, name, default=None):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        return default
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __iter__(self):
+        return iter(self.layers)
+
+    def __len__(self):
+        return len(self.layers)
+
+
+class MeshMaterials(list):
+    def append(self, mat):
+        stats.call('mesh.materials.append')
+        super().append(mat)
+
+
+class Mesh(ID):
+    type_name = 'Mesh'
+
+    def __init__(self, name, embedded=False):
+        super().__init__(name, embedded)
+        self.vertices = ElementCollection('MeshVertices')
+        self.loops = ElementCollection('MeshLoops')
+        self.polygons = ElementCollection('MeshPolygons')
+        self.materials = MeshMaterials()
+        self.vertex_colors = LayerCollection(self, 'vertex_colors')
+        self.color_attributes = LayerCollection(self, 'color_attributes')
+        self.attributes = LayerCollection(self, 'attributes')
+        self.uv_layers = LayerCollection(self, 'uv_layers')
+
+    def clear_geometry(self):
+        stats.call('mesh.clear_geometry')
+        self.__init__(self.name, embedded=True)
+
+    def update(self, calc_edges=False):
+        stats.call('mesh.update')
+
+    def validate(self, **kwargs):
+        stats.call('mesh.validate')
+        return False
+
+
+class Object(ID):
+    type_name = 'Object'
+
+    def __init__(self, name, data):
+        super().__init__(name)
+        self._data = None
+        self.data = data
+        self.location = Vector()
+        self.rotation_euler = Vector()
+        self.scale = Vector((1.0, 1.0, 1.0))
+        self.matrix_world = Matrix()
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        if self._data is not None:
+            self._data.users -= 1
+        self._data = data
+        if data is not None:
+            data.users += 1
+
+    def select_set(self, state):
+        stats.call('object.select_set')
+
+
+# Images
+
+
+class Pixels:
+    def __init__(self, image):
+        self.image = image
+
+    def foreach_get(self, seq):
+        count_foreach('foreach_get', 'Image', 'pixels', seq)
+        seq[:] = 0
+
+    def foreach_set(self, seq):
+        count_foreach('foreach_set', 'Image', 'pixels', seq)
+
+    def __len__(self):
+        width, height = self.image.size
+        return width * height * 4
+
+
+class Image(ID):
+    type_name = 'Image'
+
+    def __init__(self, name, width=0, height=0, alpha=False):
+        super().__init__(name)
+        self.size = (width, height)
+        self.filepath = self.filepath_raw = ''
+        self.source = 'GENERATED'
+        self.file_format = 'PNG'
+        self.pixels = Pixels(self)
+
+    def save(self):
+        stats.call('image.save')
+
+    def reload(self):
+        stats.call('image.reload')
+        if os.path.isfile(self.filepath):
+            self.size = get_png_size(self.filepath)
+
+
+def get_png_size(filepath):
+    # Width and height from the IHDR chunk, without decoding the image
+    with open(filepath, 'rb') as f:
+        header = f.read(24)
+    if header[:8] != b'\x89PNG\r\n\x1a\n':
+        return 0, 0
+    return struct.unpack('>II', header[16:24])
+
+
+class ImageCollection(IDCollection):
+    def load(self, filepath, check_existing=False):
+        stats.call('data.images.load')
+        if check_existing:
+            for image in self.items:
+                if image.filepath == filepath:
+                    return image
+        if not os.path.isfile(filepath):
+            raise RuntimeError(f'Error: Cannot read file "{filepath}"')
+        image = Image(os.path.basename(filepath), *get_png_size(filepath))
+        image.filepath = image.filepath_raw = filepath
+        image.source = 'FILE'
+        self.items.append(image)
+        return image
+
+
+# Materials and node trees
+
+
+class Socket:
+    def __init__(self, node, name, is_output):
+        self.node = node
+        self.name = name
+        self.is_output = is_output
+        self.type = 'RGBA' if 'Color' in name else 'VALUE'
+        self.default_value = 0.0
+
+
+class Sockets:
+    # Node inputs/outputs, made on first access by index or name
+    def __init__(self, node, is_output):
+        self.node = node
+        self.is_output = is_output
+        self.sockets = {}
+
+    def __getitem__(self, key):
+        if key not in self.sockets:
+            name = key if isinstance(key, str) else f'Socket {key}'
+            self.sockets[key] = Socket(self.node, name, self.is_output)
+        return self.sockets[key]
+
+    def new(self, type, name):
+        stats.call('sockets.new')
+        socket = Socket(self.node, name, self.is_output)
+        self.sockets[len(self.sockets)] = socket
+        return socket
+
+
+class Node:
+    def __init__(self, bl_idname):
+        self.bl_idname = bl_idname
+        self.name = self.label = bl_idname
+        self.location = (0, 0)
+        self.width = 140
+        self.inputs = Sockets(self, False)
+        self.outputs = Sockets(self, True)
+        self.node_tree = None
+
+
+class Nodes:
+    def __init__(self, tree):
+        self.tree = tree
+        self.nodes = []
+
+    def new(self, bl_idname):
+        stats.call('nodes.new')
+        stats.nodes[bl_idname] += 1
+        stats.tree_nodes[self.tree.name] += 1
+        node = Node(bl_idname)
+        self.nodes.append(node)
+        return node
+
+    def clear(self):
+        stats.call('nodes.clear')
+        self.nodes.clear()
+        # Links go with their nodes
+        self.tree.links.links.clear()
+
+    def get(self, name, default=None):
+        for node in self.nodes:
+            if node.name == name:
+                return node
+        return default
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class Links:
+    def __init__(self):
+        self.links = []
+
+    def new(self, from_socket, to_socket):
+        stats.call('links.new')
+        stats.links += 1
+        link = Namespace(from_socket=from_socket, to_socket=to_socket)
+        self.links.append(link)
+        return link
+
+    def __iter__(self):
+        return iter(self.links)
+
+    def __len__(self):
+        return len(self.links)
+
+
+class NodeTree(ID):
+    type_name = 'NodeTree'
+
+    def __init__(self, name, type='ShaderNodeTree', embedded=False):
+        super().__init__(name, embedded)
+        self.nodes = Nodes(self)
+        self.links = Links()
+        self.inputs = Sockets(None, False)
+        self.outputs = Sockets(None, True)
+        self.interface = Namespace(new_socket=lambda *args, **kwargs: stats.call('interface.new_socket'))
+
+
+class Material(ID):
+    type_name = 'Material'
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.diffuse_color = (0.8, 0.8, 0.8, 1.0)
+        self.blend_method = 'OPAQUE'
+        self.shadow_method = 'OPAQUE'
+        self.use_backface_culling = False
+        self.node_tree = None
+        self._use_nodes = False
+
+    @property
+    def use_nodes(self):
+        return self._use_nodes
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        self._use_nodes = value
+        if value and self.node_tree is None:
+            self.node_tree = NodeTree(self.name, embedded=True)
+
+
+# Libraries. The mock writes a JSON file holding the names and custom
+# properties of the materials, enough for them to be appended again.
+
+
+class LibraryLoader:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath) as f:
+            self.contents = json.load(f)
+
+    def __enter__(self):
+        self.data_from = Namespace(
+            materials=list(self.contents['materials']),
+            node_groups=list(self.contents['node_groups']),
+        )
+        self.data_to = Namespace(materials=[], node_groups=[])
+        return self.data_from, self.data_to
+
+    def __exit__(self, *exc_info):
+        stats.call('libraries.load')
+        materials = []
+        for name in self.data_to.materials:
+            mat = Material(bpy_data().materials.unique_name(name))
+            mat._props.update(self.contents['materials'][name])
+            bpy_data().materials.items.append(mat)
+            materials.append(mat)
+        self.data_to.materials = materials
+        groups = []
+        for name in self.data_to.node_groups:
+            group = NodeTree(bpy_data().node_groups.unique_name(name))
+            bpy_data().node_groups.items.append(group)
+            groups.append(group)
+        self.data_to.node_groups = groups
+
+
+class Libraries(IDCollection):
+    def load(self, filepath, link=False):
+        if not os.path.isfile(filepath):
+            raise OSError(f'Cannot read file "{filepath}"')
+        return LibraryLoader(filepath)
+
+    def write(self, filepath, datablocks, fake_user=False, path_remap='NONE'):
+        stats.call('libraries.write')
+        contents = {
+            'materials': {mat.name: mat._props for mat in datablocks},
+            'node_groups': [group.name for group in bpy_data().node_groups],
+        }
+        with open(filepath, 'w') as f:
+            json.dump(contents, f)
+
+
+def bpy_data():
+    return sys.modules['bpy'].data
+
+
+# bmesh
+
+
+class BMesh:
+    def __init__(self):
+        self.verts = []
+
+    def from_mesh(self, mesh):
+        stats.call('bmesh.from_mesh')
+
+    def to_mesh(self, mesh):
+        stats.call('bmesh.to_mesh')
+
+    def free(self):
+        stats.call('bmesh.free')
+
+
+def remove_doubles(bm, verts=None, dist=0.0):
+    stats.call('bmesh.ops.remove_doubles')
+
+
+# The modules
+
+
+class Timers:
+    # bpy.app.timers, run by hand with run() instead of by an event loop
+    def __init__(self):
+        self.functions = []
+
+    def register(self, function, first_interval=0.0, persistent=False):
+        stats.call('app.timers.register')
+        self.functions.append(function)
+
+    def unregister(self, function):
+        self.functions.remove(function)
+
+    def is_registered(self, function):
+        return function in self.functions
+
+    def run(self):
+        # Calls the registered functions until they all unregister
+        while self.functions:
+            for function in list(self.functions):
+                if function() is None:
+                    self.functions.remove(function)
+
+
+def make_bpy():
+    bpy = types.ModuleType('bpy')
+
+    bpy.data = Namespace(
+        meshes=IDCollection('meshes', Mesh),
+        objects=IDCollection('objects', Object),
+        materials=IDCollection('materials', Material),
+        images=ImageCollection('images', Image),
+        node_groups=IDCollection('node_groups', NodeTree),
+        texts=IDCollection('texts', ID),
+        libraries=Libraries('libraries', ID),
+    )
+
+    scene_objects = Namespace(link=lambda ob: stats.call('collection.objects.link'))
+    bpy.context = Namespace(
+        scene=Namespace(
+            collection=Namespace(objects=scene_objects),
+            cursor=Namespace(location=Vector()),
+            display_settings=Namespace(display_device='sRGB'),
+            view_settings=Namespace(view_transform='Filmic'),
+            sequencer_colorspace_settings=Namespace(name='sRGB'),
+        ),
+        view_layer=Namespace(objects=Namespace(active=None)),
+        window_manager=Namespace(clipboard=''),
+    )
+
+    def select_all(action='TOGGLE'):
+        stats.call('ops.object.select_all')
+        return {'FINISHED'}
+    select_all.poll = lambda: True
+    bpy.ops = Namespace(object=Namespace(select_all=select_all))
+    bpy.app = Namespace(timers=Timers())
+
+    # Recent Blender versions, where loop_total is read-only
+    loop_total = Namespace(is_readonly=True)
+    mesh_polygon = Namespace(bl_rna=Namespace(properties={'loop_total': loop_total}))
+    # and byte color attributes have color_srgb
+    byte_color = Namespace(bl_rna=Namespace(properties={'color': None, 'color_srgb': None}))
+
+    class Menu:
+        @staticmethod
+        def append(func):
+            pass
+
+        @staticmethod
+        def remove(func):
+            pass
+
+    bpy.types = types.ModuleType('bpy.types')
+    for name in ('Operator', 'Panel', 'PropertyGroup', 'UIList', 'OperatorFileListElement'):
+        setattr(bpy.types, name, type(name, (), {}))
+    bpy.types.MeshPolygon = mesh_polygon
+    bpy.types.ByteColorAttributeValue = byte_color
+    bpy.types.TOPBAR_MT_file_import = Menu
+
+    bpy.props = types.ModuleType('bpy.props')
+    for name in (
+        'StringProperty', 'BoolProperty', 'EnumProperty', 'FloatProperty', 'IntProperty',
+        'BoolVectorProperty', 'FloatVectorProperty', 'CollectionProperty', 'PointerProperty',
+    ):
+        setattr(bpy.props, name, lambda *args, _name=name, **kwargs: (_name, kwargs))
+
+    bpy.path = Namespace(abspath=lambda path: path)
+
+    bpy.utils = Namespace(
+        register_class=lambda cls: None,
+        unregister_class=lambda cls: None,
+    )
+
+    return bpy
+
+
+def make_bmesh():
+    bmesh = types.ModuleType('bmesh')
+    bmesh.new = lambda: stats.call('bmesh.new') or BMesh()
+    bmesh.ops = Namespace(remove_doubles=remove_doubles)
+    bmesh.from_edit_mesh = lambda mesh: BMesh()
+    return bmesh
+
+
+def make_bpy_extras():
+    bpy_extras = types.ModuleType('bpy_extras')
+    bpy_extras.io_utils = types.ModuleType('bpy_extras.io_utils')
+    bpy_extras.io_utils.ImportHelper = type('ImportHelper', (), {})
+    return bpy_extras
+
+
+class ImBuf:
+    def __init__(self, size):
+        self.size = size
+        self.filepath = ''
+
+    def resize(self, size, method='FAST'):
+        stats.call('imbuf.resize')
+        self.size = tuple(size)
+
+
+def write_png_header(filepath, size):
+    # Just the signature and IHDR chunk, enough for get_png_size
+    ihdr = b'IHDR' + struct.pack('>IIBBBBB', *size, 8, 6, 0, 0, 0)
+    with open(filepath, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(struct.pack('>I', 13) + ihdr + struct.pack('>I', zlib.crc32(ihdr)))
+
+
+def make_imbuf():
+    imbuf = types.ModuleType('imbuf')
+
+    def load(filepath):
+        stats.call('imbuf.load')
+        if not os.path.isfile(filepath):
+            raise OSError(f'load: Unable to load image from "{filepath}"')
+        image = ImBuf(get_png_size(filepath))
+        image.filepath = filepath
+        return image
+
+    def write(image, filepath=None):
+        stats.call('imbuf.write')
+        write_png_header(filepath or image.filepath, image.size)
+
+    imbuf.load = load
+    imbuf.write = write
+    return imbuf
+
+
+def install():
+    # Puts the mock modules in sys.modules, replacing any real ones. Call
+    # before importing io_import_glr.
+    bpy = make_bpy()
+    bpy_extras = make_bpy_extras()
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    sys.modules.update({
+        'bpy': bpy,
+        'bpy.types': bpy.types,
+        'bpy.props': bpy.props,
+        'bmesh': make_bmesh(),
+        'imbuf': make_imbuf(),
+        'mathutils': mathutils,
+        'bpy_extras': bpy_extras,
+        'bpy_extras.io_utils': bpy_extras.io_utils,
+    })
+    stats.reset()
+    return bpy
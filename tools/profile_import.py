@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Imports captures against the mock bpy (see mock_bpy.py) and reports
+# what the import would have asked of Blender: datablocks, nodes and
+# links created, API calls, foreach elements and Python-level function
+# calls. Exits with status 1 if any of the given limits is exceeded, so
+# it can guard the hot paths in CI.
+#
+#   python tools/profile_import.py capture.glr
+#   python tools/profile_import.py capture.glr --set merge_doubles=True \
+#       --max-nodes-per-material 20 --max-python-calls-per-tri 0.5
+
+import os
+import sys
+import ast
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_bpy
+
+
+class Operator:
+    # Stands in for the operator load() reports through
+    def __init__(self):
+        self.messages = []
+
+    def report(self, level, message):
+        self.messages.append(message)
+
+
+class FileElement:
+    def __init__(self, name):
+        self.name = name
+
+
+def get_default_keywords(operator_class):
+    # The import options as the operator would pass them with every
+    # property at its default, read from the property declarations
+    fallbacks = {
+        'BoolProperty': False,
+        'IntProperty': 0,
+        'FloatProperty': 0.0,
+        'StringProperty': '',
+        'FloatVectorProperty': (0.0, 0.0, 0.0),
+    }
+    keywords = {}
+    for name, (kind, options) in operator_class.__annotations__.items():
+        if kind == 'CollectionProperty':
+            continue
+        keywords[name] = options.get('default', fallbacks.get(kind))
+    for name in (
+        'filter_glob',
+        'texture_usage', 'texture_usage_index', 'texture_scan_bboxes',
+        'catalogue_sort', 'catalogue_game', 'catalogue_min_tris',
+    ):
+        keywords.pop(name, None)
+    return keywords
+
+
+def parse_option(text):
+    name, _, value = text.partition('=')
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile a glr import against a mock bpy')
+    parser.add_argument('captures', nargs='+', help='.glr files (all in the same directory)')
+    parser.add_argument('--set', action='append', default=[], metavar='OPTION=VALUE',
+                        help='override an import option, eg. merge_doubles=True')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    parser.add_argument('--max-nodes-per-material', type=float)
+    parser.add_argument('--max-links-per-material', type=float)
+    parser.add_argument('--max-calls-per-tri', type=float, help='bpy API calls per triangle')
+    parser.add_argument('--max-python-calls-per-tri', type=float, help='Python function calls per triangle')
+    args = parser.parse_args()
+
+    bpy = mock_bpy.install()
+    import io_import_glr
+    from io_import_glr import import_glr, scan_glr
+
+    keywords = get_default_keywords(io_import_glr.GLR_OT_ImportGLR)
+    keywords.update(parse_option(text) for text in args.set)
+    keywords['filepath'] = os.path.abspath(args.captures[0])
+    keywords['files'] = [FileElement(os.path.basename(path)) for path in args.captures]
+
+    num_tris = sum(scan_glr.scan_glr(os.path.abspath(path))['num_tris'] for path in args.captures)
+
+    python_calls = 0
+
+    def profile(frame, event, arg):
+        nonlocal python_calls
+        if event == 'call':
+            python_calls += 1
+
+    operator = Operator()
+    mock_bpy.stats.reset()
+    start = time.perf_counter()
+    sys.setprofile(profile)
+    try:
+        import_glr.load(operator, bpy.context, **keywords)
+    finally:
+        sys.setprofile(None)
+    elapsed = time.perf_counter() - start
+
+    stats = mock_bpy.stats
+    num_materials = stats.datablocks['Material']
+    material_nodes = sum(
+        count for tree, count in stats.tree_nodes.items()
+        if tree in bpy.data.materials
+    )
+    material_links = sum(
+        len(mat.node_tree.links) for mat in bpy.data.materials
+        if mat.node_tree is not None
+    )
+    per_tri = max(num_tris, 1)
+    summary = {
+        'triangles': num_tris,
+        'seconds': round(elapsed, 3),
+        'materials': num_materials,
+        'nodes_per_material': material_nodes / num_materials if num_materials else 0.0,
+        'links_per_material': material_links / num_materials if num_materials else 0.0,
+        'calls_per_tri': sum(stats.calls.values()) / per_tri,
+        'python_calls_per_tri': python_calls / per_tri,
+    }
+
+    # Work left running after the import, eg. building deferred
+    # materials, isn't counted in the stats above
+    if bpy.app.timers.functions:
+        start = time.perf_counter()
+        bpy.app.timers.run()
+        summary['timer_seconds'] = round(time.perf_counter() - start, 3)
+
+    if args.json:
+        print(json.dumps({'summary': summary, **stats.report(), 'messages': operator.messages}, indent=2))
+    else:
+        for message in operator.messages:
+            print(message)
+        for key, value in summary.items():
+            print(f'{key:24} {value:.3f}' if isinstance(value, float) else f'{key:24} {value}')
+        print()
+        print('Datablocks:', ', '.join(f'{name} {count}' for name, count in sorted(stats.datablocks.items())))
+        print('Nodes:', ', '.join(f'{name} {count}' for name, count in stats.nodes.most_common()))
+        print('Calls:', ', '.join(f'{name} {count}' for name, count in stats.calls.most_common()))
+
+    limits = {
+        'nodes_per_material': args.max_nodes_per_material,
+        'links_per_material': args.max_links_per_material,
+        'calls_per_tri': args.max_calls_per_tri,
+        'python_calls_per_tri': args.max_python_calls_per_tri,
+    }
+    failed = False
+    for key, limit in limits.items():
+        if limit is not None and summary[key] > limit:
+            print(f'{key} is {summary[key]:.3f}, over the limit of {limit}', file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# Per-triangle reference decoder, following the importer's original
+# struct.unpack loop. It's slow, but simple enough to check by eye, and
+# compare_import.py checks the optimized path in io_import_glr against it.
+#
+# Filtering and culling follow the importer's current rules: NO_TEXTURE in
+# the filter list matches triangles without a texture, and the culling
+# test is the one described in cull_triangles, done with Python floats.
+
+import math
+import struct
+
+VERTEX_FORMAT = '<11f'
+VERTEX_SIZE = struct.calcsize(VERTEX_FORMAT)  # 44
+TRIANGLE_FORMAT = '<4f4f4f4f2f2f2iQQIQ4BQ4B'
+TRIANGLE_SIZE = struct.calcsize(TRIANGLE_FORMAT)  # 132
+
+# Same as DEGENERATE_TOLERANCE in import_glr
+DEGENERATE_TOLERANCE = 1e-6
+
+
+def to_float32(value):
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def decode_reference(fb, filter_mode, filter_list, cull_degenerate, cull_bbox=None):
+    # Decodes the triangles of an open capture (positioned after the
+    # header) one at a time. Returns a dict of per-triangle lists:
+    #
+    #   indices     index of the triangle in the file
+    #   positions   3 (x, y, z) corners, Z-up
+    #   shade, prim, env, blend, fog
+    #               3 (r, g, b, a) corner colors
+    #   uv0, uv1    3 (u, v) corner UVs
+    #   matinfos    the material key, as in MATINFO_FIELDS
+    #
+    # plus 'culled', the number of triangles culled per reason.
+    (version,) = struct.unpack('<H', fb.read(8)[6:])
+    fb.read(20)
+    num_tris, microcode = struct.unpack('<II', fb.read(8))
+
+    if cull_bbox is not None:
+        cull_bbox = [[to_float32(v) for v in corner] for corner in cull_bbox]
+
+    result = {
+        'indices': [],
+        'positions': [],
+        'shade': [], 'prim': [], 'env': [], 'blend': [], 'fog': [],
+        'uv0': [], 'uv1': [],
+        'matinfos': [],
+        'culled': {'non-finite': 0, 'degenerate': 0, 'outside bounds': 0},
+        'microcode': microcode,
+    }
+
+    for i in range(num_tris):
+        positions = []
+        shade = []
+        uv0 = []
+        uv1 = []
+        for j in range(3):
+            (
+                x, y, z, r, g, b, a, s0, t0, s1, t1,
+            ) = struct.unpack(VERTEX_FORMAT, fb.read(VERTEX_SIZE))
+            positions.append((x, -z, y))  # Yup2Zup
+            shade.append((r, g, b, a))
+            uv0.append((s0, t0))
+            uv1.append((s1, t1))
+
+        (
+            fog_r, fog_g, fog_b, fog_a,
+            blend_r, blend_g, blend_b, blend_a,
+            env_r, env_g, env_b, env_a,
+            prim_r, prim_g, prim_b, prim_a,
+            prim_l, prim_m,
+            fog_multiplier, fog_offset,
+            k4, k5,
+            combiner_mux,
+            other_mode,
+            geometry_mode,
+            tex0_crc,
+            tex0_maskS, tex0_maskT,
+            tex0_wrapS, tex0_wrapT,
+            tex1_crc,
+            tex1_maskS, tex1_maskT,
+            tex1_wrapS, tex1_wrapT,
+        ) = struct.unpack(TRIANGLE_FORMAT, fb.read(TRIANGLE_SIZE))
+
+        tex0_name = f'{tex0_crc:016X}' if tex0_crc != 0 else 'NO_TEXTURE'
+        listed = tex0_name in filter_list
+        if filter_mode: # Blacklist mode
+            if listed:
+                continue
+        else: # Whitelist mode
+            if not listed:
+                continue
+
+        reason = get_cull_reason(positions, cull_degenerate, cull_bbox)
+        if reason is not None:
+            result['culled'][reason] += 1
+            continue
+
+        result['indices'].append(i)
+        result['positions'].append(positions)
+        result['shade'].append(shade)
+        result['prim'].append([(prim_r, prim_g, prim_b, prim_a)] * 3)
+        result['env'].append([(env_r, env_g, env_b, env_a)] * 3)
+        result['blend'].append([(blend_r, blend_g, blend_b, blend_a)] * 3)
+        result['fog'].append([(fog_r, fog_g, fog_b, fog_a)] * 3)
+        result['uv0'].append(uv0)
+        result['uv1'].append(uv1)
+        result['matinfos'].append((
+            combiner_mux,
+            other_mode,
+            geometry_mode,
+            tex0_crc,
+            tex0_wrapS, tex0_wrapT,
+            tex1_crc,
+            tex1_wrapS, tex1_wrapT,
+        ))
+
+    return result
+
+
+def get_cull_reason(positions, cull_degenerate, bbox):
+    # The degenerate test and the box are separate options, either one
+    # can be used without the other
+    if cull_degenerate:
+        if not all(math.isfinite(v) for corner in positions for v in corner):
+            return 'non-finite'
+
+        p0, p1, p2 = positions
+        e1 = [p1[k] - p0[k] for k in range(3)]
+        e2 = [p2[k] - p0[k] for k in range(3)]
+        cross = (
+            e1[1] * e2[2] - e1[2] * e2[1],
+            e1[2] * e2[0] - e1[0] * e2[2],
+            e1[0] * e2[1] - e1[1] * e2[0],
+        )
+        area_sq = sum(c * c for c in cross)
+        scale_sq = sum(c * c for c in e1) * sum(c * c for c in e2)
+        if not area_sq > scale_sq * DEGENERATE_TOLERANCE**2:
+            return 'degenerate'
+
+    if bbox is not None:
+        for k in range(3):
+            values = [p[k] for p in positions]
+            # A NaN coordinate is never outside the box
+            if any(math.isnan(v) for v in values):
+                continue
+            if max(values) < bbox[0][k] or min(values) > bbox[1][k]:
+                return 'outside bounds'
+
+    return None
+
+
+# Color combiner inputs, by the value of each mux field. Values past the
+# end of a list select the constant 0. From the RDP combiner diagrams,
+# http://n64devkit.square7.ch/tutorial/graphics/4/image07.gif and
+# http://n64devkit.square7.ch/tutorial/graphics/5/image13.gif
+SOURCES = ('Combined', 'Texel 0', 'Texel 1', 'Primitive', 'Shading', 'Environment')
+RGB_INPUTS = {
+    'a': [f'{s} Color' for s in SOURCES] + ['1', 'Noise'],
+    'b': [f'{s} Color' for s in SOURCES] + ['Key Center', 'Convert K4'],
+    'c': [f'{s} Color' for s in SOURCES] + ['Key Scale'] + [f'{s} Alpha' for s in SOURCES] +
+         ['LOD Fraction', 'Primitive LOD Fraction', 'Convert K5'],
+    'd': [f'{s} Color' for s in SOURCES] + ['1', '0'],
+}
+ALPHA_INPUTS = {
+    'a': [f'{s} Alpha' for s in SOURCES] + ['1', '0'],
+    'b': [f'{s} Alpha' for s in SOURCES] + ['1', '0'],
+    'c': ['LOD Fraction'] + [f'{s} Alpha' for s in SOURCES[1:]] + ['Primitive LOD Fraction', '0'],
+    'd': [f'{s} Alpha' for s in SOURCES] + ['1', '0'],
+}
+
+# (shift, width) of the a, b, c, d mux fields of the RGB and alpha
+# formulas, for each cycle
+MUX_FIELDS = [
+    (((52, 4), (28, 4), (47, 5), (15, 3)), ((44, 3), (12, 3), (41, 3), (9, 3))),
+    (((37, 4), (24, 4), (32, 5), (6, 3)), ((21, 3), (3, 3), (18, 3), (0, 3))),
+]
+
+# Microcodes of the F3DEX2 family, which moved the backface culling bit
+F3DEX2_MICROCODES = (2, 5, 7, 13, 17, 18, 21)
+
+
+def get_formula(mux, fields, inputs):
+    # The formula (a - b) * c + d of one cycle as its (a, b, c, d)
+    # inputs, or just d when a - b or c is always 0
+    a, b, c, d = (
+        inputs[slot][value] if value < len(inputs[slot]) else '0'
+        for slot, value in zip('abcd', ((mux >> shift) & ((1 << width) - 1) for shift, width in fields))
+    )
+    if a == b or c == '0':
+        return d
+    return (a, b, c, d)
+
+
+def get_formula_inputs(formula):
+    return set(formula) if isinstance(formula, tuple) else {formula}
+
+
+def get_effective_setup(matinfo, microcode):
+    # What a material key draws, worked out from the RDP registers
+    # without the importer's decoder. The importer should give two
+    # triangles the same material exactly when their setups are equal.
+    #
+    # The setup is
+    #
+    #   (cycles, blends, texture 0, texture 1, culls backfaces)
+    #
+    # where cycles are the (color, alpha) formulas of the combiner cycles
+    # that affect the output, formulas whose output isn't used are '0',
+    # and a texture is (crc, wrapS, wrapT, filter) if the combiner
+    # samples it and None otherwise.
+    (
+        mux, other_mode, geometry_mode,
+        tex0_crc, tex0_wrapS, tex0_wrapT,
+        tex1_crc, tex1_wrapS, tex1_wrapT,
+    ) = matinfo
+
+    two_cycle = (other_mode >> 52) & 3 == 1
+
+    # The P and M blender inputs of the last cycle, 1 is the framebuffer
+    p, m = (other_mode >> 28) & 3, (other_mode >> 20) & 3
+    if not two_cycle:
+        p, m = (other_mode >> 30) & 3, (other_mode >> 22) & 3
+    blends = p == 1 or m == 1
+
+    # Working back from the last cycle, a formula only matters if the
+    # next cycle (or the output) reads it. The output alpha is only read
+    # when blending.
+    need_color, need_alpha = True, blends
+    cycles = []
+    for rgb_fields, alpha_fields in reversed(MUX_FIELDS[:2 if two_cycle else 1]):
+        color = get_formula(mux, rgb_fields, RGB_INPUTS) if need_color else '0'
+        alpha = get_formula(mux, alpha_fields, ALPHA_INPUTS) if need_alpha else '0'
+        if cycles == [] and two_cycle and color == 'Combined Color' and alpha in ('Combined Alpha', '0'):
+            # A second cycle passing the first one through is left out
+            continue
+        cycles.insert(0, (color, alpha))
+        inputs = get_formula_inputs(color) | get_formula_inputs(alpha)
+        need_color = 'Combined Color' in inputs
+        need_alpha = 'Combined Alpha' in inputs
+
+    inputs = set()
+    for color, alpha in cycles:
+        inputs |= get_formula_inputs(color) | get_formula_inputs(alpha)
+    filter = 'Closest' if (other_mode >> 44) & 3 == 0 else 'Linear'
+    textures = []
+    for i, (crc, wrapS, wrapT) in enumerate(((tex0_crc, tex0_wrapS, tex0_wrapT), (tex1_crc, tex1_wrapS, tex1_wrapT))):
+        if f'Texel {i} Color' in inputs or f'Texel {i} Alpha' in inputs:
+            textures.append((crc, min(wrapS, 2), min(wrapT, 2), filter))
+        else:
+            textures.append(None)
+
+    cull_mask = 0x400 if microcode in F3DEX2_MICROCODES else 0x2000
+    culls = bool(geometry_mode & cull_mask)
+
+    return (tuple(cycles), blends, *textures, culls)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Writes new captures from part of a capture, eg. to share the triangles
+# showing a problem, or to import a huge capture in parallel. Records are
+# copied as they are, through a memory map for uncompressed captures.
+#
+#   python tools/split_glr.py capture.glr -o subset.glr --textures 0123456789ABCDEF,NO_TEXTURE
+#   python tools/split_glr.py capture.glr -o subset.glr --range 1000:5000
+#   python tools/split_glr.py capture.glr -o subset.glr --bbox -100 -100 0 100 100 50
+#   python tools/split_glr.py capture.glr -o subset.glr --field combiner_mux=0xfc127e24fffff9fc
+#   python tools/split_glr.py capture.glr --parts 8
+#
+# Criteria can be combined, a triangle is written if it matches all of
+# them. --parts writes <capture>_part<N>.glr files next to the capture
+# (or in the -o directory).
+
+import os
+import sys
+import time
+import types
+import argparse
+
+# io_import_glr's __init__ needs Blender, set up the package without it.
+# The modules used here only need NumPy.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+package = types.ModuleType('io_import_glr')
+package.__path__ = [os.path.join(sys.path[0], 'io_import_glr')]
+sys.modules['io_import_glr'] = package
+
+from io_import_glr.glr_format import get_capture_name
+from io_import_glr.split_glr import split_parts, write_subset
+
+
+def parse_textures(text):
+    crcs = []
+    for name in text.split(','):
+        if name == 'NO_TEXTURE':
+            crcs.append(0)
+        else:
+            try:
+                crcs.append(int(name, 16))
+            except ValueError:
+                raise argparse.ArgumentTypeError(f'invalid texture {name}')
+    return crcs
+
+
+def parse_range(text):
+    start, sep, stop = text.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected START:STOP')
+    return int(start or 0), int(stop) if stop else 2**32
+
+
+def parse_field(text):
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected NAME=VALUE')
+    return name, int(value, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write captures from part of a glr capture')
+    parser.add_argument('capture', help='.glr file (can be compressed)')
+    parser.add_argument('-o', '--output', help='capture to write, or directory for --parts')
+    parser.add_argument('--parts', type=int, help='split into this many captures of equal size')
+    parser.add_argument('--textures', type=parse_textures, metavar='CRC,...',
+                        help='texture 0 CRCs, as in the texture filter list')
+    parser.add_argument('--field', type=parse_field, action='append', default=[], metavar='NAME=VALUE',
+                        help='value of a triangle record field, eg. combiner_mux, other_mode, geometry_mode')
+    parser.add_argument('--bbox', type=float, nargs=6, metavar=('MIN_X', 'MIN_Y', 'MIN_Z', 'MAX_X', 'MAX_Y', 'MAX_Z'),
+                        help='box the triangles overlap, in imported (Z-up) coordinates')
+    parser.add_argument('--range', type=parse_range, metavar='START:STOP', help='triangle index range')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.parts is not None:
+            if args.parts < 1:
+                parser.error('--parts must be at least 1')
+            if args.textures or args.field or args.bbox or args.range:
+                parser.error('--parts can\'t be combined with selection criteria')
+            out_dir = args.output or os.path.dirname(os.path.abspath(args.capture))
+            name = get_capture_name(args.capture)
+            out_paths = [os.path.join(out_dir, f'{name}_part{i}.glr') for i in range(args.parts)]
+            counts = split_parts(args.capture, out_paths)
+            for path, count in zip(out_paths, counts):
+                print(f'{path}: {count} triangles')
+        else:
+            if args.output is None:
+                parser.error('-o is required unless splitting with --parts')
+            bbox = (args.bbox[:3], args.bbox[3:]) if args.bbox else None
+            count = write_subset(
+                args.capture, args.output,
+                crcs=args.textures,
+                fields=dict(args.field),
+                bbox=bbox,
+                index_range=args.range,
+            )
+            print(f'{args.output}: {count} triangles')
+    except (RuntimeError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f'{time.perf_counter() - start:.2f} s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())